@@ -0,0 +1,10 @@
+import pytest
+
+from trackit.celery import app
+
+
+@pytest.fixture(autouse=True, scope="session")
+def celery_eager():
+    """Задачи Celery в тестах выполняются сразу, без брокера и воркера."""
+    # конфиг читается из настроек Django с префиксом CELERY_
+    app.conf.CELERY_TASK_ALWAYS_EAGER = True
@@ -0,0 +1,48 @@
+"""Конфигурация gunicorn: ``gunicorn -c gunicorn.conf.py trackit.asgi:application``.
+
+Тот же конфиг читает ``python manage.py serve``.
+
+По умолчанию воркеры uvicorn (ASGI): чтения задач, шаблонов и тегов идут
+корутинами и не держат воркер, пока база отвечает, поэтому воркеров — по
+одному на ядро. Для синхронных воркеров (``GUNICORN_WORKER_CLASS=sync`` и
+``trackit.wsgi:application``) — классические ``2 * ядра + 1``.
+
+Каждый ASGI-воркер пускает в Django не больше ``ASGI_MAX_CONCURRENCY``
+запросов одновременно, у каждого из них своё соединение с Postgres:
+``воркеры * ASGI_MAX_CONCURRENCY`` должно помещаться в ``max_connections``.
+
+Приложение загружается в мастере до fork (``preload_app``), и воркеры
+делят уже импортированный код. Мастер прогревает URL-резолвер, проверяет
+базу и Redis и закрывает свои соединения, каждый воркер открывает свои
+до того, как начнёт принимать запросы. После ``max_requests`` запросов
+(с разбросом, чтобы воркеры не перезапускались разом) воркер заменяется.
+По SIGTERM воркеры дорабатывают текущие запросы до ``graceful_timeout``.
+"""
+
+import os
+
+from trackit.server import ASYNC_WORKER_CLASS, close_connections, default_workers, warm_up
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", ASYNC_WORKER_CLASS)
+workers = int(os.getenv("GUNICORN_WORKERS", default_workers(worker_class)))
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+preload_app = True
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = max_requests // 10
+keepalive = 5
+timeout = 30
+graceful_timeout = 30
+accesslog = "-"
+
+
+def when_ready(server):
+    server.log.info("Warmup (master): %s", warm_up())
+    close_connections()
+
+
+def post_worker_init(worker):
+    # под ASGI и в потоковых воркерах у каждого запроса своё соединение
+    # с базой, соединение главного потока воркера никому не пригодится
+    steps = ("db", "cache") if worker.cfg.worker_class_str == "sync" else ("cache",)
+    worker.log.info("Warmup (worker %s): %s", worker.pid, warm_up(steps))
@@ -1,7 +1,12 @@
+from collections import defaultdict
+
 from django.contrib import admin
-from django.db.models import Count
+from django.db import transaction
+from django.utils import timezone
 
 from tasks.models import Tags, TaskItem, Tasks, TemplateTaskItem, TemplateTasks
+from tasks.services import (copy_template_items, create_templates_from_tasks,
+                            record_item_changes, tasks_cache, touch_tasks)
 
 
 # Register your models here.
@@ -25,7 +30,7 @@ class TaskAdmin(admin.ModelAdmin):
     list_display_links = ["name"]
     readonly_fields = ["created_at", "updated_at", "item_count"]
     search_fields = ["id", "name", "description"]
-    exclude = ["user"]
+    exclude = ["user", *Tasks.COUNTER_FIELDS]
     inlines = [TaskItemInline]
     actions = ["create_template_from_task"]
 
@@ -39,10 +44,6 @@ class TaskAdmin(admin.ModelAdmin):
             ]
         return fields
 
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        return qs.annotate(item_count=Count("items"))
-
     def save_model(self, request, obj, form, change):
         cleaned_data = form.cleaned_data
         template = cleaned_data.get("template")
@@ -53,52 +54,17 @@ class TaskAdmin(admin.ModelAdmin):
                 obj.description = template.description
                 obj.save()
 
-                for item in template.items.all():
-                    task_item = TaskItem()
-                    task_item.name = item.name
-                    task_item.description = item.description
-                    task_item.planned_date = item.planned_date
-                    task_item.task = obj
-                    task_item.save()
-                    tag_names = item.tags.values_list("name", flat=True)
-
-                    tag_objs = []
-
-                    for tag_name in tag_names:
-                        tag_obj, _ = Tags.objects.get_or_create(
-                            name=tag_name, user=obj.user
-                        )
-                        tag_objs.append(tag_obj)
-
-                    task_item.tags.set(tag_objs)
+                copy_template_items(template, [obj])
 
         return super().save_model(request, obj, form, change)
 
-    @admin.display(description="Количество подзадач", ordering="item_count")
+    @admin.display(description="Количество подзадач", ordering="items_count")
     def item_count(self, obj):
-        return obj.item_count()
+        return obj.items_count
 
     @admin.action(description="Создать шаблон из выбранных задач")
     def create_template_from_task(self, request, queryset):
-        for task in queryset:
-            template = TemplateTasks.objects.create(
-                name=task.name, description=task.description, created_by=task.user
-            )
-            for item in task.items.all():
-                task_item = TemplateTaskItem.objects.create(
-                    name=item.name,
-                    description=item.description,
-                    planned_date=item.planned_date,
-                    task=template,
-                )
-
-                tag_objs = []
-                for tag_name in item.tags.values_list("name", flat=True):
-                    tag_obj, _ = Tags.objects.get_or_create(
-                        name=tag_name, user=task.user
-                    )
-                    tag_objs.append(tag_obj)
-                task_item.tags.set(tag_objs)
+        create_templates_from_tasks(queryset)
 
 
 @admin.register(TaskItem)
@@ -116,14 +82,35 @@ class TaskItemAdmin(admin.ModelAdmin):
             fields = [f for f in fields if f != "task"]
         return fields
 
+    @staticmethod
+    @transaction.atomic
+    def set_status(queryset, status):
+        """``update()`` не шлёт сигналов: задачи, счётчики, сводку и кэш обновляем сами."""
+        rows = list(queryset.values_list("task__user_id", "task_id", "status", "planned_date"))
+        updated = queryset.update(status=status, updated_at=timezone.now())
+        touch_tasks(Tasks.objects.filter(pk__in={task_id for _, task_id, _, _ in rows}))
+
+        by_user = defaultdict(list)
+        for user_id, *bucket in rows:
+            by_user[user_id].append(bucket)
+        for user_id, buckets in by_user.items():
+            record_item_changes(
+                TaskItem,
+                removed=buckets,
+                added=[(task_id, status, planned_date) for task_id, _, planned_date in buckets],
+                user_id=user_id,
+            )
+        tasks_cache.invalidate_on_commit(*by_user)
+        return updated
+
     @admin.action(description="Пометить как завершённые")
     def mark_as_completed(self, request, queryset):
-        updated = queryset.update(status=TaskItem.StatusChoices.COMPLETED)
+        updated = self.set_status(queryset, TaskItem.StatusChoices.COMPLETED)
         self.message_user(request, f"{updated} задач(и) помечены как завершённые.")
 
     @admin.action(description="Пометить как в процессе")
     def mark_as_in_process(self, request, queryset):
-        updated = queryset.update(status=TaskItem.StatusChoices.IN_PROCESS)
+        updated = self.set_status(queryset, TaskItem.StatusChoices.IN_PROCESS)
         self.message_user(request, f"{updated} задач(и) помечены как в процессе.")
 
 
@@ -133,15 +120,11 @@ class TemplateTasksAdmin(admin.ModelAdmin):
     list_filter = ["created_by__username"]
     list_display_links = ["name"]
     inlines = [TaskItemTemplateInline]
-    exclude = ["created_by"]
-
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        return qs.annotate(item_count=Count("items"))
+    exclude = ["created_by", *TemplateTasks.COUNTER_FIELDS]
 
-    @admin.display(description="Количество подзадач", ordering="item_count")
+    @admin.display(description="Количество подзадач", ordering="items_count")
     def item_count(self, obj):
-        return obj.item_count()
+        return obj.items_count
 
 
 @admin.register(Tags)
@@ -1,18 +1,157 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
 
+import django_filters
+from django.conf import settings
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+from django.db.models import Exists, F, FloatField, OuterRef, Q, TextField, Value
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
 from rest_framework import filters
+from rest_framework.settings import api_settings
 
+from tasks.models import AbstractTaskItem, Tags, TaskItem, Tasks
+from tasks.services import items_search_text
+
+
+class TagNamesFilter(django_filters.BaseInFilter, django_filters.CharFilter):
+    """Список имён тегов через запятую: ``?tags_all=работа,срочно``."""
+
+
+def tag_ids_condition(owner, lookup, names) -> Q:
+    """Условие на ``tag_ids`` подзадачи по именам тегов владельца.
+
+    ``lookup`` — ``contains`` (все теги) или ``overlap`` (хотя бы один).
+    Имена переводятся в id одним запросом, дальше работает GIN-индекс.
+    """
+    names = set(names)
+    tag_ids = sorted(Tags.objects.filter(user=owner, name__in=names).values_list("pk", flat=True))
+    if not tag_ids or (lookup == "contains" and len(tag_ids) < len(names)):
+        # неизвестный тег: под условие не подходит ни одна подзадача
+        return Q(pk__in=[])
+    return Q(**{f"tag_ids__{lookup}": tag_ids})
+
+
+def filter_items_by_tags(items, params, owner):
+    """Применяет ``?tags_all=``/``?tags_any=`` к подзадачам задачи или шаблона."""
+    for param, lookup in TaskFilter.TAG_LOOKUPS.items():
+        names = [name.strip() for name in params.get(param, "").split(",") if name.strip()]
+        if names:
+            items = items.filter(tag_ids_condition(owner, lookup, names))
+    return items
+
+
+class TaskFilter(django_filters.FilterSet):
+    """Фильтры списка задач по их подзадачам.
+
+    Условия на подзадачи собираются в один коррелированный ``EXISTS``:
+    задача попадает в выборку, если у неё есть подзадача, подходящая под
+    все условия сразу. В отличие от JOIN по ``items`` строки задач не
+    размножаются, так что ``DISTINCT`` не нужен и пагинация идёт по индексу.
+    ``?date=planned|today|not sorted`` — прежний фильтр по плановой дате.
+    ``?tags_all=``/``?tags_any=`` ищут по ``tag_ids`` подзадачи.
+    """
+
+    DATE_ALIASES = ("planned", "today", "not sorted")
+    TAG_LOOKUPS = {"tags_all": "contains", "tags_any": "overlap"}
+
+    item_status = django_filters.ChoiceFilter(
+        choices=AbstractTaskItem.StatusChoices.choices, method="filter_items"
+    )
+    item_tag = django_filters.CharFilter(method="filter_items")
+    tags_all = TagNamesFilter(method="filter_items")
+    tags_any = TagNamesFilter(method="filter_items")
+    planned_from = django_filters.DateFilter(method="filter_items")
+    planned_to = django_filters.DateFilter(method="filter_items")
+    overdue = django_filters.BooleanFilter(method="filter_overdue")
+    date = django_filters.ChoiceFilter(
+        choices=[(alias, alias) for alias in DATE_ALIASES], method="filter_items"
+    )
+
+    class Meta:
+        model = Tasks
+        fields = []
+
+    def filter_queryset(self, queryset):
+        self.item_conditions = []
+        queryset = super().filter_queryset(queryset)
+        if self.item_conditions:
+            queryset = queryset.filter(self.has_items(*self.item_conditions))
+        return queryset
+
+    def filter_items(self, queryset, name, value):
+        # условие откладывается, EXISTS строит filter_queryset
+        self.item_conditions.append(self.item_condition(name, value))
+        return queryset
+
+    def filter_overdue(self, queryset, name, value):
+        if value:
+            return self.filter_items(queryset, name, value)
+        return queryset.filter(~self.has_items(self.item_condition(name, True)))
+
+    def item_condition(self, name, value) -> Q:
+        today = timezone.localdate()
+        if name in self.TAG_LOOKUPS:
+            return tag_ids_condition(self.request.user, self.TAG_LOOKUPS[name], value)
+        if name == "item_status":
+            return Q(status=value)
+        if name == "item_tag":
+            return Q(tags__name=value)
+        if name == "planned_from":
+            return Q(planned_date__gte=value)
+        if name == "planned_to":
+            return Q(planned_date__lte=value)
+        if name == "overdue":
+            return Q(status=AbstractTaskItem.StatusChoices.IN_PROCESS, planned_date__lt=today)
+        if value == "planned":
+            return Q(planned_date__gt=today + timedelta(days=1))
+        if value == "today":
+            return Q(planned_date=today)
+        return Q(planned_date=None)
+
+    @staticmethod
+    def has_items(*conditions) -> Exists:
+        return Exists(TaskItem.objects.filter(*conditions, task=OuterRef("pk")))
+
+
+class TaskSearchFilter(filters.BaseFilterBackend):
+    """Полнотекстовый поиск ``?search=`` по ``Tasks.search_vector``.
+
+    Запрос разбирается как в поисковиках (``"фраза"``, ``or``, ``-слово``)
+    и ищется по GIN-индексу. Найденные задачи получают ``search_rank`` и
+    ``search_headline`` — фрагменты текста с подсвеченными совпадениями —
+    и без ``?ordering=`` сортируются по рангу.
+    """
+
+    search_param = api_settings.SEARCH_PARAM
 
-class DateFilterBackend(filters.BaseFilterBackend):
     def filter_queryset(self, request, queryset, view):
-        param_filter = request.query_params.get("date")
-        tomorrow = (datetime.today() + timedelta(days=1)).date()
-        today = datetime.today().date()
-
-        if param_filter == "planned":
-            return queryset.filter(planned_date__gt=tomorrow)
-        elif param_filter == "today":
-            return queryset.filter(planned_date=today)
-        elif param_filter == "not sorted":
-            return queryset.filter(planned_date=None)
+        terms = request.query_params.get(self.search_param, "").replace("\x00", "").strip()
+        if not terms:
+            return queryset
+
+        config = settings.SEARCH_CONFIG
+        query = SearchQuery(terms, search_type="websearch", config=config)
+        queryset = queryset.filter(search_vector=query).annotate(
+            # ts_rank возвращает real: курсор пагинации сравнивает точные double
+            search_rank=Cast(SearchRank(F("search_vector"), query), FloatField()),
+            search_headline=SearchHeadline(
+                Concat(
+                    "name",
+                    Value("\n"),
+                    "description",
+                    Value("\n"),
+                    items_search_text(),
+                    output_field=TextField(),
+                ),
+                query,
+                config=config,
+                start_sel="<mark>",
+                stop_sel="</mark>",
+                max_fragments=3,
+                fragment_delimiter=" … ",
+            ),
+        )
+        # явную сортировку уже применил OrderingFilter
+        if not queryset.query.order_by:
+            queryset = queryset.order_by("-search_rank")
         return queryset
@@ -0,0 +1,132 @@
+import asyncio
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from tasks.models import Tasks, TemplateTasks
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагружает read-эндпоинты запущенного сервера заданным числом "
+        "одновременных соединений и печатает пропускную способность и задержки"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000")
+        parser.add_argument("--user", required=True, help="username, от чьего имени читать")
+        parser.add_argument("--connections", type=int, default=200)
+        parser.add_argument("--duration", type=float, default=20, help="секунды")
+        parser.add_argument(
+            "--path",
+            action="append",
+            dest="paths",
+            help="Путь для чтения, можно несколько. По умолчанию — списки и карточки "
+            "задач и шаблонов и теги пользователя",
+        )
+
+    def handle(self, *args, url, user, connections, duration, paths, **options):
+        owner = get_user_model().objects.filter(username=user).first()
+        if owner is None:
+            raise CommandError(f"Нет пользователя {user}")
+
+        target = urlsplit(url)
+        self.host, self.port = target.hostname, target.port or 80
+        self.token = str(AccessToken.for_user(owner))
+        self.paths = paths or self.default_paths(owner)
+
+        latencies, errors = asyncio.run(self.run(connections, duration))
+        if not latencies:
+            raise CommandError(f"Ни одного успешного ответа, ошибки: {dict(errors)}")
+
+        latencies.sort()
+        self.stdout.write(
+            f"соединений: {connections}, {duration:.0f} с, путей: {len(self.paths)}\n"
+            f"ответов 200: {len(latencies)} ({len(latencies) / duration:.1f} rps), "
+            f"ошибки: {dict(errors) or 0}\n"
+            + ", ".join(
+                f"p{pct} {latencies[min(len(latencies) - 1, len(latencies) * pct // 100)]:.1f} ms"
+                for pct in (50, 95, 99)
+            )
+            + f", max {latencies[-1]:.1f} ms"
+        )
+
+    @staticmethod
+    def default_paths(owner) -> list:
+        paths = ["/api/v1/tasks/", "/api/v1/template/", "/api/v1/tasks/tags/"]
+        task = Tasks.objects.filter(user=owner).order_by("id").first()
+        if task:
+            paths.append(f"/api/v1/tasks/{task.id}/")
+        template = TemplateTasks.objects.order_by("id").first()
+        if template:
+            paths.append(f"/api/v1/template/{template.id}/")
+        return paths
+
+    async def run(self, connections, duration):
+        latencies, errors = [], Counter()
+        deadline = time.monotonic() + duration
+        await asyncio.gather(
+            *(self.client(index, deadline, latencies, errors) for index in range(connections))
+        )
+        return latencies, errors
+
+    async def client(self, index, deadline, latencies, errors):
+        """Одно соединение: запросы подряд, с переподключением после ``Connection: close``."""
+        streams = None
+        request_number = index
+        while time.monotonic() < deadline:
+            path = self.paths[request_number % len(self.paths)]
+            request_number += 1
+            started = time.perf_counter()
+            try:
+                if streams is None:
+                    streams = await asyncio.open_connection(self.host, self.port)
+                status, keep_alive = await self.get(*streams, path)
+            except (OSError, asyncio.IncompleteReadError, ValueError) as exc:
+                errors[type(exc).__name__] += 1
+                streams = await self.close(streams)
+                await asyncio.sleep(0.05)
+                continue
+
+            if status == 200:
+                latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                errors[status] += 1
+            if not keep_alive:
+                streams = await self.close(streams)
+        await self.close(streams)
+
+    async def get(self, reader, writer, path):
+        writer.write(
+            (
+                f"GET {path} HTTP/1.1\r\n"
+                f"Host: {self.host}:{self.port}\r\n"
+                f"Authorization: Bearer {self.token}\r\n"
+                "Accept: application/json\r\n"
+                "\r\n"
+            ).encode()
+        )
+        await writer.drain()
+
+        head = await reader.readuntil(b"\r\n\r\n")
+        status_line, *header_lines = head.decode("latin-1").split("\r\n")
+        headers = dict(
+            line.lower().split(": ", 1) for line in header_lines if ": " in line
+        )
+        keep_alive = headers.get("connection") != "close"
+        if "content-length" in headers:
+            await reader.readexactly(int(headers["content-length"]))
+        else:
+            await reader.read()
+            keep_alive = False
+        return int(status_line.split()[1]), keep_alive
+
+    @staticmethod
+    async def close(streams):
+        if streams is not None:
+            streams[1].close()
+        return None
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+from redis import Redis
+
+PREFIX = "bench:template_tasks"
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает инвалидацию кэша шаблона через SCAN по шаблону ключей "
+        "и через INCR поколения при большом числе чужих ключей в Redis"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="redis://redis:6379/15", help="Отдельная база Redis")
+        parser.add_argument("--keys", type=int, default=1_000_000)
+        parser.add_argument("--pages", type=int, default=20)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, url, keys, pages, repeat, **options):
+        redis = Redis.from_url(url)
+        self.fill(redis, f"{PREFIX}:noise", keys)
+
+        scan, incr = [], []
+        for _ in range(repeat):
+            self.fill(redis, f"{PREFIX}:1:page", pages)
+
+            started = time.perf_counter()
+            for key in redis.scan_iter(f"{PREFIX}:1:page:*"):
+                redis.delete(key)
+            scan.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            redis.incr(f"{PREFIX}:1:version")
+            incr.append(time.perf_counter() - started)
+
+        for key in redis.scan_iter(f"{PREFIX}:*", count=10_000):
+            redis.unlink(key)
+
+        self.stdout.write(f"ключей в базе: {keys}, страниц шаблона: {pages}")
+        for name, timings in (("SCAN + DEL", scan), ("INCR", incr)):
+            self.stdout.write(
+                f"{name:>10}: median {sorted(timings)[len(timings) // 2] * 1000:.3f} ms, "
+                f"max {max(timings) * 1000:.3f} ms"
+            )
+
+    @staticmethod
+    def fill(redis, prefix, count, batch=10_000):
+        for start in range(0, count, batch):
+            with redis.pipeline(transaction=False) as pipe:
+                for i in range(start, min(start + batch, count)):
+                    pipe.set(f"{prefix}:{i}", 1, ex=3600)
+                pipe.execute()
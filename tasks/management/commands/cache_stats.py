@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from tasks.services import VersionedCache
+
+
+class Command(BaseCommand):
+    help = "Попадания и промахи кэшей ответов"
+
+    def handle(self, *args, **options):
+        for versioned in VersionedCache.instances.values():
+            stats = versioned.stats()
+            total = stats["hit"] + stats["miss"]
+            ratio = stats["hit"] / total if total else 0
+            self.stdout.write(
+                f"{versioned.prefix}: hit {stats['hit']}, miss {stats['miss']}, ratio {ratio:.1%}"
+            )
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from tasks.models import AbstractTaskItem, Tasks, TemplateTasks
+
+COMPLETED = AbstractTaskItem.StatusChoices.COMPLETED
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверяет items_count и completed_count задач и шаблонов с подзадачами "
+        "и исправляет расхождения"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check", action="store_true", help="Только найти расхождения, ничего не меняя"
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, check, batch_size, **options):
+        drifted = 0
+        for task_model in (Tasks, TemplateTasks):
+            found = self.sync(task_model, batch_size, fix=not check)
+            drifted += found
+            action = "найдено" if check else "исправлено"
+            self.stdout.write(f"{task_model._meta.verbose_name_plural}: {action} {found}")
+
+        if check and drifted:
+            raise CommandError(f"Счётчики расходятся у {drifted} задач")
+
+    def sync(self, task_model, batch_size, fix) -> int:
+        items_model = task_model._meta.get_field("items").related_model
+        found, last_id = 0, 0
+        ids = task_model.objects.order_by("pk").values_list("pk", flat=True)
+        while batch := list(ids.filter(pk__gt=last_id)[:batch_size]):
+            drifted = list(
+                task_model.objects.filter(pk__gt=last_id, pk__lte=batch[-1])
+                .annotate(
+                    actual_items=Count("items"),
+                    actual_completed=Count("items", filter=Q(items__status=COMPLETED)),
+                )
+                .exclude(items_count=F("actual_items"), completed_count=F("actual_completed"))
+                .values_list("pk", flat=True)
+            )
+            last_id = batch[-1]
+            found += len(drifted)
+            if fix and drifted:
+                # пересчёт в самом UPDATE: строка задачи заблокирована, параллельные
+                # сдвиги F-выражениями лягут поверх верного значения
+                task_model.objects.filter(pk__in=drifted).update(
+                    items_count=self.count(items_model),
+                    completed_count=self.count(items_model, Q(status=COMPLETED)),
+                )
+        return found
+
+    @staticmethod
+    def count(items_model, condition=Q()):
+        return Coalesce(
+            Subquery(
+                items_model.objects.filter(condition, task=OuterRef("pk"))
+                .order_by()
+                .values("task")
+                .annotate(count=Count("pk"))
+                .values("count")
+            ),
+            0,
+        )
@@ -0,0 +1,66 @@
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.profiling import (get_capture, list_captures, make_token, prune_captures, render_dot,
+                             render_stats, render_svg)
+
+
+class Command(BaseCommand):
+    help = "Профили запросов, снятые ProfileCaptureMiddleware"
+
+    def add_arguments(self, parser):
+        actions = parser.add_subparsers(dest="action", required=True)
+        actions.add_parser("token", help="Выдать токен для заголовка X-Profile")
+        actions.add_parser("list", help="Список сохранённых профилей")
+
+        prune = actions.add_parser("prune", help="Удалить старые профили")
+        prune.add_argument(
+            "--keep", type=int, help="Сколько оставить, по умолчанию PROFILING_CAPTURE_KEEP"
+        )
+
+        show = actions.add_parser("show", help="Показать профиль")
+        show.add_argument("name")
+        show.add_argument("--format", choices=("stats", "dot", "svg"), default="stats")
+        show.add_argument("--limit", type=int, default=30)
+        show.add_argument("-o", "--output", help="Файл для результата")
+
+    def handle(self, *args, action, **options):
+        if action == "token":
+            self.stdout.write(make_token())
+        elif action == "list":
+            for path in list_captures():
+                self.stdout.write(f"{path.name}\t{path.stat().st_size}")
+        elif action == "prune":
+            keep = options["keep"]
+            removed = prune_captures(settings.PROFILING_CAPTURE_KEEP if keep is None else keep)
+            self.stdout.write(f"Удалено профилей: {len(removed)}")
+        else:
+            self.show(**options)
+
+    def show(self, name, format, limit, output, **options):
+        try:
+            path = get_capture(name)
+        except FileNotFoundError:
+            raise CommandError(f"Профиль {name} не найден")
+
+        try:
+            if format == "stats":
+                result = render_stats(path, limit)
+            elif format == "dot":
+                result = render_dot(path)
+            else:
+                result = render_svg(path)
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise CommandError(f"Не удалось построить граф: {e}")
+
+        if output:
+            mode = "wb" if isinstance(result, bytes) else "w"
+            with open(output, mode) as file:
+                file.write(result)
+        elif isinstance(result, bytes):
+            sys.stdout.buffer.write(result)
+        else:
+            self.stdout.write(result)
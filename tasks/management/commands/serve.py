@@ -0,0 +1,65 @@
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+from gunicorn.app.base import Application
+
+CONFIG = Path(settings.BASE_DIR) / "gunicorn.conf.py"
+TARGETS = {
+    "asgi": ("trackit.asgi.application", None),
+    "wsgi": ("trackit.wsgi.application", "sync"),
+}
+
+
+class Server(Application):
+    """gunicorn внутри процесса manage.py: конфиг из ``gunicorn.conf.py`` и опции команды."""
+
+    def __init__(self, target, options):
+        self.target = target
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        self.load_config_from_file(str(CONFIG))
+        for name, value in self.options.items():
+            self.cfg.set(name, value)
+
+    def load(self):
+        return import_string(self.target)
+
+
+class Command(BaseCommand):
+    help = (
+        "Запускает продакшен-сервер gunicorn: uvicorn-воркеры для ASGI или "
+        "синхронные для WSGI, с предзагрузкой приложения и прогревом"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interface", choices=TARGETS, default="asgi")
+        parser.add_argument(
+            "--workers", type=int, help="По умолчанию из GUNICORN_WORKERS или числа ядер"
+        )
+        parser.add_argument("--bind", help="По умолчанию из GUNICORN_BIND или 0.0.0.0:8000")
+        parser.add_argument("--max-requests", type=int, help="Запросов до перезапуска воркера")
+
+    def handle(self, *args, interface, workers, bind, max_requests, **options):
+        target, worker_class = TARGETS[interface]
+        if worker_class:
+            # конфиг считает число воркеров по их классу
+            os.environ["GUNICORN_WORKER_CLASS"] = worker_class
+        Server(target, self.server_options(workers, bind, max_requests)).run()
+
+    @staticmethod
+    def server_options(workers, bind, max_requests) -> dict:
+        """Опции, заданные явно, поверх ``gunicorn.conf.py``."""
+        options = {}
+        if workers:
+            options["workers"] = workers
+        if bind:
+            options["bind"] = bind
+        if max_requests:
+            options["max_requests"] = max_requests
+            options["max_requests_jitter"] = max_requests // 10
+        return options
@@ -0,0 +1,373 @@
+import atexit
+import cProfile
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+from redis.exceptions import RedisError
+
+from tasks.profiling import check_token, enable_profiler, save_capture
+
+logger = logging.getLogger("trackit.query_budget")
+profiling_logger = logging.getLogger("trackit.profiling")
+
+VIOLATIONS_KEY = "query_budget:violations:{view}"
+# savepoint'ы и EXPLAIN от silk не относятся к работе view
+SERVICE_STATEMENTS = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT", "EXPLAIN")
+
+
+def fingerprint(sql: str) -> str:
+    """SQL без литералов: одинаковые по форме запросы дают один отпечаток."""
+    sql = re.sub(r"'(?:[^']|'')*'", "%s", sql)
+    sql = re.sub(r"\b\d+\b", "%s", sql)
+    sql = re.sub(r"\((?:\s*%s\s*,)+\s*%s\s*\)", "(...)", sql)
+    sql = re.sub(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+", "(...)", sql)
+    return sql
+
+
+@asynccontextmanager
+async def async_execute_wrapper(wrapper):
+    """``connection.execute_wrapper`` для async-цепочки middleware.
+
+    ``connection`` свой у каждого потока, а async ORM и ``sync_to_async``
+    ходят в базу из потока запроса, поэтому обёртка ставится там.
+    """
+    await sync_to_async(lambda: connection.execute_wrappers.append(wrapper))()
+    try:
+        yield
+    finally:
+        await sync_to_async(lambda: connection.execute_wrappers.remove(wrapper))()
+
+
+def get_query_budget(view_func, request):
+    """Возвращает ``(имя view, бюджет)`` из ``query_budget`` класса view.
+
+    Ключ бюджета — action для ViewSet'ов и HTTP-метод для остальных view.
+    """
+    view_class = getattr(view_func, "cls", None)
+    budgets = getattr(view_class, "query_budget", None)
+    if not budgets:
+        return None
+
+    method = request.method.lower()
+    actions = getattr(view_func, "actions", None)
+    action = actions.get(method, method) if actions else method
+    if action not in budgets:
+        return None
+    return f"{view_class.__name__}.{action}", budgets[action]
+
+
+class QueryBudgetMiddleware:
+    """Считает SQL-запросы каждого запроса и сверяет их с бюджетом view.
+
+    Считается всё, что выполняется внутри view, включая аутентификацию.
+    Превышения пишутся в лог вместе с самыми частыми отпечатками запросов и
+    считаются в кэше по ключу ``query_budget:violations:<view>``.
+    """
+
+    sync_capable = True
+    async_capable = True
+    top_fingerprints = 5
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, "QUERY_BUDGET_ENABLED", True)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        request.query_budget = None
+        queries = []
+        with connection.execute_wrapper(self.recorder(queries)):
+            response = self.get_response(request)
+        if self.exceeded(request, queries):
+            self.report(*request.query_budget, queries)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        request.query_budget = None
+        queries = []
+        async with async_execute_wrapper(self.recorder(queries)):
+            response = await self.get_response(request)
+        if self.exceeded(request, queries):
+            await sync_to_async(self.report)(*request.query_budget, queries)
+        return response
+
+    @staticmethod
+    def recorder(queries):
+        def record(execute, sql, params, many, context):
+            if not sql.startswith(SERVICE_STATEMENTS):
+                queries.append(sql)
+            return execute(sql, params, many, context)
+
+        return record
+
+    @staticmethod
+    def exceeded(request, queries) -> bool:
+        return request.query_budget is not None and len(queries) > request.query_budget[1]
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.enabled:
+            request.query_budget = get_query_budget(view_func, request)
+
+    def report(self, view, budget, queries):
+        fingerprints = Counter(fingerprint(sql) for sql in queries)
+        logger.warning(
+            "Query budget exceeded: %s made %d queries (budget %d)\n%s",
+            view,
+            len(queries),
+            budget,
+            "\n".join(
+                f"{count}x {sql}"
+                for sql, count in fingerprints.most_common(self.top_fingerprints)
+            ),
+        )
+
+        key = VIOLATIONS_KEY.format(view=view)
+        try:
+            cache.add(key, 0, timeout=None)
+            cache.incr(key)
+        except (RedisError, ValueError):
+            pass
+
+
+class ProfileBuffer:
+    """Ограниченный буфер профилей запросов в памяти процесса.
+
+    Записи уходят в Celery пачками по ``batch_size`` или раз в
+    ``flush_interval`` секунд. При переполнении теряются самые старые записи.
+    """
+
+    def __init__(self, maxlen, batch_size, flush_interval):
+        self.records = deque(maxlen=maxlen)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+    def add(self, record: dict) -> None:
+        with self.lock:
+            if len(self.records) == self.records.maxlen:
+                self.dropped += 1
+            self.records.append(record)
+
+            due = time.monotonic() - self.last_flush >= self.flush_interval
+            if len(self.records) < self.batch_size and not due:
+                return
+            batch = self._take(self.batch_size)
+
+        self.send(batch)
+
+    def flush(self) -> None:
+        with self.lock:
+            batches = []
+            while self.records:
+                batches.append(self._take(self.batch_size))
+        for batch in batches:
+            self.send(batch)
+
+    def send(self, batch) -> None:
+        from tasks.tasks import flush_profiles
+
+        try:
+            flush_profiles.delay(batch)
+        except OperationalError:
+            profiling_logger.warning("Broker unavailable, %d profiles dropped", len(batch))
+
+    def _take(self, count) -> list:
+        self.last_flush = time.monotonic()
+        return [self.records.popleft() for _ in range(min(count, len(self.records)))]
+
+
+class SampledProfilingMiddleware:
+    """Профилирует часть запросов и складывает их в таблицы silk через Celery.
+
+    Профилируется доля ``PROFILING_SAMPLE_RATE`` запросов и все запросы
+    дольше ``PROFILING_SLOW_REQUEST_MS``. Запрос к базе при этом не делается:
+    профиль попадает в :class:`ProfileBuffer`, а записывает его воркер.
+    При ``PROFILING_ENABLED = False`` Django исключает middleware из цепочки.
+    """
+
+    sync_capable = True
+    async_capable = True
+    ignore_prefixes = ("/silk/", "/admin/", "/static/")
+    max_queries = 200
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PROFILING_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.slow_request_ms = settings.PROFILING_SLOW_REQUEST_MS
+        self.buffer = ProfileBuffer(
+            settings.PROFILING_BUFFER_SIZE,
+            settings.PROFILING_BATCH_SIZE,
+            settings.PROFILING_FLUSH_INTERVAL,
+        )
+        # воркер gunicorn перезапускается после max_requests, накопленное
+        # отправляется при выходе процесса
+        atexit.register(self.buffer.flush)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if request.path.startswith(self.ignore_prefixes):
+            return self.get_response(request)
+
+        queries = []
+        start_time = timezone.now()
+        started = time.perf_counter()
+        with connection.execute_wrapper(self.recorder(queries)):
+            response = self.get_response(request)
+        record = self.make_record(request, response, queries, start_time, started)
+        if record:
+            self.buffer.add(record)
+        return response
+
+    async def __acall__(self, request):
+        if request.path.startswith(self.ignore_prefixes):
+            return await self.get_response(request)
+
+        queries = []
+        start_time = timezone.now()
+        started = time.perf_counter()
+        async with async_execute_wrapper(self.recorder(queries)):
+            response = await self.get_response(request)
+        record = self.make_record(request, response, queries, start_time, started)
+        if record:
+            # сброс буфера отправляет пачку в брокер
+            await sync_to_async(self.buffer.add)(record)
+        return response
+
+    def recorder(self, queries):
+        def record(execute, sql, params, many, context):
+            start_time = timezone.now()
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                if len(queries) < self.max_queries:
+                    queries.append(
+                        {
+                            "query": sql,
+                            "start_time": start_time.isoformat(),
+                            "time_taken": (time.perf_counter() - started) * 1000,
+                        }
+                    )
+
+        return record
+
+    def make_record(self, request, response, queries, start_time, started):
+        """Профиль запроса, если он попал в выборку или оказался медленным."""
+        time_taken = (time.perf_counter() - started) * 1000
+        sampled = random.random() < self.sample_rate
+        if not sampled and time_taken < self.slow_request_ms:
+            return None
+
+        match = request.resolver_match
+        return {
+            "id": str(uuid.uuid4()),
+            "path": request.path,
+            "method": request.method,
+            "query_params": request.META.get("QUERY_STRING", ""),
+            "view_name": match.view_name if match else "",
+            "start_time": start_time.isoformat(),
+            "time_taken": time_taken,
+            "status_code": response.status_code,
+            "queries": queries,
+        }
+
+
+class ProfileCaptureMiddleware:
+    """Профилирует отдельный запрос через cProfile по подписанному токену.
+
+    Токен (``manage.py profiles token``) передаётся в заголовке ``X-Profile``
+    или параметре ``?_profile=``. Имя сохранённого файла возвращается в
+    заголовке ``X-Profile-Capture``, смотреть его — ``manage.py profiles show``.
+    Под ASGI синхронные части запроса (``sync_to_async``, async ORM) идут
+    в отдельном потоке запроса, его профиль сохраняется вместе с профилем
+    event loop.
+    """
+
+    sync_capable = True
+    async_capable = True
+    header = "HTTP_X_PROFILE"
+    query_param = "_profile"
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PROFILING_CAPTURE_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.requested(request):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        if not enable_profiler(profiler):
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+
+        response["X-Profile-Capture"] = save_capture(request, profiler)
+        return response
+
+    async def __acall__(self, request):
+        if not self.requested(request):
+            return await self.get_response(request)
+
+        profiler = cProfile.Profile()
+        if not enable_profiler(profiler):
+            # профилируется другой запрос
+            return await self.get_response(request)
+        # sync_to_async запроса выполняются в одном потоке (ThreadSensitiveContext),
+        # на Python 3.12+ его и так видит профилировщик event loop
+        profilers = [profiler]
+        thread_profiler = cProfile.Profile()
+        if await sync_to_async(enable_profiler)(thread_profiler):
+            profilers.append(thread_profiler)
+        try:
+            response = await self.get_response(request)
+        finally:
+            if len(profilers) > 1:
+                await sync_to_async(thread_profiler.disable)()
+            profiler.disable()
+
+        response["X-Profile-Capture"] = await sync_to_async(save_capture)(request, *profilers)
+        return response
+
+    def requested(self, request) -> bool:
+        token = request.META.get(self.header) or request.GET.get(self.query_param)
+        return bool(token) and check_token(token)
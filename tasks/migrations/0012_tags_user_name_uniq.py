@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-18 06:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0011_alter_tags_options_alter_taskitem_options_and_more"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="tags",
+            name="name",
+            field=models.CharField(max_length=24),
+        ),
+        migrations.AddConstraint(
+            model_name="tags",
+            constraint=models.UniqueConstraint(
+                fields=("user", "name"), include=("id",), name="tags_user_name_uniq"
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-18 06:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0012_tags_user_name_uniq"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="tasks",
+            index=models.Index(
+                fields=["user", "updated_at", "id"], name="tasks_user_updated_id_idx"
+            ),
+        ),
+    ]
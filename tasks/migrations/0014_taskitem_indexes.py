@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-18 06:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0013_tasks_user_updated_id_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="taskitem",
+            index=models.Index(
+                fields=["task", "status"], name="taskitem_task_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="taskitem",
+            index=models.Index(
+                fields=["planned_date"], name="taskitem_planned_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="taskitem",
+            index=models.Index(
+                condition=models.Q(("status", "process")),
+                fields=["planned_date"],
+                name="taskitem_process_planned_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.2.3 on 2026-10-18 07:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0014_taskitem_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeletionLog",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "model",
+                    models.CharField(
+                        choices=[
+                            ("task", "Task"),
+                            ("item", "Task item"),
+                            ("tag", "Tag"),
+                        ],
+                        max_length=4,
+                        verbose_name="Model",
+                    ),
+                ),
+                ("object_id", models.BigIntegerField(verbose_name="Object id")),
+                (
+                    "deleted_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Time_delete"),
+                ),
+            ],
+            options={
+                "verbose_name": "Удалённый объект",
+                "verbose_name_plural": "Удалённые объекты",
+            },
+        ),
+        migrations.AddField(
+            model_name="tags",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Time_update"),
+        ),
+        migrations.AddField(
+            model_name="taskitem",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Time_update"),
+        ),
+        migrations.AddIndex(
+            model_name="tags",
+            index=models.Index(
+                fields=["user", "updated_at"], name="tags_user_updated_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="taskitem",
+            index=models.Index(
+                fields=["task", "updated_at"], name="taskitem_task_updated_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="deletionlog",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Owner",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="deletionlog",
+            index=models.Index(
+                fields=["user", "deleted_at"], name="deletionlog_user_deleted_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="deletionlog",
+            index=models.Index(fields=["deleted_at"], name="deletionlog_deleted_idx"),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.3 on 2026-10-18 07:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0015_changes_sync"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TaskStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("process", "In Process"), ("completed", "Completed")],
+                        max_length=10,
+                        verbose_name="Status",
+                    ),
+                ),
+                (
+                    "planned_date",
+                    models.DateField(
+                        blank=True, null=True, verbose_name="Planned date"
+                    ),
+                ),
+                ("count", models.IntegerField(default=0, verbose_name="Count")),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Owner",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Сводка подзадач",
+                "verbose_name_plural": "Сводки подзадач",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "status", "planned_date"),
+                        name="taskstats_bucket_uniq",
+                        nulls_distinct=False,
+                    )
+                ],
+            },
+        ),
+        migrations.RunSQL(
+            """
+            INSERT INTO tasks_taskstats (user_id, status, planned_date, count)
+            SELECT task.user_id,
+                   item.status,
+                   CASE WHEN item.status = 'process' THEN item.planned_date END,
+                   COUNT(*)
+            FROM tasks_taskitem AS item
+            JOIN tasks_tasks AS task ON task.id = item.task_id
+            GROUP BY 1, 2, 3
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.3 on 2026-10-18 07:54
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+BACKFILL = """
+UPDATE {tasks} AS task
+SET items_count = counts.items_count, completed_count = counts.completed_count
+FROM (
+    SELECT task_id,
+           COUNT(*) AS items_count,
+           COUNT(*) FILTER (WHERE status = 'completed') AS completed_count
+    FROM {items}
+    GROUP BY task_id
+) AS counts
+WHERE task.id = counts.task_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0016_task_stats"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tasks",
+            name="completed_count",
+            field=models.IntegerField(default=0, verbose_name="Completed items count"),
+        ),
+        migrations.AddField(
+            model_name="tasks",
+            name="items_count",
+            field=models.IntegerField(default=0, verbose_name="Items count"),
+        ),
+        migrations.AddField(
+            model_name="templatetasks",
+            name="completed_count",
+            field=models.IntegerField(default=0, verbose_name="Completed items count"),
+        ),
+        migrations.AddField(
+            model_name="templatetasks",
+            name="items_count",
+            field=models.IntegerField(default=0, verbose_name="Items count"),
+        ),
+        migrations.RunSQL(
+            BACKFILL.format(tasks="tasks_tasks", items="tasks_taskitem"),
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            BACKFILL.format(tasks="tasks_templatetasks", items="tasks_templatetaskitem"),
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddField(
+            model_name="tasks",
+            name="progress",
+            field=models.GeneratedField(
+                db_persist=True,
+                expression=models.Case(
+                    models.When(items_count=0, then=models.Value(0.0)),
+                    default=django.db.models.expressions.CombinedExpression(
+                        django.db.models.functions.comparison.Cast(
+                            "completed_count", models.FloatField()
+                        ),
+                        "/",
+                        django.db.models.functions.comparison.Cast(
+                            "items_count", models.FloatField()
+                        ),
+                    ),
+                ),
+                output_field=models.FloatField(),
+                verbose_name="Progress",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tasks",
+            index=models.Index(
+                fields=["user", "progress", "id"], name="tasks_user_progress_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:12
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+# то же, что services.search_vector(), на момент миграции
+BACKFILL = """
+UPDATE tasks_tasks AS task
+SET search_vector =
+    setweight(to_tsvector(%s::regconfig, task.name), 'A')
+    || setweight(to_tsvector(%s::regconfig, task.description), 'B')
+    || setweight(to_tsvector(%s::regconfig, COALESCE(items.text, '')), 'C')
+FROM tasks_tasks AS source
+LEFT JOIN (
+    SELECT task_id, STRING_AGG(name || ' ' || description, ' ' ORDER BY id) AS text
+    FROM tasks_taskitem
+    GROUP BY task_id
+) AS items ON items.task_id = source.id
+WHERE task.id = source.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0017_item_counters"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tasks",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunSQL(
+            [(BACKFILL, [settings.SEARCH_CONFIG] * 3)], migrations.RunSQL.noop
+        ),
+        migrations.AddIndex(
+            model_name="tasks",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="tasks_search_vector_idx"
+            ),
+        ),
+    ]
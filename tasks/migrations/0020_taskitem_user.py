@@ -0,0 +1,53 @@
+# Generated by Django 5.2.3 on 2026-10-18 08:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BACKFILL = """
+UPDATE tasks_taskitem AS item
+SET user_id = task.user_id
+FROM tasks_tasks AS task
+WHERE task.id = item.task_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0019_tags_trigram"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="taskitem",
+            name="user",
+            field=models.ForeignKey(
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="task_items",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Owner",
+            ),
+        ),
+        migrations.RunSQL(BACKFILL, migrations.RunSQL.noop),
+        migrations.AlterField(
+            model_name="taskitem",
+            name="user",
+            field=models.ForeignKey(
+                editable=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="task_items",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Owner",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="taskitem",
+            index=models.Index(
+                fields=["user", "planned_date", "id"], name="taskitem_user_planned_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:03
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations, models
+
+BACKFILL = """
+UPDATE {items} AS item
+SET tag_ids = links.tag_ids
+FROM (
+    SELECT {item_column} AS item_id, ARRAY_AGG(tags_id ORDER BY tags_id) AS tag_ids
+    FROM {through}
+    GROUP BY {item_column}
+) AS links
+WHERE item.id = links.item_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tasks", "0020_taskitem_user"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="taskitem",
+            name="tag_ids",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.BigIntegerField(),
+                blank=True,
+                default=list,
+                editable=False,
+                size=None,
+            ),
+        ),
+        migrations.AddField(
+            model_name="templatetaskitem",
+            name="tag_ids",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.BigIntegerField(),
+                blank=True,
+                default=list,
+                editable=False,
+                size=None,
+            ),
+        ),
+        migrations.RunSQL(
+            BACKFILL.format(
+                items="tasks_taskitem",
+                through="tasks_taskitem_tags",
+                item_column="taskitem_id",
+            ),
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            BACKFILL.format(
+                items="tasks_templatetaskitem",
+                through="tasks_templatetaskitem_tags",
+                item_column="templatetaskitem_id",
+            ),
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name="taskitem",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["tag_ids"], name="taskitem_tag_ids_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="templatetaskitem",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["tag_ids"], name="templateitem_tag_ids_idx"
+            ),
+        ),
+    ]
@@ -1,12 +1,25 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.functions import Cast, Upper
 
 
 class AbstractTaskBase(models.Model):
+    COUNTER_FIELDS = ("items_count", "completed_count")
+    # пишутся отдельными UPDATE, обычный save их не трогает
+    DERIVED_FIELDS = COUNTER_FIELDS
+
     name = models.CharField(blank=True, max_length=256, verbose_name="Name")
 
     description = models.TextField(blank=True, verbose_name="Description")
 
+    # сдвигаются F-выражениями при записи подзадач, см. services.record_item_changes
+    items_count = models.IntegerField(default=0, verbose_name="Items count")
+
+    completed_count = models.IntegerField(default=0, verbose_name="Completed items count")
+
     class Meta:
         abstract = True
 
@@ -14,6 +27,18 @@ class AbstractTaskBase(models.Model):
     def owner(self):
         return getattr(self, "user", getattr(self, "created_by", None))
 
+    def save(self, *args, **kwargs):
+        # счётчики и поисковый вектор в памяти могут отставать от базы
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and not field.generated
+                and field.name not in self.DERIVED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
 class AbstractTaskItem(models.Model):
     class StatusChoices(models.TextChoices):
         IN_PROCESS = "process", "In Process"
@@ -32,9 +57,22 @@ class AbstractTaskItem(models.Model):
 
     planned_date = models.DateField(null=True, blank=True, verbose_name="Planned date")
 
+    # копия id тегов для @> и && по GIN-индексу, см. services.refresh_tag_ids
+    tag_ids = ArrayField(models.BigIntegerField(), default=list, blank=True, editable=False)
+
     class Meta:
         abstract = True
 
+    def save(self, *args, **kwargs):
+        # tag_ids в памяти может отставать от базы, обычный save его не пишет
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "tag_ids"
+            ]
+        super().save(*args, **kwargs)
+
 
 class TemplateTasks(AbstractTaskBase):
     created_by = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
@@ -52,8 +90,13 @@ class TemplateTaskItem(AbstractTaskItem):
         "Tags", blank=True, verbose_name="Tags", related_name="templatetasks"
     )
 
+    class Meta:
+        indexes = [GinIndex(fields=["tag_ids"], name="templateitem_tag_ids_idx")]
+
 
 class Tasks(AbstractTaskBase):
+    DERIVED_FIELDS = (*AbstractTaskBase.COUNTER_FIELDS, "search_vector")
+
     template = models.ForeignKey(
         "TemplateTasks", on_delete=models.SET_NULL, null=True, blank=True
     )
@@ -68,44 +111,178 @@ class Tasks(AbstractTaskBase):
         related_name="tasks",
     )
 
+    progress = models.GeneratedField(
+        expression=models.Case(
+            models.When(items_count=0, then=models.Value(0.0)),
+            default=Cast("completed_count", models.FloatField())
+            / Cast("items_count", models.FloatField()),
+        ),
+        output_field=models.FloatField(),
+        db_persist=True,
+        verbose_name="Progress",
+    )
+
+    # название, описание и тексты подзадач, см. services.refresh_search_vectors
+    search_vector = SearchVectorField(null=True, editable=False)
+
     class Meta:
         verbose_name = "Задача"
         verbose_name_plural = "Задачи"
         ordering = ["-updated_at"]
+        indexes = [
+            models.Index(
+                fields=["user", "updated_at", "id"], name="tasks_user_updated_id_idx"
+            ),
+            models.Index(fields=["user", "progress", "id"], name="tasks_user_progress_id_idx"),
+            GinIndex(fields=["search_vector"], name="tasks_search_vector_idx"),
+        ]
 
     def __str__(self):
         return self.name or "Untitled Task"
 
 
+class TaskItemQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            if obj.user_id is None:
+                obj.user_id = obj.task.user_id
+        return super().bulk_create(objs, *args, **kwargs)
+
+
 class TaskItem(AbstractTaskItem):
     task = models.ForeignKey(
         "Tasks", on_delete=models.CASCADE, verbose_name="Task", related_name="items"
     )
+    # копия task.user для выборок по пользователю без соединения с задачами,
+    # заполняется в save() и bulk_create()
+    user = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.CASCADE,
+        editable=False,
+        verbose_name="Owner",
+        related_name="task_items",
+    )
     tags = models.ManyToManyField(
         "Tags", blank=True, verbose_name="Tags", related_name="tasks"
     )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Time_update")
+
+    objects = TaskItemQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Подзадача"
         verbose_name_plural = "Подзадачи"
+        indexes = [
+            models.Index(fields=["task", "status"], name="taskitem_task_status_idx"),
+            models.Index(
+                fields=["user", "planned_date", "id"], name="taskitem_user_planned_idx"
+            ),
+            GinIndex(fields=["tag_ids"], name="taskitem_tag_ids_idx"),
+            models.Index(fields=["task", "updated_at"], name="taskitem_task_updated_idx"),
+            models.Index(fields=["planned_date"], name="taskitem_planned_date_idx"),
+            models.Index(
+                fields=["planned_date"],
+                condition=models.Q(status="process"),
+                name="taskitem_process_planned_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if self.user_id is None:
+            self.user_id = self.task.user_id
+        super().save(*args, **kwargs)
+
 
 class Tags(models.Model):
-    name = models.CharField(max_length=24, unique=True)
+    name = models.CharField(max_length=24)
     user = models.ForeignKey(
         get_user_model(),
         on_delete=models.CASCADE,
         verbose_name="Owner",
         related_name="tags",
     )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Time_update")
 
     class Meta:
         verbose_name = "Тег"
         verbose_name_plural = "Теги"
         ordering = ["name"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "name"], include=["id"], name="tags_user_name_uniq"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["user", "updated_at"], name="tags_user_updated_idx"),
+            # автодополнение: user через btree_gin, имя — триграммы pg_trgm
+            GinIndex(
+                models.F("user"),
+                OpClass(Upper("name"), name="gin_trgm_ops"),
+                name="tags_user_name_trgm_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
+
+
+class DeletionLog(models.Model):
+    """Надгробия удалённых объектов для ``/tasks/changes``.
+
+    Старше ``DELETION_LOG_RETENTION_DAYS`` записи удаляет задача
+    ``tasks.tasks.prune_deletion_log``.
+    """
+
+    class ModelChoices(models.TextChoices):
+        TASK = "task", "Task"
+        ITEM = "item", "Task item"
+        TAG = "tag", "Tag"
+
+    user = models.ForeignKey(
+        get_user_model(), on_delete=models.CASCADE, verbose_name="Owner"
+    )
+    model = models.CharField(max_length=4, choices=ModelChoices, verbose_name="Model")
+    object_id = models.BigIntegerField(verbose_name="Object id")
+    deleted_at = models.DateTimeField(auto_now_add=True, verbose_name="Time_delete")
+
+    class Meta:
+        verbose_name = "Удалённый объект"
+        verbose_name_plural = "Удалённые объекты"
+        indexes = [
+            models.Index(fields=["user", "deleted_at"], name="deletionlog_user_deleted_idx"),
+            models.Index(fields=["deleted_at"], name="deletionlog_deleted_idx"),
+        ]
+
+
+class TaskStats(models.Model):
+    """Сводка подзадач пользователя для ``/tasks/stats``.
+
+    Строка — число подзадач с данным статусом и плановой датой. У завершённых
+    дата не хранится, так что строк у пользователя не больше, чем различных
+    дат у подзадач в работе. Счётчики сдвигаются при каждой записи
+    подзадач, расхождения чинит ``tasks.tasks.reconcile_task_stats``.
+    """
+
+    user = models.ForeignKey(
+        get_user_model(), on_delete=models.CASCADE, verbose_name="Owner"
+    )
+    status = models.CharField(
+        max_length=10, choices=AbstractTaskItem.StatusChoices, verbose_name="Status"
+    )
+    planned_date = models.DateField(null=True, blank=True, verbose_name="Planned date")
+    count = models.IntegerField(default=0, verbose_name="Count")
+
+    class Meta:
+        verbose_name = "Сводка подзадач"
+        verbose_name_plural = "Сводки подзадач"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "status", "planned_date"],
+                nulls_distinct=False,
+                name="taskstats_bucket_uniq",
+            ),
+        ]
@@ -0,0 +1,187 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Keyset (cursor) пагинация.
+
+    Курсор хранит значения полей сортировки крайней строки страницы, а сама
+    сортировка всегда дополняется ``id``, поэтому позиция однозначна даже при
+    одинаковых ``updated_at``. Страница выбирается условием по индексу, без
+    OFFSET и без ``COUNT(*)``, так что её стоимость не зависит от глубины.
+    Сортировка берётся из ``?ordering=`` или ``Meta.ordering`` модели.
+    """
+
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """То же, что ``paginate_queryset``, но страница читается async ORM."""
+        return self.set_page([obj async for obj in self.page_queryset(queryset, request)])
+
+    def page_queryset(self, queryset, request):
+        """Ленивый QuerySet страницы: строки после курсора и одна лишняя."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.fields = [self.get_field(queryset, name.lstrip("-")) for name in self.ordering]
+
+        cursor = self.decode_cursor(request)
+        self.has_cursor = cursor is not None
+        self.reverse = False
+        if cursor is not None:
+            self.reverse = cursor["reverse"]
+            queryset = queryset.filter(self.position_filter(cursor["values"], self.reverse))
+
+        ordering = self.ordering
+        if self.reverse:
+            ordering = [self.flip(name) for name in ordering]
+        return queryset.order_by(*ordering)[: self.page_size + 1]
+
+    def set_page(self, results) -> list:
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.has_cursor
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_ordering(self, queryset) -> list:
+        ordering = [
+            name
+            for name in (queryset.query.order_by or queryset.model._meta.ordering)
+            if isinstance(name, str)
+        ]
+        if not ordering:
+            ordering = ["-id"]
+        if not {"id", "-id"} & set(ordering):
+            ordering.append("-id" if ordering[0].startswith("-") else "id")
+        return ordering
+
+    @staticmethod
+    def get_field(queryset, name):
+        """Поле модели или ``output_field`` аннотации (например, ранга поиска)."""
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(name)
+
+    def position_filter(self, values, reverse) -> Q:
+        """Строки строго после позиции курсора в порядке ``self.ordering``.
+
+        Первое поле дополнительно ограничено нестрогим сравнением, чтобы
+        Postgres использовал его как условие индекса, а не как фильтр.
+        """
+        lookups = []
+        for name in self.ordering:
+            descending = name.startswith("-") != reverse
+            lookups.append((name.lstrip("-"), "lt" if descending else "gt"))
+
+        first_name, first_lookup = lookups[0]
+        bound = Q(**{f"{first_name}__{first_lookup[:2]}e": values[0]})
+
+        after = Q()
+        for index, (name, lookup) in enumerate(lookups):
+            equal = {prev: values[i] for i, (prev, _) in enumerate(lookups[:index])}
+            after |= Q(**equal, **{f"{name}__{lookup}": values[index]})
+        return bound & after
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if cursor["o"] != self.ordering or len(cursor["v"]) != len(self.fields):
+                raise ValueError
+            values = [
+                field.to_python(value) for field, value in zip(self.fields, cursor["v"])
+            ]
+        except (TypeError, ValueError, KeyError, ValidationError, FieldDoesNotExist):
+            raise NotFound(self.invalid_cursor_message)
+
+        return {"values": values, "reverse": bool(cursor.get("r"))}
+
+    def encode_cursor(self, obj, reverse):
+        values = [
+            # у поля аннотации нет модели, значение лежит в атрибуте объекта
+            field.value_to_string(obj) if hasattr(field, "model") else getattr(obj, name)
+            for name, field in zip((name.lstrip("-") for name in self.ordering), self.fields)
+        ]
+        cursor = {"o": self.ordering, "v": values}
+        if reverse:
+            cursor["r"] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, encoded
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param
+            )
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    @staticmethod
+    def flip(name):
+        return name[1:] if name.startswith("-") else f"-{name}"
+
+
+class TaskPagination(KeysetPagination):
+    page_size = 5
@@ -4,7 +4,7 @@ from rest_framework.permissions import SAFE_METHODS
 
 class IsOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        return obj.user == request.user
+        return obj.user_id == request.user.pk
 
 
 class TemplateIsOwnerOrReadOnly(permissions.BasePermission):
@@ -19,8 +19,8 @@ class TemplateIsOwnerOrReadOnly(permissions.BasePermission):
             pass
 
         if hasattr(obj, "task"):
-            owner = obj.task.created_by
+            owner_id = obj.task.created_by_id
         else:
-            owner = obj.created_by
+            owner_id = obj.created_by_id
 
-        return owner == request.user
\ No newline at end of file
+        return owner_id == request.user.pk
\ No newline at end of file
@@ -0,0 +1,100 @@
+import pstats
+import re
+import subprocess
+import sys
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+CAPTURE_SALT = "trackit.profile-capture"
+
+
+def make_token() -> str:
+    """Токен для заголовка ``X-Profile`` или параметра ``?_profile=``."""
+    return signing.dumps("profile", salt=CAPTURE_SALT)
+
+
+def check_token(token: str) -> bool:
+    try:
+        signing.loads(token, salt=CAPTURE_SALT, max_age=settings.PROFILING_CAPTURE_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def capture_dir() -> Path:
+    path = Path(settings.PROFILING_CAPTURE_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def enable_profiler(profiler) -> bool:
+    """Включает профилировщик в текущем потоке, False — если он уже занят.
+
+    С Python 3.12 cProfile работает через ``sys.monitoring``: один
+    профилировщик видит все потоки, второй одновременно не включается.
+    """
+    try:
+        profiler.enable()
+    except ValueError:
+        return False
+    return True
+
+
+def save_capture(request, *profilers) -> str:
+    """Сохраняет общую статистику профилировщиков в ``PROFILING_CAPTURE_DIR``.
+
+    Возвращает имя файла.
+    """
+    slug = re.sub(r"\W+", "-", request.path).strip("-")[:80]
+    name = f"{timezone.now():%Y%m%dT%H%M%S%f}-{request.method}-{slug}.prof"
+    pstats.Stats(*profilers).dump_stats(capture_dir() / name)
+    prune_captures(settings.PROFILING_CAPTURE_KEEP)
+    return name
+
+
+def list_captures() -> list:
+    return sorted(capture_dir().glob("*.prof"), reverse=True)
+
+
+def prune_captures(keep: int) -> list:
+    """Удаляет всё, кроме ``keep`` последних профилей, и возвращает удалённые файлы."""
+    removed = list_captures()[keep:]
+    for path in removed:
+        path.unlink(missing_ok=True)
+    return removed
+
+
+def get_capture(name: str) -> Path:
+    path = capture_dir() / Path(name).name
+    if not path.is_file():
+        raise FileNotFoundError(name)
+    return path
+
+
+def render_stats(path: Path, limit: int = 30) -> str:
+    output = StringIO()
+    pstats.Stats(str(path), stream=output).sort_stats("cumulative").print_stats(limit)
+    return output.getvalue()
+
+
+def render_dot(path: Path) -> str:
+    """Граф вызовов в формате dot через gprof2dot."""
+    result = subprocess.run(
+        [sys.executable, "-m", "gprof2dot", "-f", "pstats", str(path)],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return result.stdout
+
+
+def render_svg(path: Path) -> bytes:
+    """Граф вызовов в SVG, нужен ``dot`` из graphviz."""
+    result = subprocess.run(
+        ["dot", "-Tsvg"], input=render_dot(path).encode(), capture_output=True, check=True
+    )
+    return result.stdout
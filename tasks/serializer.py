@@ -1,96 +1,202 @@
+from functools import cache
+from itertools import chain
+
+from django.db import transaction
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
 
 from tasks.models import Tags, TaskItem, Tasks, TemplateTaskItem, TemplateTasks
+from tasks.services import (bulk_set_tags, delete_task_items, item_bucket, record_item_changes,
+                            refresh_search_vectors, shift_counters, sync_tags, tag_resolver)
+
+
+class SparseFieldsMixin:
+    """Оставляет в ответе на GET только поля из ``?fields=`` и без ``?exclude=``."""
+
+    fields_query_param = "fields"
+    exclude_query_param = "exclude"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if request is None or request.method not in SAFE_METHODS:
+            return
+
+        rendered = self.rendered_fields(request)
+        for name in [name for name, field in self.fields.items() if not field.write_only]:
+            if name not in rendered:
+                self.fields.pop(name)
 
+    @classmethod
+    @cache
+    def readable_fields(cls) -> frozenset:
+        """Поля, которые отдаёт сериализатор; собираются один раз на класс."""
+        return frozenset(name for name, field in cls().fields.items() if not field.write_only)
 
-class BaseTaskSerializer(serializers.ModelSerializer):
+    @classmethod
+    def rendered_fields(cls, request) -> set:
+        readable = cls.readable_fields()
+        fields = cls._parse(request.query_params.get(cls.fields_query_param))
+        exclude = cls._parse(request.query_params.get(cls.exclude_query_param))
+        return (fields & readable if fields else readable) - exclude
+
+    @staticmethod
+    def _parse(value) -> set:
+        return {name.strip() for name in (value or "").split(",") if name.strip()}
+
+
+class BaseTaskSerializer(SparseFieldsMixin, serializers.ModelSerializer):
 
     class Meta:
-        fields = ["id", "name", "description", "items"]
+        fields = ["id", "name", "description", "items", "items_count", "completed_count"]
+        read_only_fields = ["items_count", "completed_count"]
         abstract = True
 
     def create_task(self, items_model, validated_data):
         items = validated_data.pop("items", [])
-        task = self.Meta.model.objects.create(**validated_data)
-
-        for item in items:
-            self._create_task_item(task, items_model, item)
+        with transaction.atomic():
+            task = self.Meta.model.objects.create(**validated_data)
+            self._create_task_items(task, items_model, items)
 
         return task
 
     @staticmethod
-    def _create_task_item(task, items_model, items):
-
-        tag_names = items.pop("tags_input", [])
-        tag_objs = []
-        for tag_name in tag_names:
-            tag_obj, _ = Tags.objects.get_or_create(name=tag_name, user=task.owner)
-            tag_objs.append(tag_obj)
-
-        taskitem = items_model.objects.create(task=task, **items)
-        taskitem.tags.set(tag_objs)
+    def _create_task_items(task, items_model, items):
+        """Создаёт подзадачи пачкой: теги всех подзадач резолвятся одним запросом."""
+        tag_names = [item.pop("tags_input", []) for item in items]
+        tag_ids = tag_resolver.resolve_many(task.owner, chain.from_iterable(tag_names))
+        for item in items:
+            item.pop("id", None)
+
+        objs = items_model.objects.bulk_create(
+            [items_model(task=task, **item) for item in items]
+        )
+        shift_counters(
+            [task],
+            record_item_changes(
+                items_model, added=[item_bucket(obj) for obj in objs], user_id=task.owner.pk
+            ),
+        )
+        bulk_set_tags(
+            items_model,
+            (
+                (obj.id, tag_ids[name])
+                for obj, names in zip(objs, tag_names)
+                for name in names
+                if name in tag_ids
+            ),
+        )
+        return objs
 
     def update_task(self, instance, items_model, validated_data):
-        excluded_fields = ("id", "created_at", "updated_at", "template")
+        excluded_fields = ("id", "created_at", "updated_at", "template", *instance.DERIVED_FIELDS)
         updated_items_ids = []
         items = validated_data.pop("items", [])
-        if self.partial:
+        with transaction.atomic():
+            if self.partial:
 
-            for key, value in validated_data.items():
-                setattr(instance, key, value)
-
-            for item_data in items:
-                self._update_task_item(
-                    instance, items_model, item_data, updated_items_ids
-                )
-
-        else:
-            model_fields = {
-                f.name for f in instance._meta.fields if f.name not in excluded_fields
-            }
-            if model_fields <= set(validated_data.keys()):
                 for key, value in validated_data.items():
                     setattr(instance, key, value)
 
-                if not items and type(items) is list:
-                    instance.items.all().delete()
-                else:
-                    for item_data in items:
-                        self._update_task_item(
-                            instance, items_model, item_data, updated_items_ids
+                updated_items_ids = self._update_task_items(instance, items_model, items)
+
+            else:
+                model_fields = {
+                    f.name
+                    for f in instance._meta.fields
+                    if f.name not in excluded_fields and not f.generated
+                }
+                if model_fields <= set(validated_data.keys()):
+                    for key, value in validated_data.items():
+                        setattr(instance, key, value)
+
+                    if not items and type(items) is list:
+                        delete_task_items(instance, items_model)
+                    else:
+                        updated_items_ids = self._update_task_items(
+                            instance, items_model, items
                         )
 
-        self.updated_items_ids = updated_items_ids
-        instance.save()
+            self.updated_items_ids = updated_items_ids
+            instance.save()
         return instance
 
     @staticmethod
-    def _update_task_item(instance, items_model, item_data, updated_items_ids: list):
+    def _update_task_items(instance, items_model, items) -> list:
+        """Обновляет подзадачи по диффу.
+
+        Существующие подзадачи и их теги читаются один раз, изменения пишутся
+        через bulk_update/bulk_create и разницу множеств тегов.
+        """
+        if not items:
+            return []
+
         existing_items = {item.id: item for item in instance.items.all()}
-        id = item_data.get("id", None)
-        tag_names = item_data.pop("tags_input", [])
-        tag_objs = []
-
-        for tag_name in tag_names:
-            tag_obj, _ = Tags.objects.get_or_create(name=tag_name, user=instance.owner)
-            tag_objs.append(tag_obj)
-
-        if id in existing_items:
-            obj = existing_items[id]
-            updated_items_ids.append(id)
-            for key, value in item_data.items():
-                setattr(obj, key, value)
-            obj.save()
-            obj.tags.set(tag_objs)
-        else:
-            obj = items_model.objects.create(task=instance, **item_data)
-            updated_items_ids.append(f"New item {obj.id}")
-            obj.tags.set(tag_objs)
-
-        return updated_items_ids
-
-
-class BaseTaskItemSerializer(serializers.ModelSerializer):
+        tag_names = [item_data.pop("tags_input", []) for item_data in items]
+        tag_ids = tag_resolver.resolve_many(instance.owner, chain.from_iterable(tag_names))
+
+        updated_items_ids = []
+        changed_items = {}
+        update_fields = set()
+        new_items = []
+        item_tags = {}
+        removed = []
+
+        for item_data, names in zip(items, tag_names):
+            tags = {tag_ids[name] for name in names if name in tag_ids}
+            id = item_data.pop("id", None)
+
+            if id in existing_items:
+                obj = existing_items[id]
+                if id not in changed_items:
+                    removed.append(item_bucket(obj))
+                for key, value in item_data.items():
+                    setattr(obj, key, value)
+                update_fields.update(item_data)
+                changed_items[id] = obj
+                item_tags[id] = tags
+                updated_items_ids.append(id)
+            else:
+                obj = items_model(task=instance, **item_data)
+                new_items.append((obj, tags))
+                updated_items_ids.append(obj)
+
+        # bulk_update не вызывает pre_save, auto_now-поля выставляем сами
+        auto_now = [
+            field for field in items_model._meta.concrete_fields if getattr(field, "auto_now", False)
+        ]
+        if changed_items and auto_now:
+            for obj in changed_items.values():
+                for field in auto_now:
+                    field.pre_save(obj, add=False)
+            update_fields.update(field.name for field in auto_now)
+
+        if update_fields:
+            items_model.objects.bulk_update(changed_items.values(), update_fields)
+        items_model.objects.bulk_create([obj for obj, _ in new_items])
+        for obj, tags in new_items:
+            item_tags[obj.id] = tags
+        shift_counters(
+            [instance],
+            record_item_changes(
+                items_model,
+                removed=removed,
+                added=[
+                    item_bucket(obj)
+                    for obj in chain(changed_items.values(), (obj for obj, _ in new_items))
+                ],
+                user_id=instance.owner.pk,
+            ),
+        )
+        sync_tags(items_model, item_tags)
+
+        return [
+            f"New item {item.id}" if isinstance(item, items_model) else item
+            for item in updated_items_ids
+        ]
+
+
+class BaseTaskItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     id = serializers.IntegerField(required=False)
     tags = serializers.SlugRelatedField(many=True, slug_field="name", read_only=True)
 
@@ -113,18 +219,14 @@ class BaseTaskItemSerializer(serializers.ModelSerializer):
     @staticmethod
     def _update_task_item(instance, validated_data):
         tag_names = validated_data.pop("tags_input", [])
-        tag_objs = set()
 
         for key, value in validated_data.items():
             setattr(instance, key, value)
 
-        for tag_name in tag_names:
-            tag_obj, _ = Tags.objects.get_or_create(
-                name=tag_name, user=instance.task.owner
-            )
-            tag_objs.add(tag_obj)
-
-        instance.tags.set(tag_objs)
+        with transaction.atomic():
+            tag_ids = tag_resolver.resolve_many(instance.task.owner, tag_names)
+            instance.save()
+            sync_tags(type(instance), {instance.id: set(tag_ids.values())})
         return instance
 
 
@@ -139,12 +241,11 @@ class TemplateTaskItemSerializer(BaseTaskItemSerializer):
 class TemplateTaskSerializer(BaseTaskSerializer):
     name = serializers.CharField(required=True)
     items = TemplateTaskItemSerializer(many=True, write_only=True, required=False)
-    items_count = serializers.IntegerField(read_only=True, required=False)
     created_by = serializers.HiddenField(default=serializers.CurrentUserDefault())
 
     class Meta(BaseTaskSerializer.Meta):
         model = TemplateTasks
-        fields = BaseTaskSerializer.Meta.fields + ["created_by", "items_count"]
+        fields = BaseTaskSerializer.Meta.fields + ["created_by"]
 
     def create(self, validated_data):
         return self.create_task(TemplateTaskItem, validated_data)
@@ -164,18 +265,26 @@ class TaskItemSerializer(BaseTaskItemSerializer):
 class TaskSerializer(BaseTaskSerializer):
     name = serializers.CharField(required=True)
     items = TaskItemSerializer(many=True, write_only=True, required=False)
-    items_count = serializers.IntegerField(read_only=True, required=False)
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    # есть только в результатах ?search=, см. filters.TaskSearchFilter
+    search_rank = serializers.FloatField(read_only=True)
+    search_headline = serializers.CharField(read_only=True)
 
     class Meta(BaseTaskSerializer.Meta):
         model = Tasks
-        fields = BaseTaskSerializer.Meta.fields + ["items_count", "user"]
+        fields = BaseTaskSerializer.Meta.fields + ["user", "search_rank", "search_headline"]
 
     def update(self, instance, validated_data):
         return self.update_task(instance, TaskItem, validated_data)
 
     def create(self, validated_data):
-        return self.create_task(TaskItem, validated_data)
+        with transaction.atomic():
+            has_items = bool(validated_data.get("items"))
+            task = self.create_task(TaskItem, validated_data)
+            # вектор собран в post_save, до bulk_create подзадач
+            if has_items:
+                refresh_search_vectors([task.pk])
+        return task
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -184,3 +293,32 @@ class TagSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tags
         fields = ["name", "user"]
+
+
+class TaskChangeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tasks
+        fields = ["id", "name", "description", "template", "created_at", "updated_at"]
+
+
+class TaskItemChangeSerializer(serializers.ModelSerializer):
+    tags = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+    class Meta:
+        model = TaskItem
+        fields = [
+            "id",
+            "task",
+            "name",
+            "description",
+            "status",
+            "planned_date",
+            "tags",
+            "updated_at",
+        ]
+
+
+class TagChangeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tags
+        fields = ["id", "name", "updated_at"]
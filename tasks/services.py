@@ -0,0 +1,950 @@
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.expressions import ArraySubquery
+from django.contrib.postgres.search import SearchVector, TrigramWordSimilarity
+from django.core import signing
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import (BooleanField, Case, Count, ExpressionWrapper, F, Func, OuterRef,
+                              Prefetch, Q, Subquery, Sum, TextField, Value, When,
+                              prefetch_related_objects)
+from django.db.models.functions import Coalesce, Concat, Upper
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from tasks.models import (AbstractTaskItem, DeletionLog, Tags, TaskItem, Tasks, TaskStats,
+                          TemplateTaskItem, TemplateTasks)
+
+TEMPLATE_MAX_COUNT = 50
+STATUS_UPDATES_MAX_COUNT = 1000
+TAG_AUTOCOMPLETE_LIMIT = 10
+TAG_AUTOCOMPLETE_MAX_LIMIT = 50
+AGENDA_MAX_DAYS = 62
+CHANGES_SALT = "trackit.changes"
+# Транзакция, начатая до запроса изменений, может закоммитить более ранний
+# updated_at уже после него, поэтому новый курсор отступает назад. Повторы
+# безопасны: клиент применяет изменения идемпотентно.
+CHANGES_OVERLAP = timedelta(seconds=5)
+
+
+def touch_tasks(tasks) -> None:
+    """Сдвигает ``updated_at`` задач, чьи подзадачи изменились: по нему считаются ETag."""
+    tasks.update(updated_at=timezone.now())
+
+
+def _tags_through(items_model):
+    field = items_model._meta.get_field("tags")
+    return (
+        field.remote_field.through,
+        f"{field.m2m_field_name()}_id",
+        f"{field.m2m_reverse_field_name()}_id",
+    )
+
+
+def bulk_set_tags(items_model, pairs) -> None:
+    """Одним INSERT заполняет through-таблицу ``items_model.tags``.
+
+    ``pairs`` — пары ``(item_id, tag_id)``. ``tag_ids`` затронутых подзадач
+    пересобирается следом.
+    """
+    pairs = list(pairs)
+    _insert_tags(items_model, pairs)
+    refresh_tag_ids(items_model, (item_id for item_id, _ in pairs))
+
+
+def _insert_tags(items_model, pairs) -> None:
+    through, source, target = _tags_through(items_model)
+
+    through.objects.bulk_create(
+        [through(**{source: item_id, target: tag_id}) for item_id, tag_id in pairs],
+        ignore_conflicts=True,
+    )
+
+
+def sync_tags(items_model, item_tags: dict) -> None:
+    """Приводит теги подзадач к ``{item_id: {tag_id, ...}}``.
+
+    Текущие связи читаются одним запросом, дальше — один DELETE лишних,
+    один INSERT недостающих и один UPDATE ``tag_ids`` изменившихся подзадач.
+    """
+    if not item_tags:
+        return
+
+    through, source, target = _tags_through(items_model)
+    current = defaultdict(set)
+    stale, changed = [], set()
+    links = through.objects.filter(**{f"{source}__in": item_tags}).values_list(
+        "pk", source, target
+    )
+    for pk, item_id, tag_id in links:
+        if tag_id in item_tags[item_id]:
+            current[item_id].add(tag_id)
+        else:
+            stale.append(pk)
+            changed.add(item_id)
+
+    if stale:
+        through.objects.filter(pk__in=stale).delete()
+    missing = [
+        (item_id, tag_id)
+        for item_id, tags in item_tags.items()
+        for tag_id in tags - current[item_id]
+    ]
+    _insert_tags(items_model, missing)
+    refresh_tag_ids(items_model, changed.union(item_id for item_id, _ in missing))
+
+
+def refresh_tag_ids(items_model, item_ids) -> None:
+    """Пересобирает ``tag_ids`` подзадач из through-таблицы одним UPDATE."""
+    item_ids = sorted(set(item_ids))
+    if not item_ids:
+        return
+
+    through, source, target = _tags_through(items_model)
+    items_model.objects.filter(pk__in=item_ids).update(
+        tag_ids=ArraySubquery(
+            through.objects.filter(**{source: OuterRef("pk")}).order_by(target).values(target)
+        )
+    )
+
+
+def remove_tag_ids(tag_id, items_models=(TaskItem, TemplateTaskItem)) -> None:
+    """Убирает тег из ``tag_ids`` всех подзадач, подзадачи ищутся по GIN-индексу."""
+    for items_model in items_models:
+        items_model.objects.filter(tag_ids__contains=[tag_id]).update(
+            tag_ids=Func(F("tag_ids"), Value(tag_id), function="array_remove")
+        )
+
+
+class TagResolver:
+    """Пакетный поиск и создание тегов пользователя.
+
+    Кэш двухуровневый: LRU в памяти процесса и хэш ``tags:user:<id>:<поколение>``
+    в Redis. Поколение ``tags:user:<id>:gen`` увеличивается при удалении или
+    изменении тега. Оно входит в ключ хэша и сверяется с локальными записями,
+    так что запись, прочитанная до инвалидации и сохранённая после неё, уходит
+    в старый хэш, который никто не читает. Если Redis недоступен, кэш не
+    используется и теги читаются из базы.
+    """
+
+    key = "tags:user:{user_id}:{generation}"
+    generation_key = "tags:user:{user_id}:gen"
+    timeout = 60 * 60 * 24
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+
+    def resolve_many(self, user, names) -> dict:
+        """Возвращает ``{name: tag_id}``, недостающие теги создаются одним INSERT."""
+        names = set(names)
+        if not names:
+            return {}
+
+        redis = get_redis_connection("default")
+        generation = self._generation(redis, user.pk)
+        tags = self._local_get(user.pk, generation, names)
+
+        missing = names - tags.keys()
+        if missing and generation is not None:
+            cached = self._redis_get(redis, user.pk, generation, missing)
+            self._local_set(user.pk, generation, cached)
+            tags.update(cached)
+            missing -= cached.keys()
+
+        if missing:
+            found = dict(
+                Tags.objects.filter(user=user, name__in=missing)
+                .order_by()
+                .values_list("name", "id")
+            )
+            missing -= found.keys()
+            self._remember(redis, user.pk, generation, found)
+            tags.update(found)
+
+        if missing:
+            created = {
+                tag.name: tag.id
+                for tag in Tags.objects.bulk_create(
+                    [Tags(name=name, user=user) for name in missing],
+                    update_conflicts=True,
+                    unique_fields=["user", "name"],
+                    update_fields=["name"],
+                )
+            }
+            transaction.on_commit(
+                lambda: self._remember(redis, user.pk, generation, created)
+            )
+            # bulk_create не шлёт post_save, автодополнение сбрасываем сами
+            tags_cache.invalidate_on_commit(user.pk)
+            tags.update(created)
+
+        return tags
+
+    def add(self, tag: Tags) -> None:
+        redis = get_redis_connection("default")
+        generation = self._generation(redis, tag.user_id)
+        self._remember(redis, tag.user_id, generation, {tag.name: tag.id})
+
+    def invalidate(self, user_id) -> None:
+        with self.lock:
+            self.local.pop(user_id, None)
+        try:
+            redis = get_redis_connection("default")
+            generation = redis.incr(self.generation_key.format(user_id=user_id))
+            redis.delete(self.key.format(user_id=user_id, generation=generation - 1))
+        except RedisError:
+            pass
+
+    def clear(self) -> None:
+        with self.lock:
+            self.local.clear()
+
+    def _generation(self, redis, user_id):
+        try:
+            return int(redis.get(self.generation_key.format(user_id=user_id)) or 0)
+        except RedisError:
+            return None
+
+    def _redis_get(self, redis, user_id, generation, names) -> dict:
+        names = list(names)
+        try:
+            values = redis.hmget(self.key.format(user_id=user_id, generation=generation), names)
+        except RedisError:
+            return {}
+        return {name: int(value) for name, value in zip(names, values) if value is not None}
+
+    def _remember(self, redis, user_id, generation, tags: dict) -> None:
+        if not tags or generation is None:
+            return
+        self._local_set(user_id, generation, tags)
+        key = self.key.format(user_id=user_id, generation=generation)
+        try:
+            redis.hset(key, mapping=tags)
+            redis.expire(key, self.timeout)
+        except RedisError:
+            pass
+
+    def _local_get(self, user_id, generation, names) -> dict:
+        if generation is None:
+            return {}
+        with self.lock:
+            entry = self.local.get(user_id)
+            if entry is None or entry[0] != generation:
+                return {}
+            self.local.move_to_end(user_id)
+            return {name: entry[1][name] for name in names if name in entry[1]}
+
+    def _local_set(self, user_id, generation, tags: dict) -> None:
+        if not tags:
+            return
+        with self.lock:
+            entry = self.local.get(user_id)
+            if entry is None or entry[0] != generation:
+                entry = (generation, {})
+            entry[1].update(tags)
+            self.local[user_id] = entry
+            self.local.move_to_end(user_id)
+            while len(self.local) > self.maxsize:
+                self.local.popitem(last=False)
+
+
+tag_resolver = TagResolver()
+
+
+class VersionedCache:
+    """Кэш, ключи которого содержат поколение своей области.
+
+    Инвалидация области — один ``INCR`` ключа поколения, старые записи
+    больше не читаются и истекают по TTL. Поколение заводится от текущего
+    времени в мс, поэтому вытесненный и созданный заново счётчик не совпадёт
+    с поколениями, которые ещё лежат в кэше. Чтения считаются в
+    ``<prefix>:stats:hit`` и ``<prefix>:stats:miss``. Все кэши по префиксам
+    собраны в ``VersionedCache.instances``.
+    """
+
+    instances = {}
+
+    def __init__(self, prefix, timeout=300):
+        self.prefix = prefix
+        self.timeout = timeout
+        self.local = threading.local()
+        VersionedCache.instances[prefix] = self
+
+    def version_key(self, scope) -> str:
+        return f"{self.prefix}:{scope}:version"
+
+    def version(self, scope) -> int:
+        key = self.version_key(scope)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, time.time_ns() // 1_000_000, timeout=None)
+            version = cache.get(key)
+        return version
+
+    def key(self, scope, *parts) -> str:
+        return ":".join([self.prefix, str(scope), f"v{self.version(scope)}", *map(str, parts)])
+
+    def get(self, key):
+        value = cache.get(key)
+        self._count("hit" if value is not None else "miss")
+        return value
+
+    def set(self, key, value) -> None:
+        cache.set(key, value, timeout=self.timeout)
+
+    async def aversion(self, scope) -> int:
+        key = self.version_key(scope)
+        version = await cache.aget(key)
+        if version is None:
+            await cache.aadd(key, time.time_ns() // 1_000_000, timeout=None)
+            version = await cache.aget(key)
+        return version
+
+    async def akey(self, scope, *parts) -> str:
+        version = await self.aversion(scope)
+        return ":".join([self.prefix, str(scope), f"v{version}", *map(str, parts)])
+
+    async def aget(self, key):
+        value = await cache.aget(key)
+        await self._acount("hit" if value is not None else "miss")
+        return value
+
+    async def aset(self, key, value) -> None:
+        await cache.aset(key, value, timeout=self.timeout)
+
+    def invalidate(self, *scopes) -> None:
+        for scope in scopes:
+            try:
+                cache.incr(self.version_key(scope))
+            except ValueError:
+                # счётчика нет — под ним ничего не закэшировано
+                pass
+
+    def invalidate_on_commit(self, *scopes) -> None:
+        """Инвалидирует области после коммита, один раз на транзакцию.
+
+        Области копятся, пока callback текущей транзакции ещё ждёт в
+        ``run_on_commit``; после отката или выполнения заводится новый.
+        """
+        connection = transaction.get_connection()
+        pending = getattr(self.local, "pending", None)
+        if pending and any(entry[1] is pending[1] for entry in connection.run_on_commit):
+            pending[0].update(scopes)
+            return
+
+        collected = set(scopes)
+
+        def flush():
+            self.local.pending = None
+            self.invalidate(*collected)
+
+        self.local.pending = (collected, flush)
+        transaction.on_commit(flush)
+
+    def stats(self) -> dict:
+        """Счётчики попаданий и промахов с момента запуска (или сброса Redis)."""
+        keys = {event: self.stats_key(event) for event in ("hit", "miss")}
+        values = cache.get_many(keys.values())
+        return {event: values.get(key, 0) for event, key in keys.items()}
+
+    def stats_key(self, event) -> str:
+        return f"{self.prefix}:stats:{event}"
+
+    def _count(self, event) -> None:
+        key = self.stats_key(event)
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+
+    async def _acount(self, event) -> None:
+        key = self.stats_key(event)
+        try:
+            await cache.aincr(key)
+        except ValueError:
+            if not await cache.aadd(key, 1, timeout=None):
+                await cache.aincr(key)
+
+
+template_cache = VersionedCache("template_tasks", timeout=60 * 60 * 24)
+tasks_cache = VersionedCache("tasks", timeout=60 * 60)
+# сбрасывается записью тегов, порядок по использованию может отставать на TTL
+tags_cache = VersionedCache("tags", timeout=60)
+
+
+def autocomplete_tags(user, query: str, limit=TAG_AUTOCOMPLETE_LIMIT):
+    """Имена тегов пользователя для автодополнения ``query`` (ленивый QuerySet).
+
+    Сначала теги, начинающиеся с ``query``, потом похожие по триграммам
+    (опечатка, совпадение слова внутри имени); внутри групп — чаще
+    используемые в подзадачах. Кандидатов отбирает GIN-индекс
+    ``tags_user_name_trgm_idx`` по ``UPPER(name)``, так что цена зависит от
+    числа совпадений, а не от числа тегов.
+    """
+    prefix = Q(upper_name__startswith=query.upper())
+    usage = (
+        TaskItem.tags.through.objects.filter(tags=OuterRef("pk"))
+        .order_by()
+        .values("tags")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    return (
+        Tags.objects.alias(upper_name=Upper("name"))
+        .filter(prefix | Q(upper_name__trigram_word_similar=query), user=user)
+        .annotate(
+            is_prefix=ExpressionWrapper(prefix, output_field=BooleanField()),
+            # подзапрос по индексу tags_id, без соединения со всей таблицей связей
+            usage=Coalesce(Subquery(usage), 0),
+            similarity=TrigramWordSimilarity(query, Upper("name")),
+        )
+        .order_by("-is_prefix", "-usage", "-similarity", "name")
+        .values_list("name", flat=True)[:limit]
+    )
+
+
+def copy_template_items(template: TemplateTasks, tasks) -> list:
+    """Копирует подзадачи шаблона (вместе с тегами) во все задачи ``tasks``.
+
+    Число запросов не зависит ни от количества подзадач, ни от количества задач.
+    """
+    if not tasks:
+        return []
+
+    user = tasks[0].user
+    prefetch_related_objects([template], "items__tags")
+    template_items = sorted(template.items.all(), key=lambda item: item.id)
+
+    if user.pk == template.created_by_id:
+        tag_ids = {
+            tag.name: tag.id for item in template_items for tag in item.tags.all()
+        }
+    else:
+        tag_ids = tag_resolver.resolve_many(
+            user, (tag.name for item in template_items for tag in item.tags.all())
+        )
+
+    items, item_tags = [], []
+    for task in tasks:
+        for template_item in template_items:
+            items.append(
+                TaskItem(
+                    task=task,
+                    name=template_item.name,
+                    description=template_item.description,
+                    planned_date=template_item.planned_date,
+                )
+            )
+            item_tags.append(
+                [tag_ids[tag.name] for tag in template_item.tags.all() if tag.name in tag_ids]
+            )
+
+    TaskItem.objects.bulk_create(items)
+    shift_counters(
+        tasks,
+        record_item_changes(
+            TaskItem, added=[item_bucket(item) for item in items], user_id=user.pk
+        ),
+    )
+    bulk_set_tags(
+        TaskItem,
+        ((item.id, tag_id) for item, tags in zip(items, item_tags) for tag_id in tags),
+    )
+    return items
+
+
+def create_tasks_from_template(
+    template: TemplateTasks, user: get_user_model(), count: int = 1
+) -> list:
+    """Создаёт ``count`` задач по шаблону за постоянное число запросов."""
+    with transaction.atomic():
+        tasks = Tasks.objects.bulk_create(
+            [
+                Tasks(
+                    user=user,
+                    name=template.name,
+                    description=template.description,
+                    template=template,
+                )
+                for _ in range(count)
+            ]
+        )
+        copy_template_items(template, tasks)
+        refresh_search_vectors(task.pk for task in tasks)
+        tasks_cache.invalidate_on_commit(user.pk)
+
+    return tasks
+
+
+def create_templates_from_tasks(tasks) -> list:
+    """Создаёт по шаблону на каждую задачу вместе с подзадачами и тегами."""
+    tasks = list(tasks)
+    prefetch_related_objects(tasks, "items__tags")
+
+    foreign_tags = defaultdict(set)
+    for task in tasks:
+        for item in task.items.all():
+            for tag in item.tags.all():
+                if tag.user_id != task.user_id:
+                    foreign_tags[task.user_id].add(tag.name)
+
+    with transaction.atomic():
+        users = get_user_model().objects.in_bulk(foreign_tags)
+        resolved = {
+            user_id: tag_resolver.resolve_many(users[user_id], names)
+            for user_id, names in foreign_tags.items()
+        }
+
+        templates = TemplateTasks.objects.bulk_create(
+            [
+                TemplateTasks(
+                    name=task.name,
+                    description=task.description,
+                    created_by_id=task.user_id,
+                )
+                for task in tasks
+            ]
+        )
+
+        items, item_tags = [], []
+        for task, template in zip(tasks, templates):
+            for item in sorted(task.items.all(), key=lambda item: item.id):
+                items.append(
+                    TemplateTaskItem(
+                        task=template,
+                        name=item.name,
+                        description=item.description,
+                        planned_date=item.planned_date,
+                    )
+                )
+                item_tags.append(
+                    [
+                        tag.id
+                        if tag.user_id == task.user_id
+                        else resolved[task.user_id][tag.name]
+                        for tag in item.tags.all()
+                    ]
+                )
+
+        TemplateTaskItem.objects.bulk_create(items)
+        shift_counters(
+            templates,
+            record_item_changes(TemplateTaskItem, added=[item_bucket(item) for item in items]),
+        )
+        bulk_set_tags(
+            TemplateTaskItem,
+            ((item.id, tag_id) for item, tags in zip(items, item_tags) for tag_id in tags),
+        )
+        # bulk_create не шлёт сигналов
+        template_cache.invalidate_on_commit("list")
+
+    return templates
+
+
+def update_items_status(user, updates: dict, task=None) -> tuple:
+    """Применяет ``{item_id: status}`` к подзадачам пользователя.
+
+    Владение проверяется одним SELECT, статусы пишутся одним
+    ``UPDATE ... FROM (VALUES ...)``, задачи сдвигаются одним UPDATE.
+    Возвращает списки обновлённых и не найденных id.
+    """
+    items = TaskItem.objects.filter(task__user=user)
+    if task is not None:
+        items = items.filter(task=task)
+    ids = [
+        item_id
+        for item_id in updates
+        if isinstance(item_id, int) and not isinstance(item_id, bool)
+    ]
+
+    with transaction.atomic():
+        # строки блокируются, чтобы сводка считалась от актуальных статусов
+        owned = {
+            item_id: (task_id, status, planned_date)
+            for item_id, task_id, status, planned_date in items.filter(id__in=ids)
+            .select_for_update(of=("self",))
+            .values_list("id", "task_id", "status", "planned_date")
+        }
+        updated = [item_id for item_id in updates if item_id in owned]
+        not_found = [item_id for item_id in updates if item_id not in owned]
+        if not updated:
+            return updated, not_found
+
+        quote = connection.ops.quote_name
+        values = ", ".join(["(%s::bigint, %s)"] * len(updated))
+        params = [timezone.now()]
+        for item_id in updated:
+            params.extend((item_id, updates[item_id]))
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {quote(TaskItem._meta.db_table)} AS item "
+                f"SET status = v.status, updated_at = %s "
+                f"FROM (VALUES {values}) AS v(id, status) "
+                f"WHERE item.id = v.id",
+                params,
+            )
+        touch_tasks(Tasks.objects.filter(pk__in={owned[item_id][0] for item_id in updated}))
+        record_item_changes(
+            TaskItem,
+            removed=[owned[item_id] for item_id in updated],
+            added=[(owned[item_id][0], updates[item_id], owned[item_id][2]) for item_id in updated],
+            user_id=user.pk,
+        )
+        # UPDATE мимо ORM сигналов не шлёт
+        tasks_cache.invalidate_on_commit(user.pk)
+
+    return updated, not_found
+
+
+def item_bucket(item) -> tuple:
+    return item.task_id, item.status, item.planned_date
+
+
+def stats_key(user_id, status, planned_date) -> tuple:
+    """Строка сводки: у завершённых подзадач дата не важна."""
+    if status != TaskItem.StatusChoices.IN_PROCESS:
+        planned_date = None
+    return user_id, status, planned_date
+
+
+def item_stats_delta(user_id, removed=(), added=()) -> Counter:
+    """Сдвиг сводки ``TaskStats`` от изменения подзадач пользователя.
+
+    ``removed`` и ``added`` — тройки ``(task_id, status, planned_date)``
+    до и после изменения, см. ``item_bucket``.
+    """
+    delta = Counter()
+    for sign, buckets in ((-1, removed), (1, added)):
+        for _, status, planned_date in buckets:
+            delta[stats_key(user_id, status, planned_date)] += sign
+    return delta
+
+
+def apply_item_stats(delta: Counter) -> None:
+    """Применяет сдвиг сводки одним ``INSERT ... ON CONFLICT DO UPDATE``."""
+    # одинаковый порядок строк у параллельных транзакций не даёт взаимных блокировок
+    rows = sorted(
+        ((key, count) for key, count in delta.items() if count),
+        key=lambda row: (row[0][0], row[0][1], row[0][2] or date.min),
+    )
+    if not rows:
+        return
+
+    quote = connection.ops.quote_name
+    values = ", ".join(["(%s, %s, %s::date, %s)"] * len(rows))
+    params = []
+    for (user_id, status, planned_date), count in rows:
+        params.extend((user_id, status, planned_date, count))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(TaskStats._meta.db_table)} AS stats "
+            f"(user_id, status, planned_date, count) VALUES {values} "
+            f"ON CONFLICT ON CONSTRAINT taskstats_bucket_uniq "
+            f"DO UPDATE SET count = stats.count + EXCLUDED.count",
+            params,
+        )
+
+
+def apply_item_counters(items_model, removed=(), added=()) -> dict:
+    """Сдвигает ``items_count`` и ``completed_count`` задач одним UPDATE.
+
+    Возвращает сдвиги ``{task_id: (items, completed)}``, чтобы поправить
+    задачи, уже загруженные в память.
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    for sign, buckets in ((-1, removed), (1, added)):
+        for task_id, status, _ in buckets:
+            deltas[task_id][0] += sign
+            if status == AbstractTaskItem.StatusChoices.COMPLETED:
+                deltas[task_id][1] += sign
+    deltas = {task_id: tuple(delta) for task_id, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return deltas
+
+    def shift(field, index):
+        whens = [
+            When(pk=task_id, then=Value(delta[index]))
+            for task_id, delta in deltas.items()
+            if delta[index]
+        ]
+        return F(field) + Case(*whens, default=Value(0)) if whens else F(field)
+
+    task_model = items_model._meta.get_field("task").related_model
+    task_model.objects.filter(pk__in=sorted(deltas)).update(
+        items_count=shift("items_count", 0), completed_count=shift("completed_count", 1)
+    )
+    return deltas
+
+
+def record_item_changes(items_model, removed=(), added=(), user_id=None) -> dict:
+    """Учитывает изменение подзадач в счётчиках задач и сводке ``TaskStats``.
+
+    ``removed`` и ``added`` — тройки ``(task_id, status, planned_date)`` до
+    и после изменения, см. ``item_bucket``. Для ``TaskItem`` нужен владелец
+    ``user_id``. Вызывается на всех путях записи мимо ``save()``/``delete()``,
+    остальное ловят сигналы.
+    """
+    removed, added = list(removed), list(added)
+    if items_model is TaskItem:
+        apply_item_stats(item_stats_delta(user_id, removed, added))
+    return apply_item_counters(items_model, removed, added)
+
+
+def shift_counters(tasks, deltas: dict) -> None:
+    """Переносит сдвиги из ``record_item_changes`` на задачи в памяти."""
+    for task in tasks:
+        items, completed = deltas.get(task.pk, (0, 0))
+        task.items_count += items
+        task.completed_count += completed
+
+
+def delete_task_items(task, items_model) -> None:
+    """Удаляет все подзадачи задачи без построчных сигналов.
+
+    Счётчики задачи и сводка сдвигаются одним ``record_item_changes``,
+    надгробия подзадач пишутся одним INSERT. Поисковый вектор, ``updated_at``
+    и кэш обновляет следующее за этим сохранение самой задачи.
+    """
+    items = items_model.objects.filter(task=task)
+    rows = list(items.values_list("pk", "task_id", "status", "planned_date"))
+    if not rows:
+        return
+
+    item_ids = [row[0] for row in rows]
+    through, source, _ = _tags_through(items_model)
+    through.objects.filter(**{f"{source}__in": item_ids}).delete()
+    # QuerySet.delete() при подключённых сигналах обходит подзадачи по одной,
+    # а их post_delete повторили бы счётчики, сводку и надгробия ниже
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {quote(items_model._meta.db_table)} "
+            f"WHERE {quote(items_model._meta.get_field('task').column)} = %s",
+            [task.pk],
+        )
+
+    shift_counters(
+        [task],
+        record_item_changes(
+            items_model, removed=[row[1:] for row in rows], user_id=task.owner.pk
+        ),
+    )
+    if items_model is TaskItem:
+        DeletionLog.objects.bulk_create(
+            DeletionLog(user_id=task.owner.pk, model=DeletionLog.ModelChoices.ITEM, object_id=pk)
+            for pk in item_ids
+        )
+
+
+def current_week() -> tuple:
+    """Понедельник и воскресенье текущей недели."""
+    today = timezone.localdate()
+    start = today - timedelta(days=today.weekday())
+    return start, start + timedelta(days=6)
+
+
+def collect_agenda(user, start: date, end: date) -> dict:
+    """Подзадачи пользователя с плановой датой в ``[start, end]`` по дням.
+
+    Один проход по индексу ``taskitem_user_planned_idx`` в порядке дат, так
+    что цена зависит от числа подзадач в окне, а не от размера аккаунта.
+    Дни без подзадач в ответ не попадают.
+    """
+    rows = (
+        TaskItem.objects.filter(user=user, planned_date__range=(start, end))
+        .order_by("planned_date", "id")
+        .values("id", "task_id", "name", "status", "planned_date", task_name=F("task__name"))
+    )
+
+    days = []
+    for row in rows:
+        planned_date = row.pop("planned_date")
+        if not days or days[-1]["date"] != planned_date:
+            counts = dict.fromkeys(AbstractTaskItem.StatusChoices.values, 0)
+            days.append({"date": planned_date, "counts": counts, "items": []})
+        days[-1]["counts"][row["status"]] += 1
+        days[-1]["items"].append(row)
+    return {"from": start, "to": end, "days": days}
+
+
+def collect_task_stats(user) -> dict:
+    """Сводка подзадач пользователя одним запросом по ``TaskStats``.
+
+    Строк в сводке не больше, чем различных плановых дат у подзадач в работе,
+    так что цена не зависит от числа подзадач.
+    """
+    today = timezone.localdate()
+    process = TaskItem.StatusChoices.IN_PROCESS
+    totals = TaskStats.objects.filter(user=user).aggregate(
+        overdue=Sum("count", filter=Q(status=process, planned_date__lt=today), default=0),
+        due_today=Sum("count", filter=Q(status=process, planned_date=today), default=0),
+        **{
+            f"status_{status}": Sum("count", filter=Q(status=status), default=0)
+            for status in TaskItem.StatusChoices.values
+        },
+    )
+    by_status = {
+        status: totals[f"status_{status}"] for status in TaskItem.StatusChoices.values
+    }
+    total = sum(by_status.values())
+    completed = by_status[TaskItem.StatusChoices.COMPLETED]
+    return {
+        "total": total,
+        "by_status": by_status,
+        "overdue": totals["overdue"],
+        "due_today": totals["due_today"],
+        "completion_ratio": round(completed / total, 4) if total else 0.0,
+    }
+
+
+def reconcile_user_stats(user_ids) -> int:
+    """Пересчитывает сводку пользователей по подзадачам и чинит расхождения.
+
+    Строки сводки блокируются на время пересчёта, параллельные записи
+    подзадач досчитают свои изменения поверх. Возвращает число исправленных строк.
+    """
+    with transaction.atomic():
+        stored = Counter(
+            {
+                (user_id, status, planned_date): count
+                for user_id, status, planned_date, count in TaskStats.objects.filter(
+                    user_id__in=user_ids
+                )
+                .select_for_update()
+                .values_list("user_id", "status", "planned_date", "count")
+            }
+        )
+        actual = Counter()
+        for user_id, status, planned_date, count in (
+            TaskItem.objects.filter(task__user_id__in=user_ids)
+            .values("task__user_id", "status", "planned_date")
+            .annotate(count=Count("id"))
+            .order_by()
+            .values_list("task__user_id", "status", "planned_date", "count")
+        ):
+            actual[stats_key(user_id, status, planned_date)] += count
+
+        drift = Counter(
+            {key: actual[key] - stored[key] for key in stored.keys() | actual.keys()}
+        )
+        apply_item_stats(drift)
+        TaskStats.objects.filter(user_id__in=user_ids, count=0).delete()
+
+    return sum(1 for count in drift.values() if count)
+
+
+def items_search_text():
+    """Названия и описания подзадач задачи ``OuterRef("pk")`` одной строкой."""
+    return Coalesce(
+        Subquery(
+            TaskItem.objects.filter(task=OuterRef("pk"))
+            .order_by()
+            .values("task")
+            .annotate(
+                text=StringAgg(
+                    Concat("name", Value(" "), "description", output_field=TextField()),
+                    " ",
+                    order_by="id",
+                )
+            )
+            .values("text")
+        ),
+        Value(""),
+        output_field=TextField(),
+    )
+
+
+def search_vector() -> SearchVector:
+    """Поисковый вектор задачи: название (вес A), описание (B) и подзадачи (C)."""
+    config = settings.SEARCH_CONFIG
+    return (
+        SearchVector("name", weight="A", config=config)
+        + SearchVector("description", weight="B", config=config)
+        + SearchVector(items_search_text(), weight="C", config=config)
+    )
+
+
+def refresh_search_vectors(task_ids) -> None:
+    """Пересобирает ``Tasks.search_vector`` у задач одним UPDATE.
+
+    Вызывается на путях записи названий и описаний мимо ``save()``/``delete()``,
+    остальное ловят сигналы.
+    """
+    task_ids = sorted(set(task_ids))
+    if task_ids:
+        Tasks.objects.filter(pk__in=task_ids).update(search_vector=search_vector())
+
+
+class ExpiredChangesToken(Exception):
+    """Курсор старше журнала удалений, нужна полная синхронизация."""
+
+
+def make_changes_token(moment) -> str:
+    return signing.dumps(moment.isoformat(), salt=CHANGES_SALT)
+
+
+def read_changes_token(token: str):
+    """Момент из курсора ``/tasks/changes``; ``ValueError`` для чужого курсора."""
+    try:
+        moment = parse_datetime(signing.loads(token, salt=CHANGES_SALT))
+    except (signing.BadSignature, TypeError):
+        moment = None
+    if moment is None:
+        raise ValueError(token)
+
+    retention = timedelta(days=settings.DELETION_LOG_RETENTION_DAYS)
+    if moment < timezone.now() - retention:
+        raise ExpiredChangesToken(token)
+    return moment
+
+
+def collect_changes(user, since=None) -> dict:
+    """Задачи, подзадачи и теги пользователя, изменённые после ``since``.
+
+    Без ``since`` возвращается всё и без удалений — это первая синхронизация.
+    Каждая выборка идёт по индексу ``(владелец, updated_at)``, так что цена
+    зависит от числа изменений, а не от объёма данных.
+    """
+    started = timezone.now()
+    tasks = Tasks.objects.filter(user=user).order_by("id")
+    items = (
+        TaskItem.objects.filter(task__user=user)
+        .prefetch_related(Prefetch("tags", queryset=Tags.objects.only("id")))
+        .order_by("id")
+    )
+    tags = Tags.objects.filter(user=user).order_by("id")
+    deleted = {"tasks": [], "items": [], "tags": []}
+    deleted_keys = {
+        DeletionLog.ModelChoices.TASK: "tasks",
+        DeletionLog.ModelChoices.ITEM: "items",
+        DeletionLog.ModelChoices.TAG: "tags",
+    }
+
+    if since is not None:
+        tasks = tasks.filter(updated_at__gt=since)
+        items = items.filter(updated_at__gt=since)
+        tags = tags.filter(updated_at__gt=since)
+        for model, object_id in DeletionLog.objects.filter(
+            user=user, deleted_at__gt=since
+        ).values_list("model", "object_id"):
+            deleted[deleted_keys[model]].append(object_id)
+
+    return {
+        "tasks": tasks,
+        "items": items,
+        "tags": tags,
+        "deleted": deleted,
+        "since": make_changes_token(started - CHANGES_OVERLAP),
+    }
@@ -0,0 +1,255 @@
+from django.contrib.auth import get_user_model
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from tasks.models import DeletionLog, Tags, TaskItem, Tasks, TemplateTaskItem, TemplateTasks
+from tasks.services import (apply_item_stats, item_bucket, item_stats_delta, record_item_changes,
+                            refresh_search_vectors, refresh_tag_ids, remove_tag_ids, tag_resolver,
+                            tags_cache, tasks_cache, template_cache, touch_tasks)
+
+
+@receiver(post_save, sender=Tags)
+def remember_tag(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: tag_resolver.add(instance))
+    else:
+        tag_resolver.invalidate(instance.user_id)
+        invalidate_tag_templates(sender, instance)
+        touch_tag_tasks(sender, instance)
+
+
+@receiver(post_delete, sender=Tags)
+def forget_tag(sender, instance, **kwargs):
+    tag_resolver.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=Tags)
+@receiver(post_delete, sender=Tags)
+@receiver(post_save, sender=Tasks)
+@receiver(post_delete, sender=Tasks)
+def invalidate_user_tasks(sender, instance, **kwargs):
+    tasks_cache.invalidate_on_commit(instance.user_id)
+
+
+@receiver(post_save, sender=Tags)
+@receiver(post_delete, sender=Tags)
+def invalidate_user_tags(sender, instance, **kwargs):
+    tags_cache.invalidate_on_commit(instance.user_id)
+
+
+def origin_model(origin):
+    """Модель, с которой началось удаление: ``origin`` — объект или QuerySet."""
+    return type(origin) if isinstance(origin, models.Model) else getattr(origin, "model", None)
+
+
+def task_owner_id(item):
+    if TaskItem.task.is_cached(item):
+        return item.task.user_id
+    return Tasks.objects.filter(pk=item.task_id).values_list("user_id", flat=True).first()
+
+
+@receiver(post_save, sender=TaskItem)
+@receiver(post_delete, sender=TaskItem)
+def invalidate_task_item(sender, instance, origin=None, **kwargs):
+    # при каскадном удалении задачи или пользователя хватает их сигналов
+    if origin_model(origin) in (Tasks, get_user_model()):
+        return
+    touch_tasks(Tasks.objects.filter(pk=instance.task_id))
+    tasks_cache.invalidate_on_commit(task_owner_id(instance))
+
+
+@receiver(pre_save, sender=TaskItem)
+@receiver(pre_save, sender=TemplateTaskItem)
+def remember_item_bucket(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and not {"task", "status", "planned_date"} & set(update_fields):
+        return
+    instance._loaded_bucket = (
+        sender.objects.filter(pk=instance.pk)
+        .values_list("task_id", "status", "planned_date")
+        .first()
+    )
+
+
+@receiver(post_save, sender=Tasks)
+def refresh_task_search(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    if created or update_fields is None or {"name", "description"} & set(update_fields):
+        refresh_search_vectors([instance.pk])
+
+
+@receiver(post_save, sender=TaskItem)
+def refresh_item_search(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    # подключён раньше count_saved_item: тот сбрасывает _loaded_bucket,
+    # а по нему видно, из какой задачи подзадачу перенесли
+    if raw:
+        return
+    if not created and update_fields is not None and not (
+        {"task", "name", "description"} & set(update_fields)
+    ):
+        return
+    before = getattr(instance, "_loaded_bucket", None)
+    refresh_search_vectors([instance.task_id, *(before[:1] if before else ())])
+
+
+@receiver(post_delete, sender=TaskItem)
+def refresh_deleted_item_search(sender, instance, origin=None, **kwargs):
+    if origin_model(origin) in (Tasks, get_user_model()):
+        return
+    refresh_search_vectors([instance.task_id])
+
+
+def item_user_id(sender, instance):
+    return task_owner_id(instance) if sender is TaskItem else None
+
+
+@receiver(post_save, sender=TaskItem)
+@receiver(post_save, sender=TemplateTaskItem)
+def count_saved_item(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, "_loaded_bucket", None)
+    instance._loaded_bucket = None
+    if not created and before is None:
+        return
+    record_item_changes(
+        sender,
+        removed=[before] if before else [],
+        added=[item_bucket(instance)],
+        user_id=item_user_id(sender, instance),
+    )
+
+
+@receiver(post_delete, sender=TaskItem)
+@receiver(post_delete, sender=TemplateTaskItem)
+def count_deleted_item(sender, instance, origin=None, **kwargs):
+    # счётчики удалённой задачи не нужны, а сводку вычитает discount_task_stats
+    if origin_model(origin) in (Tasks, TemplateTasks, get_user_model()):
+        return
+    record_item_changes(
+        sender, removed=[item_bucket(instance)], user_id=item_user_id(sender, instance)
+    )
+
+
+@receiver(pre_delete, sender=Tasks)
+def discount_task_stats(sender, instance, origin=None, **kwargs):
+    # вместе с пользователем удаляется и его сводка
+    if origin_model(origin) is get_user_model():
+        return
+    apply_item_stats(
+        item_stats_delta(
+            instance.user_id,
+            removed=instance.items.values_list("task_id", "status", "planned_date"),
+        )
+    )
+
+
+@receiver(m2m_changed, sender=TaskItem.tags.through)
+def invalidate_task_item_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+
+    if reverse:
+        items = instance.tasks.all() if pk_set is None else TaskItem.objects.filter(pk__in=pk_set)
+        touch_tasks(Tasks.objects.filter(items__in=items))
+        items.update(updated_at=timezone.now())
+        tasks_cache.invalidate_on_commit(instance.user_id)
+    else:
+        touch_tasks(Tasks.objects.filter(pk=instance.task_id))
+        TaskItem.objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+        tasks_cache.invalidate_on_commit(task_owner_id(instance))
+
+
+@receiver(m2m_changed, sender=TaskItem.tags.through)
+@receiver(m2m_changed, sender=TemplateTaskItem.tags.through)
+def sync_item_tag_ids(sender, instance, action, reverse, pk_set, **kwargs):
+    items_model = TaskItem if sender is TaskItem.tags.through else TemplateTaskItem
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            refresh_tag_ids(items_model, [instance.pk])
+    elif action in ("post_add", "post_remove"):
+        refresh_tag_ids(items_model, pk_set)
+    elif action == "pre_clear":
+        # после очистки связей уже не узнать, у каких подзадач был тег
+        remove_tag_ids(instance.pk, [items_model])
+
+
+@receiver(pre_delete, sender=Tags)
+def forget_deleted_tag_ids(sender, instance, origin=None, **kwargs):
+    # связи удаляются каскадом, m2m_changed при этом не отправляется
+    if origin_model(origin) is get_user_model():
+        return
+    remove_tag_ids(instance.pk)
+
+
+@receiver(pre_delete, sender=Tags)
+def touch_tag_tasks(sender, instance, **kwargs):
+    touch_tasks(Tasks.objects.filter(items__tags=instance))
+
+
+@receiver(pre_delete, sender=Tags)
+def touch_tag_items(sender, instance, **kwargs):
+    """У подзадач пропадает тег, ``/tasks/changes`` должен их вернуть."""
+    TaskItem.objects.filter(tags=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Tasks)
+@receiver(post_delete, sender=TaskItem)
+@receiver(post_delete, sender=Tags)
+def log_deletion(sender, instance, origin=None, **kwargs):
+    # вместе с пользователем удаляется и журнал, а подзадачи удалённой
+    # задачи клиент удалит сам по её надгробию
+    started_by = origin_model(origin)
+    if started_by is get_user_model() or (sender is TaskItem and started_by is Tasks):
+        return
+
+    if sender is TaskItem:
+        model, user_id = DeletionLog.ModelChoices.ITEM, task_owner_id(instance)
+    elif sender is Tasks:
+        model, user_id = DeletionLog.ModelChoices.TASK, instance.user_id
+    else:
+        model, user_id = DeletionLog.ModelChoices.TAG, instance.user_id
+    DeletionLog.objects.create(user_id=user_id, model=model, object_id=instance.pk)
+
+
+@receiver(pre_delete, sender=Tags)
+def invalidate_tag_templates(sender, instance, **kwargs):
+    """Шаблоны, в подзадачах которых есть тег, показывают его имя."""
+    template_ids = set(
+        TemplateTaskItem.objects.filter(tags=instance).values_list("task_id", flat=True)
+    )
+    if template_ids:
+        template_cache.invalidate_on_commit(*template_ids)
+
+
+@receiver(post_save, sender=TemplateTasks)
+@receiver(post_delete, sender=TemplateTasks)
+def invalidate_template(sender, instance, **kwargs):
+    template_cache.invalidate_on_commit(instance.pk, "list")
+
+
+@receiver(post_save, sender=TemplateTaskItem)
+@receiver(post_delete, sender=TemplateTaskItem)
+def invalidate_template_item(sender, instance, **kwargs):
+    template_cache.invalidate_on_commit(instance.task_id, "list")
+
+
+@receiver(m2m_changed, sender=TemplateTaskItem.tags.through)
+def invalidate_template_item_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+
+    if not reverse:
+        template_cache.invalidate_on_commit(instance.task_id)
+        return
+
+    items = TemplateTaskItem.objects.filter(tags=instance)
+    if pk_set is not None:
+        items = TemplateTaskItem.objects.filter(pk__in=pk_set)
+    template_ids = set(items.values_list("task_id", flat=True))
+    if template_ids:
+        template_cache.invalidate_on_commit(*template_ids)
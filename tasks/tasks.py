@@ -0,0 +1,82 @@
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from silk.models import Request, Response, SQLQuery
+
+from tasks.models import DeletionLog
+from tasks.services import reconcile_user_stats
+
+logger = logging.getLogger("trackit.task_stats")
+
+
+@shared_task
+def flush_profiles(records):
+    """Записывает пачку профилей из ``SampledProfilingMiddleware`` в таблицы silk."""
+    requests, responses, queries = [], [], []
+    for record in records:
+        start_time = parse_datetime(record["start_time"])
+        request = Request(
+            id=record["id"],
+            path=record["path"][:190],
+            method=record["method"],
+            query_params=record["query_params"],
+            view_name=record["view_name"][:190],
+            start_time=start_time,
+            end_time=start_time + timedelta(milliseconds=record["time_taken"]),
+            time_taken=record["time_taken"],
+            num_sql_queries=len(record["queries"]),
+        )
+        requests.append(request)
+        responses.append(Response(request=request, status_code=record["status_code"]))
+        for query in record["queries"]:
+            query_start = parse_datetime(query["start_time"])
+            queries.append(
+                SQLQuery(
+                    request=request,
+                    query=query["query"],
+                    start_time=query_start,
+                    end_time=query_start + timedelta(milliseconds=query["time_taken"]),
+                    time_taken=query["time_taken"],
+                    traceback="",
+                )
+            )
+
+    with transaction.atomic():
+        Request.objects.bulk_create(requests)
+        Response.objects.bulk_create(responses)
+        # менеджер SQLQuery на каждую запись делает UPDATE счётчика запроса
+        SQLQuery._base_manager.bulk_create(queries)
+    Request.garbage_collect()
+
+
+@shared_task
+def prune_deletion_log():
+    """Удаляет надгробия старше ``DELETION_LOG_RETENTION_DAYS``.
+
+    Курсоры ``/tasks/changes`` старше этого срока отклоняются с 410.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.DELETION_LOG_RETENTION_DAYS)
+    DeletionLog.objects.filter(deleted_at__lt=cutoff).delete()
+
+
+@shared_task
+def reconcile_task_stats(batch_size=500):
+    """Сверяет сводку ``TaskStats`` с подзадачами пачками пользователей.
+
+    Возвращает число исправленных строк сводки.
+    """
+    users = get_user_model().objects.order_by("pk").values_list("pk", flat=True)
+    repaired, last_id = 0, 0
+    while user_ids := list(users.filter(pk__gt=last_id)[:batch_size]):
+        repaired += reconcile_user_stats(user_ids)
+        last_id = user_ids[-1]
+
+    if repaired:
+        logger.warning("task stats drift: repaired %s rows", repaired)
+    return repaired
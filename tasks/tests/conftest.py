@@ -5,6 +5,7 @@ from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient
 
 from tasks.models import Tasks
+from tasks.services import tag_resolver
 
 
 @pytest.fixture
@@ -34,9 +35,17 @@ def tag2():
 @pytest.fixture(autouse=True)
 def mock_redis(monkeypatch):
     fake_redis = MagicMock()
-    monkeypatch.setattr("tasks.views.get_redis_connection", fake_redis)
+    monkeypatch.setattr("tasks.services.get_redis_connection", fake_redis)
+    tag_resolver.clear()
     yield fake_redis
 
+@pytest.fixture(autouse=True)
+def locmem_cache(settings):
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
+
+
 @pytest.fixture
 def task_data(tag1, tag2):
     data = {
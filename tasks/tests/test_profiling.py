@@ -0,0 +1,223 @@
+import atexit
+import pstats
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import CommandError, call_command
+from django.test import AsyncClient
+from rest_framework_simplejwt.tokens import AccessToken
+from silk.models import Request, SQLQuery
+
+from tasks.factory import TemplateTaskFactory
+from tasks.middleware import ProfileBuffer, SampledProfilingMiddleware
+from tasks.profiling import list_captures, make_token
+
+
+@pytest.fixture
+def profiling(settings):
+    settings.PROFILING_ENABLED = True
+    settings.PROFILING_SAMPLE_RATE = 1.0
+    settings.PROFILING_SLOW_REQUEST_MS = 10_000
+    settings.PROFILING_BUFFER_SIZE = 10
+    settings.PROFILING_BATCH_SIZE = 1
+    settings.PROFILING_FLUSH_INTERVAL = 60
+    return settings
+
+
+@pytest.fixture
+def auth_client(user, api_client):
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+    return api_client
+
+
+@pytest.mark.django_db
+class TestSampledProfiling:
+    def test_disabled_middleware_is_not_used(self, settings):
+        settings.PROFILING_ENABLED = False
+
+        with pytest.raises(MiddlewareNotUsed):
+            SampledProfilingMiddleware(lambda request: None)
+
+    def test_buffer_is_flushed_at_exit(self, profiling, monkeypatch):
+        registered = []
+        monkeypatch.setattr(atexit, "register", registered.append)
+
+        middleware = SampledProfilingMiddleware(lambda request: None)
+
+        assert registered == [middleware.buffer.flush]
+
+    def test_sampled_request_is_flushed(self, profiling, auth_client):
+        response = auth_client.get("/api/v1/tasks/?search=x")
+
+        assert response.status_code == 200
+        request = Request.objects.get()
+        assert request.path == "/api/v1/tasks/"
+        assert request.query_params == "search=x"
+        assert request.view_name == "task:task-list"
+        assert request.response.status_code == 200
+        assert request.num_sql_queries == SQLQuery.objects.filter(request=request).count() > 0
+
+    def test_sampled_request_under_asgi(self, profiling, user):
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(user)}"}
+
+        response = async_to_sync(AsyncClient().get)("/api/v1/tasks/", headers=headers)
+
+        assert response.status_code == 200
+        request = Request.objects.get()
+        assert request.view_name == "task:task-list"
+        assert request.num_sql_queries == SQLQuery.objects.filter(request=request).count() > 0
+
+    def test_not_sampled_request_is_skipped(self, profiling, auth_client):
+        profiling.PROFILING_SAMPLE_RATE = 0
+
+        auth_client.get("/api/v1/tasks/")
+
+        assert not Request.objects.exists()
+
+    def test_slow_request_is_always_captured(self, profiling, auth_client):
+        profiling.PROFILING_SAMPLE_RATE = 0
+        profiling.PROFILING_SLOW_REQUEST_MS = 0
+
+        auth_client.get("/api/v1/tasks/")
+
+        assert Request.objects.count() == 1
+
+    def test_records_are_batched(self, profiling, auth_client):
+        profiling.PROFILING_BATCH_SIZE = 3
+
+        for _ in range(2):
+            auth_client.get("/api/v1/tasks/")
+        assert not Request.objects.exists()
+
+        auth_client.get("/api/v1/tasks/")
+        assert Request.objects.count() == 3
+
+
+class TestProfileBuffer:
+    def test_buffer_is_bounded(self):
+        buffer = ProfileBuffer(maxlen=2, batch_size=10, flush_interval=60)
+
+        with patch.object(buffer, "send") as send:
+            for i in range(3):
+                buffer.add({"id": i})
+
+        send.assert_not_called()
+        assert list(buffer.records) == [{"id": 1}, {"id": 2}]
+        assert buffer.dropped == 1
+
+    def test_flush_interval(self):
+        buffer = ProfileBuffer(maxlen=10, batch_size=10, flush_interval=0)
+
+        with patch.object(buffer, "send") as send:
+            buffer.add({"id": 1})
+
+        send.assert_called_once_with([{"id": 1}])
+        assert not buffer.records
+
+    def test_flush_drains_in_batches(self):
+        buffer = ProfileBuffer(maxlen=10, batch_size=2, flush_interval=60)
+        buffer.records.extend({"id": i} for i in range(5))
+
+        with patch.object(buffer, "send") as send:
+            buffer.flush()
+
+        assert [len(call.args[0]) for call in send.call_args_list] == [2, 2, 1]
+
+
+@pytest.fixture
+def capture_dir(settings, tmp_path):
+    settings.PROFILING_CAPTURE_DIR = tmp_path
+    return tmp_path
+
+
+def captured_functions(path) -> set:
+    return {function for _, _, function in pstats.Stats(str(path)).stats}
+
+
+def profiles(*args):
+    output = StringIO()
+    call_command("profiles", *args, stdout=output)
+    return output.getvalue()
+
+
+@pytest.mark.django_db
+class TestProfileCapture:
+    def test_capture_by_header(self, capture_dir, user, auth_client):
+        template = TemplateTaskFactory(created_by=user, items=[{}] * 3)
+
+        response = auth_client.get(
+            f"/api/v1/template/{template.id}/", HTTP_X_PROFILE=make_token()
+        )
+
+        assert response.status_code == 200
+        name = response["X-Profile-Capture"]
+        assert (capture_dir / name).is_file()
+        assert name in profiles("list")
+        assert "cumulative" in profiles("show", name)
+
+    def test_capture_by_query_param(self, capture_dir, auth_client, task_data):
+        data, _ = task_data
+
+        response = auth_client.post(
+            f"/api/v1/tasks/?_profile={make_token()}", data, format="json"
+        )
+
+        assert response.status_code == 201
+        assert "X-Profile-Capture" in response
+
+    def test_capture_under_asgi_includes_sync_view(self, capture_dir, user, task_data):
+        data, _ = task_data
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(user)}", "X-Profile": make_token()}
+
+        response = async_to_sync(AsyncClient().post)(
+            "/api/v1/tasks/", data, content_type="application/json", headers=headers
+        )
+
+        assert response.status_code == 201
+        functions = captured_functions(capture_dir / response["X-Profile-Capture"])
+        assert {"create_task", "resolve_many", "bulk_create"} <= functions
+
+    def test_capture_under_asgi_includes_async_orm(self, capture_dir, user):
+        template = TemplateTaskFactory(created_by=user, items=[{}] * 3)
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(user)}", "X-Profile": make_token()}
+
+        response = async_to_sync(AsyncClient().get)(f"/api/v1/template/{template.id}/", headers=headers)
+
+        assert response.status_code == 200
+        functions = captured_functions(capture_dir / response["X-Profile-Capture"])
+        assert {"aretrieve", "filter_items_by_tags", "execute"} <= functions
+
+    def test_invalid_token_is_ignored(self, capture_dir, auth_client):
+        response = auth_client.get("/api/v1/tasks/", HTTP_X_PROFILE="подделка")
+
+        assert "X-Profile-Capture" not in response
+        assert not list(capture_dir.iterdir())
+
+    def test_show_dot(self, capture_dir, auth_client):
+        name = auth_client.get("/api/v1/tasks/", HTTP_X_PROFILE=make_token())["X-Profile-Capture"]
+
+        assert profiles("show", name, "--format", "dot").startswith("digraph")
+
+    def test_old_captures_are_pruned_on_save(self, settings, capture_dir, auth_client):
+        settings.PROFILING_CAPTURE_KEEP = 2
+        old = ["20000101T000000000000-GET-old.prof", "20000102T000000000000-GET-old.prof"]
+        for name in old:
+            (capture_dir / name).touch()
+
+        name = auth_client.get("/api/v1/tasks/", HTTP_X_PROFILE=make_token())["X-Profile-Capture"]
+
+        assert sorted(path.name for path in capture_dir.iterdir()) == [old[1], name]
+
+    def test_prune(self, capture_dir):
+        for day in range(1, 6):
+            (capture_dir / f"2000010{day}T000000000000-GET-old.prof").touch()
+
+        assert profiles("prune", "--keep", "3") == "Удалено профилей: 2\n"
+        assert [path.name[:8] for path in list_captures()] == ["20000105", "20000104", "20000103"]
+
+    def test_show_unknown(self, capture_dir):
+        with pytest.raises(CommandError):
+            profiles("show", "нет.prof")
@@ -0,0 +1,229 @@
+import logging
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import AccessToken
+
+from tasks.factory import TemplateTaskFactory
+from tasks.middleware import VIOLATIONS_KEY, fingerprint
+from tasks.models import Tags, TaskItem
+from tasks.services import tag_resolver
+from tasks.views import (TagsListCreateAPIView, TaskItemRetrieveUpdateDestroyAPIView,
+                         TemplateTaskItemRetrieveUpdateDestroyAPIView, TemplateTaskViewSet,
+                         ViewSetTasks)
+from user.factory import TaskFactory
+
+SIZES = (2, 5, 25)
+
+
+def seed(user, size, tag_names):
+    """``size`` задач по ``size`` подзадач с тегами и шаблон на ``size`` подзадач."""
+    tags = [Tags.objects.create(name=f"{name}-{size}", user=user) for name in tag_names]
+    tasks = TaskFactory.create_batch(size, user=user, items=[{}] * size)
+    template = TemplateTaskFactory(created_by=user, items=[{}] * size)
+    for item in [*TaskItem.objects.filter(task__in=tasks), *template.items.all()]:
+        item.tags.set(tags)
+    task = tasks[0]
+    return {
+        "size": size,
+        "task": task,
+        "items": list(task.items.order_by("id")),
+        "template": template,
+        "template_items": list(template.items.order_by("id")),
+    }
+
+
+def items_payload(s):
+    return [
+        {"id": item.id, "name": "п", "status": "completed", "tags_input": [f"новый-{s['size']}"]}
+        for item in s["items"]
+    ] + [{"name": "новая", "tags_input": [f"ещё один-{s['size']}"]}]
+
+
+CASES = [
+    (ViewSetTasks, "list", "get", lambda s: "/api/v1/tasks/", None),
+    (ViewSetTasks, "retrieve", "get", lambda s: f"/api/v1/tasks/{s['task'].id}/", None),
+    (
+        ViewSetTasks,
+        "create",
+        "post",
+        lambda s: "/api/v1/tasks/",
+        lambda s: {"name": "новая", "items": items_payload(s)},
+    ),
+    (
+        ViewSetTasks,
+        "partial_update",
+        "patch",
+        lambda s: f"/api/v1/tasks/{s['task'].id}/",
+        lambda s: {"items": items_payload(s)},
+    ),
+    (
+        ViewSetTasks,
+        "update",
+        "put",
+        lambda s: f"/api/v1/tasks/{s['task'].id}/",
+        {"name": "без подзадач", "description": "", "items": []},
+    ),
+    (ViewSetTasks, "destroy", "delete", lambda s: f"/api/v1/tasks/{s['task'].id}/", None),
+    (
+        ViewSetTasks,
+        "update_status",
+        "post",
+        lambda s: f"/api/v1/tasks/{s['task'].id}/update_status/",
+        lambda s: {
+            "updates": [
+                {"id": item.id, "status": ("completed", "process")[i % 2]}
+                for i, item in enumerate(s["items"])
+            ]
+        },
+    ),
+    (ViewSetTasks, "changes", "get", lambda s: "/api/v1/tasks/changes/", None),
+    (ViewSetTasks, "stats", "get", lambda s: "/api/v1/tasks/stats/", None),
+    (
+        ViewSetTasks,
+        "agenda",
+        "get",
+        lambda s: "/api/v1/tasks/agenda/?from=2000-01-01&to=2000-02-15",
+        None,
+    ),
+    (
+        ViewSetTasks,
+        "bulk_status",
+        "post",
+        lambda s: "/api/v1/tasks/bulk_status/",
+        lambda s: {
+            "updates": [
+                {"id": item.id, "status": ("completed", "process")[i % 2]}
+                for i, item in enumerate(s["items"])
+            ]
+        },
+    ),
+    (
+        TaskItemRetrieveUpdateDestroyAPIView,
+        "get",
+        "get",
+        lambda s: f"/api/v1/tasks/{s['task'].id}/items/{s['items'][0].id}/",
+        None,
+    ),
+    (
+        TaskItemRetrieveUpdateDestroyAPIView,
+        "patch",
+        "patch",
+        lambda s: f"/api/v1/tasks/{s['task'].id}/items/{s['items'][0].id}/",
+        lambda s: {"name": "п", "tags_input": [f"новый-{s['size']}"]},
+    ),
+    (TagsListCreateAPIView, "get", "get", lambda s: "/api/v1/tasks/tags/", None),
+    (TemplateTaskViewSet, "list", "get", lambda s: "/api/v1/template/", None),
+    (
+        TemplateTaskViewSet,
+        "retrieve",
+        "get",
+        lambda s: f"/api/v1/template/{s['template'].id}/",
+        None,
+    ),
+    (
+        TemplateTaskViewSet,
+        "create_from_template",
+        "post",
+        lambda s: f"/api/v1/template/{s['template'].id}/create_from_template/",
+        {"count": 3},
+    ),
+    (
+        TemplateTaskViewSet,
+        "update",
+        "put",
+        lambda s: f"/api/v1/template/{s['template'].id}/",
+        {"name": "без подзадач", "description": "", "items": []},
+    ),
+    (
+        TemplateTaskViewSet,
+        "destroy",
+        "delete",
+        lambda s: f"/api/v1/template/{s['template'].id}/",
+        None,
+    ),
+    (
+        TemplateTaskItemRetrieveUpdateDestroyAPIView,
+        "patch",
+        "patch",
+        lambda s: f"/api/v1/template/{s['template'].id}/items/{s['template_items'][0].id}/",
+        lambda s: {"name": "п", "tags_input": [f"новый-{s['size']}"]},
+    ),
+]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "view, action, method, url, data",
+    CASES,
+    ids=[f"{case[0].__name__}.{case[1]}" for case in CASES],
+)
+def test_query_budget(user, api_client, tag1, tag2, view, action, method, url, data):
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+    budget = view.query_budget[action]
+    query_counts = []
+
+    for size in SIZES:
+        s = seed(user, size, [tag1, tag2])
+        payload = data(s) if callable(data) else data
+        cache.clear()
+        tag_resolver.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(api_client, method)(url(s), payload, format="json")
+        assert response.status_code < 400, response.data
+        query_counts.append(
+            sum(
+                1
+                for query in ctx.captured_queries
+                if "silk_" not in query["sql"]
+                and not query["sql"].startswith(("EXPLAIN", "SAVEPOINT", "RELEASE SAVEPOINT"))
+            )
+        )
+
+    assert max(query_counts) <= budget, query_counts
+    assert len(set(query_counts)) == 1, query_counts
+
+
+def test_fingerprint():
+    assert fingerprint(
+        "SELECT * FROM t WHERE a = 'x' AND id IN (1, 2, 3) AND b = %s"
+    ) == fingerprint("SELECT * FROM t WHERE a = 'yy' AND id IN (4, 5) AND b = %s")
+
+
+@pytest.mark.django_db
+def test_middleware_reports_violation(user, api_client, monkeypatch, caplog):
+    monkeypatch.setattr(ViewSetTasks, "query_budget", {"list": 1})
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+    with caplog.at_level(logging.WARNING, logger="trackit.query_budget"):
+        response = api_client.get("/api/v1/tasks/")
+
+    assert response.status_code == 200
+    assert "ViewSetTasks.list made 3 queries (budget 1)" in caplog.text
+    assert cache.get(VIOLATIONS_KEY.format(view="ViewSetTasks.list")) == 1
+
+
+@pytest.mark.django_db
+def test_middleware_reports_violation_under_asgi(user, monkeypatch, caplog):
+    monkeypatch.setattr(ViewSetTasks, "query_budget", {"list": 1})
+    headers = {"Authorization": f"Bearer {AccessToken.for_user(user)}"}
+
+    with caplog.at_level(logging.WARNING, logger="trackit.query_budget"):
+        response = async_to_sync(AsyncClient().get)("/api/v1/tasks/", headers=headers)
+
+    assert response.status_code == 200
+    assert "ViewSetTasks.list made 3 queries (budget 1)" in caplog.text
+
+
+@pytest.mark.django_db
+def test_middleware_quiet_within_budget(user, api_client, caplog):
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+    with caplog.at_level(logging.WARNING, logger="trackit.query_budget"):
+        api_client.get("/api/v1/tasks/")
+
+    assert not caplog.records
@@ -0,0 +1,253 @@
+"""Регрессия планов запросов для всех эндпоинтов tasks/.
+
+Каждый запрос, который отправляет view, прогоняется через ``EXPLAIN`` с
+выключенным ``enable_seqscan``: на маленьких тестовых таблицах Postgres и так
+предпочтёт seq scan, а с таким штрафом seq scan останется в плане только если
+подходящего индекса нет вовсе.
+"""
+import json
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from tasks.factory import TemplateTaskFactory
+from tasks.models import Tags, TaskItem
+from tasks.services import make_changes_token
+from user.factory import TaskFactory, UserFactory
+
+LARGE_TABLES = {
+    "tasks_tasks",
+    "tasks_taskitem",
+    "tasks_taskitem_tags",
+    "tasks_tags",
+    "tasks_templatetaskitem",
+    "tasks_templatetaskitem_tags",
+    "tasks_deletionlog",
+    "tasks_taskstats",
+}
+QUERY_COST_BUDGET = 1000
+EXPLAINABLE = ("SELECT", "UPDATE", "DELETE")
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+        plan = cursor.fetchone()[0]
+        cursor.execute("SET LOCAL enable_seqscan = on")
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def explainable(ctx):
+    return [
+        query["sql"]
+        for query in ctx.captured_queries
+        if "silk_" not in query["sql"] and query["sql"].startswith(EXPLAINABLE)
+    ]
+
+
+def plan_problems(sql):
+    plan = explain(sql)
+    problems = [
+        f"Seq Scan on {node['Relation Name']}"
+        for node in plan_nodes(plan)
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in LARGE_TABLES
+    ]
+    if plan["Total Cost"] > QUERY_COST_BUDGET:
+        problems.append(f"cost {plan['Total Cost']} > {QUERY_COST_BUDGET}")
+    return problems
+
+
+@pytest.fixture
+def seeded(db, user, tag1, tag2):
+    tags = [Tags.objects.create(name=name, user=user) for name in (tag1, tag2)]
+    tasks = [
+        TaskFactory(user=user, items=[{"status": status} for status in ("process", "completed") * 3])
+        for _ in range(10)
+    ]
+    for task in TaskFactory.create_batch(20, user=UserFactory()):
+        TaskItem.objects.bulk_create([TaskItem(task=task, name="чужая") for _ in range(5)])
+    for item in TaskItem.objects.filter(task__user=user):
+        item.tags.set(tags)
+    template = TemplateTaskFactory(created_by=user, items=[{}] * 5)
+    for item in template.items.all():
+        item.tags.set(tags)
+
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+    return {
+        "task": tasks[0],
+        "item": tasks[0].items.order_by("id").first(),
+        "template": template,
+        "template_item": template.items.order_by("id").first(),
+    }
+
+
+ENDPOINTS = [
+    ("tasks-list", "get", lambda s: "/api/v1/tasks/", None),
+    ("tasks-list-search", "get", lambda s: "/api/v1/tasks/?search=a&ordering=name", None),
+    ("tasks-list-search-rank", "get", lambda s: "/api/v1/tasks/?search=market or water", None),
+    ("tasks-list-progress", "get", lambda s: "/api/v1/tasks/?ordering=-progress", None),
+    ("tasks-retrieve", "get", lambda s: f"/api/v1/tasks/{s['task'].id}/", None),
+    (
+        "tasks-create",
+        "post",
+        lambda s: "/api/v1/tasks/",
+        {"name": "новая", "items": [{"name": "п", "tags_input": ["тег1", "новый"]}]},
+    ),
+    (
+        "tasks-update",
+        "patch",
+        lambda s: f"/api/v1/tasks/{s['task'].id}/",
+        lambda s: {"items": [{"id": s["item"].id, "name": "п", "tags_input": ["тег2"]}]},
+    ),
+    ("tasks-destroy", "delete", lambda s: f"/api/v1/tasks/{s['task'].id}/", None),
+    (
+        "tasks-changes",
+        "get",
+        lambda s: f"/api/v1/tasks/changes/?since={make_changes_token(s['task'].updated_at)}",
+        None,
+    ),
+    ("tasks-stats", "get", lambda s: "/api/v1/tasks/stats/", None),
+    ("tasks-agenda", "get", lambda s: "/api/v1/tasks/agenda/?from=2000-01-01&to=2000-02-15", None),
+    ("tasks-list-date", "get", lambda s: "/api/v1/tasks/?date=today", None),
+    (
+        "tasks-list-item-filters",
+        "get",
+        lambda s: "/api/v1/tasks/?item_status=process&item_tag=тег1&overdue=false",
+        None,
+    ),
+    (
+        "tasks-list-tags",
+        "get",
+        lambda s: "/api/v1/tasks/?tags_all=тег1,тег2&tags_any=тег2,новый",
+        None,
+    ),
+    (
+        "tasks-retrieve-tags",
+        "get",
+        lambda s: f"/api/v1/tasks/{s['task'].id}/?tags_all=тег1,тег2",
+        None,
+    ),
+    ("tasks-status", "get", lambda s: f"/api/v1/tasks/{s['task'].id}/update_status/", None),
+    (
+        "tasks-status-update",
+        "post",
+        lambda s: f"/api/v1/tasks/{s['task'].id}/update_status/",
+        lambda s: {"updates": [{"id": s["item"].id, "status": "completed"}]},
+    ),
+    (
+        "tasks-bulk-status",
+        "post",
+        lambda s: "/api/v1/tasks/bulk_status/",
+        lambda s: {"updates": [{"id": s["item"].id, "status": "completed"}]},
+    ),
+    (
+        "task-item-retrieve",
+        "get",
+        lambda s: f"/api/v1/tasks/{s['task'].id}/items/{s['item'].id}/",
+        None,
+    ),
+    (
+        "task-item-update",
+        "patch",
+        lambda s: f"/api/v1/tasks/{s['task'].id}/items/{s['item'].id}/",
+        {"name": "п", "tags_input": ["тег1"]},
+    ),
+    (
+        "task-item-destroy",
+        "delete",
+        lambda s: f"/api/v1/tasks/{s['task'].id}/items/{s['item'].id}/",
+        None,
+    ),
+    ("tags-list", "get", lambda s: "/api/v1/tasks/tags/", None),
+    ("tags-autocomplete", "get", lambda s: "/api/v1/tasks/tags/?q=те", None),
+    ("tags-create", "post", lambda s: "/api/v1/tasks/tags/", {"name": "ещё"}),
+    ("template-list", "get", lambda s: "/api/v1/template/", None),
+    ("template-retrieve", "get", lambda s: f"/api/v1/template/{s['template'].id}/", None),
+    (
+        "template-retrieve-tags",
+        "get",
+        lambda s: f"/api/v1/template/{s['template'].id}/?tags_any=тег1",
+        None,
+    ),
+    (
+        "template-update",
+        "patch",
+        lambda s: f"/api/v1/template/{s['template'].id}/",
+        {"name": "шаблон"},
+    ),
+    ("template-destroy", "delete", lambda s: f"/api/v1/template/{s['template'].id}/", None),
+    (
+        "template-create-from",
+        "post",
+        lambda s: f"/api/v1/template/{s['template'].id}/create_from_template/",
+        {"count": 2},
+    ),
+    (
+        "template-item-update",
+        "patch",
+        lambda s: f"/api/v1/template/{s['template'].id}/items/{s['template_item'].id}/",
+        {"name": "п", "tags_input": ["тег2"]},
+    ),
+]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "method, url, data", [endpoint[1:] for endpoint in ENDPOINTS], ids=[e[0] for e in ENDPOINTS]
+)
+def test_query_plans(seeded, user, api_client, method, url, data):
+    api_client.force_authenticate(user)
+    if callable(data):
+        data = data(seeded)
+
+    with CaptureQueriesContext(connection) as ctx:
+        response = getattr(api_client, method)(url(seeded), data, format="json")
+    assert response.status_code < 400, response.data
+
+    problems = {}
+    for sql in explainable(ctx):
+        found = plan_problems(sql)
+        if found:
+            problems[sql] = found
+
+    assert not problems, json.dumps(problems, ensure_ascii=False, indent=2)
+
+
+HOT_QUERIES = [
+    (
+        "items-by-task-status",
+        lambda s: TaskItem.objects.filter(task=s["task"], status="process"),
+    ),
+    (
+        "items-planned-window",
+        lambda s: TaskItem.objects.filter(planned_date__range=("2025-01-01", "2025-01-07")),
+    ),
+    (
+        "items-overdue",
+        lambda s: TaskItem.objects.filter(status="process", planned_date__lt="2025-01-01"),
+    ),
+]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "queryset", [query[1] for query in HOT_QUERIES], ids=[query[0] for query in HOT_QUERIES]
+)
+def test_hot_query_plans(seeded, queryset):
+    with CaptureQueriesContext(connection) as ctx:
+        list(queryset(seeded))
+
+    (sql,) = explainable(ctx)
+    assert not plan_problems(sql)
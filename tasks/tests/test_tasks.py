@@ -1,10 +1,39 @@
-from re import template
-from venv import create
+import asyncio
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+from urllib.parse import quote
 
 import pytest
+import redis
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchQuery
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import TextField
+from django.db.models.functions import Cast
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from redis.exceptions import RedisError
+from rest_framework_simplejwt.tokens import AccessToken
 
 from tasks.factory import UserFactory, TemplateTaskFactory
-from tasks.models import Tags, Tasks, TemplateTasks, TemplateTaskItem
+from user.factory import TaskFactory
+from tasks.admin import TaskAdmin, TaskItemAdmin
+from tasks.models import (DeletionLog, Tags, TaskItem, Tasks, TaskStats, TemplateTasks,
+                          TemplateTaskItem)
+from tasks.serializer import TaskSerializer
+from tasks.services import (TEMPLATE_MAX_COUNT, VersionedCache, create_tasks_from_template,
+                            create_templates_from_tasks, make_changes_token, reconcile_user_stats,
+                            search_vector, tag_resolver, tasks_cache, template_cache)
+from tasks.tasks import prune_deletion_log, reconcile_task_stats
+from tasks.management.commands.serve import Server
+from trackit import server
+from trackit.asgi import ConcurrencyLimit
 
 
 @pytest.mark.django_db
@@ -115,9 +144,9 @@ class TestTasks:
 
         get_response_u = api_client.get("/api/v1/tasks/?search=Задача 1")
 
-        assert len(get_response_u.data) > 0
+        assert len(get_response_u.data["results"]) > 0
         get_response_u = api_client.get("/api/v1/tasks/?search=Задача 2")
-        assert len(get_response_u.data) > 0
+        assert len(get_response_u.data["results"]) > 0
 
     def test_filter_params(self, user, api_client, task_data_many_task):
         api_client.force_authenticate(user)
@@ -133,11 +162,11 @@ class TestTasks:
 
         response = api_client.get("/api/v1/tasks/?ordering=-name")
         assert response.status_code in [200, 201]
-        assert response.data[0]["name"] == "Задача 2"
+        assert response.data["results"][0]["name"] == "Задача 2"
 
         response = api_client.get("/api/v1/tasks/?ordering=name")
         assert response.status_code in [200, 201]
-        assert response.data[0]["name"] == "Задача 1"
+        assert response.data["results"][0]["name"] == "Задача 1"
 
 
 @pytest.mark.django_db
@@ -203,6 +232,2012 @@ class TestTemplateTasks:
         assert TemplateTaskItem.objects.get(id=template_sub_task_id).name != "111"
 
 
+def app_queries(ctx):
+    """Запросы приложения без служебных запросов silk и savepoint'ов."""
+    return [
+        query
+        for query in ctx.captured_queries
+        if "silk_" not in query["sql"]
+        and not query["sql"].startswith(("EXPLAIN", "SAVEPOINT", "RELEASE SAVEPOINT"))
+    ]
 
 
+def data_queries(ctx):
+    """Запросы приложения без запроса валидаторов ETag/Last-Modified."""
+    return [
+        query
+        for query in app_queries(ctx)
+        if '"last_modified"' not in query["sql"]
+        and not query["sql"].startswith('SELECT "tasks_tasks"."updated_at"')
+    ]
 
+
+def make_template(user, items_count, tags=("тег1", "тег2")):
+    template_task = TemplateTaskFactory(created_by=user, items=[{}] * items_count)
+    tag_objs = [Tags.objects.get_or_create(name=name, user=user)[0] for name in tags]
+    for item in template_task.items.all():
+        item.tags.set(tag_objs)
+    return template_task
+
+
+@pytest.mark.django_db
+class TestCreateFromTemplate:
+    def test_copies_items_and_tags(self, user, api_client):
+        template_task = make_template(user, 3)
+        api_client.force_authenticate(user)
+
+        response = api_client.post(f"/api/v1/template/{template_task.id}/create_from_template/")
+        assert response.status_code == 201
+
+        task = Tasks.objects.get(id=response.data["id"])
+        assert task.template_id == template_task.id
+        assert task.items.count() == 3
+        for item in task.items.all():
+            assert sorted(item.tags.values_list("name", flat=True)) == ["тег1", "тег2"]
+
+    def test_count(self, user, api_client):
+        template_task = make_template(user, 2)
+        api_client.force_authenticate(user)
+
+        response = api_client.post(
+            f"/api/v1/template/{template_task.id}/create_from_template/",
+            {"count": 3},
+            format="json",
+        )
+        assert response.status_code == 201
+        assert len(response.data) == 3
+        assert TaskItem.objects.filter(task__user=user).count() == 6
+
+    def test_count_from_form(self, user, api_client):
+        template_task = make_template(user, 2)
+        api_client.force_authenticate(user)
+
+        response = api_client.post(
+            f"/api/v1/template/{template_task.id}/create_from_template/", {"count": "3"}
+        )
+        assert response.status_code == 201
+        assert len(response.data) == 3
+
+    def test_explicit_count_returns_list(self, user, api_client):
+        template_task = make_template(user, 1)
+        api_client.force_authenticate(user)
+
+        response = api_client.post(
+            f"/api/v1/template/{template_task.id}/create_from_template/",
+            {"count": 1},
+            format="json",
+        )
+        assert response.status_code == 201
+        assert [task["id"] for task in response.data] == [Tasks.objects.get().id]
+
+    @pytest.mark.parametrize("count", [0, -1, "abc", 2.5, True, TEMPLATE_MAX_COUNT + 1])
+    def test_invalid_count(self, user, api_client, count):
+        template_task = make_template(user, 1)
+        api_client.force_authenticate(user)
+
+        response = api_client.post(
+            f"/api/v1/template/{template_task.id}/create_from_template/",
+            {"count": count},
+            format="json",
+        )
+        assert response.status_code == 400
+        assert not Tasks.objects.exists()
+
+    def test_tags_resolved_for_other_user(self, user, user1, api_client):
+        template_task = make_template(user, 2)
+        api_client.force_authenticate(user1)
+
+        response = api_client.post(f"/api/v1/template/{template_task.id}/create_from_template/")
+        assert response.status_code == 201
+
+        task = Tasks.objects.get(id=response.data["id"])
+        assert not Tags.objects.filter(tasks__task=task).exclude(user=user1).exists()
+
+    def test_query_count_does_not_grow_with_items(self, user, api_client):
+        api_client.force_authenticate(user)
+        query_counts = []
+
+        for items_count in (1, 10, 100, 500):
+            template_task = make_template(user, items_count)
+            with CaptureQueriesContext(connection) as ctx:
+                response = api_client.post(
+                    f"/api/v1/template/{template_task.id}/create_from_template/",
+                    {"count": 2},
+                    format="json",
+                )
+            assert response.status_code == 201
+            query_counts.append(len(app_queries(ctx)))
+
+        assert len(set(query_counts)) == 1, query_counts
+
+
+def nested_task_data(items_count, tags_count=5):
+    return {
+        "name": "Пакетная задача",
+        "description": "Задача с большим количеством подзадач",
+        "items": [
+            {
+                "name": f"Подзадача {i}",
+                "status": "process",
+                "tags_input": [f"тег{j}" for j in range(tags_count)],
+                "planned_date": "2025-01-01",
+            }
+            for i in range(items_count)
+        ],
+    }
+
+
+@pytest.mark.django_db
+class TestNestedCreate:
+    @pytest.mark.parametrize("url", ["/api/v1/tasks/", "/api/v1/template/"])
+    def test_items_and_tags_created(self, user, api_client, url):
+        api_client.force_authenticate(user)
+
+        response = api_client.post(url, nested_task_data(3, tags_count=2), format="json")
+        assert response.status_code == 201
+
+        model = Tasks if url == "/api/v1/tasks/" else TemplateTasks
+        task = model.objects.get(id=response.data["id"])
+        assert task.items.count() == 3
+        for item in task.items.all():
+            assert sorted(item.tags.values_list("name", flat=True)) == ["тег0", "тег1"]
+        assert Tags.objects.filter(user=user).count() == 2
+
+    def test_existing_tags_reused(self, user, api_client):
+        Tags.objects.create(name="тег0", user=user)
+        api_client.force_authenticate(user)
+
+        response = api_client.post("/api/v1/tasks/", nested_task_data(2, tags_count=2), format="json")
+        assert response.status_code == 201
+        assert Tags.objects.filter(user=user).count() == 2
+
+    @pytest.mark.parametrize("url", ["/api/v1/tasks/", "/api/v1/template/"])
+    def test_query_count_does_not_grow_with_items(self, user, api_client, url):
+        api_client.force_authenticate(user)
+        query_counts = []
+
+        for items_count in (1, 10, 50):
+            Tags.objects.filter(user=user).delete()
+            with CaptureQueriesContext(connection) as ctx:
+                response = api_client.post(url, nested_task_data(items_count), format="json")
+            assert response.status_code == 201
+            query_counts.append(len(app_queries(ctx)))
+
+        assert len(set(query_counts)) == 1, query_counts
+
+
+@pytest.mark.django_db
+class TestNestedUpdate:
+    def create_task(self, api_client, items_count, tags_count=2):
+        response = api_client.post(
+            "/api/v1/tasks/", nested_task_data(items_count, tags_count), format="json"
+        )
+        assert response.status_code == 201
+        return Tasks.objects.get(id=response.data["id"])
+
+    def test_updates_creates_and_retags(self, user, api_client):
+        api_client.force_authenticate(user)
+        task = self.create_task(api_client, 2)
+        first, second = task.items.order_by("id")
+
+        response = api_client.patch(
+            f"/api/v1/tasks/{task.id}/",
+            {
+                "items": [
+                    {"id": second.id, "name": "второй", "tags_input": ["тег1", "новый"]},
+                    {"name": "третий", "tags_input": ["тег0"]},
+                    {"id": first.id, "status": "completed", "tags_input": []},
+                ]
+            },
+            format="json",
+        )
+        assert response.status_code == 200
+
+        new_item = task.items.get(name="третий")
+        assert response.data["updated_items"] == [
+            second.id,
+            f"New item {new_item.id}",
+            first.id,
+        ]
+        first.refresh_from_db()
+        second.refresh_from_db()
+        assert second.name == "второй"
+        assert first.status == "completed"
+        assert first.name == "Подзадача 0"
+        assert sorted(second.tags.values_list("name", flat=True)) == ["новый", "тег1"]
+        assert not first.tags.exists()
+        assert list(new_item.tags.values_list("name", flat=True)) == ["тег0"]
+
+    def test_query_count_does_not_grow_with_items(self, user, api_client):
+        api_client.force_authenticate(user)
+        tag_names = ["тег0", "тег1", "тег2", "тег3"]
+        tag_resolver.resolve_many(user, tag_names)  # создаёт теги
+        tag_resolver.resolve_many(user, tag_names)  # прогревает кэш
+        query_counts = []
+
+        for items_count in (1, 20, 200):
+            task = self.create_task(api_client, items_count)
+            payload = {
+                "items": [
+                    {"id": item_id, "name": "обновлено", "tags_input": ["тег1", "тег2"]}
+                    for item_id in task.items.values_list("id", flat=True)
+                ]
+                + [{"name": "новая", "tags_input": ["тег3"]}]
+            }
+            with CaptureQueriesContext(connection) as ctx:
+                response = api_client.patch(f"/api/v1/tasks/{task.id}/", payload, format="json")
+            assert response.status_code == 200
+            assert len(response.data["updated_items"]) == items_count + 1
+            query_counts.append(len(app_queries(ctx)))
+
+        assert len(set(query_counts)) == 1, query_counts
+
+
+@pytest.mark.django_db
+class TestTagResolver:
+    def test_same_name_for_different_users(self, user, user1, api_client, task_data):
+        data_json, tags = task_data
+        for owner in (user, user1):
+            api_client.force_authenticate(owner)
+            response = api_client.post("/api/v1/tasks/", data_json, format="json")
+            assert response.status_code == 201
+
+        for owner in (user, user1):
+            assert sorted(Tags.objects.filter(user=owner).values_list("name", flat=True)) == tags
+
+    def test_resolve_many_queries(self, user):
+        Tags.objects.create(name="есть", user=user)
+
+        with CaptureQueriesContext(connection) as ctx:
+            tags = tag_resolver.resolve_many(user, ["есть", "нет", "нет"])
+        assert len(app_queries(ctx)) == 2
+        assert set(tags) == {"есть", "нет"}
+        assert Tags.objects.get(user=user, name="нет").id == tags["нет"]
+
+        with CaptureQueriesContext(connection) as ctx:
+            assert tag_resolver.resolve_many(user, ["есть"]) == {"есть": tags["есть"]}
+        assert app_queries(ctx) == []
+
+    def test_delete_invalidates_cache(self, user):
+        tag = Tags.objects.create(name="тег", user=user)
+        tag_resolver.resolve_many(user, ["тег"])
+
+        tag.delete()
+
+        new_ids = tag_resolver.resolve_many(user, ["тег"])
+        assert new_ids["тег"] != tag.id
+        assert Tags.objects.filter(id=new_ids["тег"]).exists()
+
+    @pytest.fixture
+    def real_redis(self, monkeypatch):
+        """Настоящий Redis вместо MagicMock, в отдельной базе."""
+        client = redis.Redis(host="redis", port=6379, db=15)
+        try:
+            client.flushdb()
+        except RedisError:
+            pytest.skip("Redis недоступен")
+        monkeypatch.setattr("tasks.services.get_redis_connection", lambda alias: client)
+        yield client
+        client.flushdb()
+
+    def test_redis_tier(self, user, real_redis):
+        tag = Tags.objects.create(name="тег", user=user)
+        tag_resolver.resolve_many(user, ["тег"])
+        tag_resolver.clear()  # другой процесс: локальный кэш пуст
+
+        with CaptureQueriesContext(connection) as ctx:
+            assert tag_resolver.resolve_many(user, ["тег"]) == {"тег": tag.id}
+        assert app_queries(ctx) == []
+
+    def test_stale_write_after_invalidate(self, user, real_redis):
+        tag = Tags.objects.create(name="тег", user=user)
+        old_id = tag.id
+        generation = tag_resolver._generation(real_redis, user.pk)
+
+        tag.delete()
+        # запись, прочитанная до удаления тега, доходит до Redis после него
+        tag_resolver._remember(real_redis, user.pk, generation, {"тег": old_id})
+        tag_resolver.clear()
+
+        new_id = tag_resolver.resolve_many(user, ["тег"])["тег"]
+        assert new_id != old_id
+        assert Tags.objects.filter(pk=new_id).exists()
+
+    def test_item_update_resolves_tags(self, user, api_client, task_data):
+        api_client.force_authenticate(user)
+        data_json, _ = task_data
+        response = api_client.post("/api/v1/tasks/", data_json, format="json")
+        task = Tasks.objects.get(id=response.data["id"])
+        item = task.items.get()
+
+        response = api_client.patch(
+            f"/api/v1/tasks/{task.id}/items/{item.id}/",
+            {"name": "новое имя", "tags_input": ["тег1", "тег9"]},
+            format="json",
+        )
+        assert response.status_code == 200
+        assert sorted(response.data["tags"]) == ["тег1", "тег9"]
+        item.refresh_from_db()
+        assert item.name == "новое имя"
+
+    def test_create_templates_from_tasks(self, user, api_client, task_data_many_items):
+        api_client.force_authenticate(user)
+        response = api_client.post("/api/v1/tasks/", task_data_many_items, format="json")
+        task = Tasks.objects.get(id=response.data["id"])
+
+        template_task, = create_templates_from_tasks(Tasks.objects.filter(id=task.id))
+
+        assert template_task.created_by == user
+        assert template_task.items.count() == 3
+        tags = set(Tags.objects.filter(templatetasks__task=template_task).values_list("id", flat=True))
+        assert tags == set(Tags.objects.filter(tasks__task=task).values_list("id", flat=True))
+
+
+@pytest.mark.django_db
+class TestTaskPagination:
+    def walk(self, api_client, url):
+        ids, pages = [], 0
+        while url:
+            response = api_client.get(url)
+            assert response.status_code == 200
+            ids.extend(task["id"] for task in response.data["results"])
+            url = response.data["next"]
+            pages += 1
+        return ids, pages
+
+    def test_walks_all_tasks_in_order(self, user, api_client):
+        tasks = TaskFactory.create_batch(12, user=user)
+        TaskFactory(user=UserFactory())
+        # одинаковый updated_at у половины задач проверяет сортировку по id
+        Tasks.objects.filter(id__in=[task.id for task in tasks[:6]]).update(
+            updated_at=tasks[0].updated_at
+        )
+        api_client.force_authenticate(user)
+
+        ids, pages = self.walk(api_client, "/api/v1/tasks/?page_size=5")
+
+        expected = list(
+            Tasks.objects.filter(user=user).order_by("-updated_at", "-id").values_list("id", flat=True)
+        )
+        assert ids == expected
+        assert pages == 3
+
+    def test_custom_ordering_and_previous(self, user, api_client):
+        TaskFactory.create_batch(7, user=user)
+        api_client.force_authenticate(user)
+
+        first = api_client.get("/api/v1/tasks/?ordering=name&page_size=3")
+        second = api_client.get(first.data["next"])
+        previous = api_client.get(second.data["previous"])
+
+        names = sorted(Tasks.objects.filter(user=user).values_list("name", flat=True))
+        assert [task["name"] for task in first.data["results"]] == names[:3]
+        assert [task["name"] for task in second.data["results"]] == names[3:6]
+        assert previous.data["results"] == first.data["results"]
+        assert previous.data["previous"] is None
+
+    def test_invalid_cursor(self, user, api_client):
+        api_client.force_authenticate(user)
+        response = api_client.get("/api/v1/tasks/?cursor=broken")
+        assert response.status_code == 404
+
+    def test_deep_page_costs_the_same(self, user, api_client):
+        TaskFactory.create_batch(30, user=user)
+        api_client.force_authenticate(user)
+
+        url, query_counts = "/api/v1/tasks/?page_size=5", []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = api_client.get(url)
+            queries = app_queries(ctx)
+            assert not any("COUNT(*)" in query["sql"] for query in queries)
+            query_counts.append(len(queries))
+            url = response.data["next"]
+
+        assert len(set(query_counts)) == 1, query_counts
+
+
+@pytest.mark.django_db
+class TestSparseFields:
+    def test_list_fields_projects_queryset(self, user, api_client):
+        TaskFactory.create_batch(3, user=user)
+        api_client.force_authenticate(user)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = api_client.get("/api/v1/tasks/?fields=id,name")
+        assert response.status_code == 200
+        assert all(set(task) == {"id", "name"} for task in response.data["results"])
+
+        (query,) = [q["sql"] for q in data_queries(ctx) if "tasks_tasks" in q["sql"]]
+        assert '"tasks_tasks"."description"' not in query
+        assert "COUNT(" not in query
+        assert "tasks_taskitem" not in query
+
+    def test_list_exclude(self, user, api_client):
+        TaskFactory(user=user)
+        api_client.force_authenticate(user)
+
+        response = api_client.get(
+            "/api/v1/tasks/?exclude=description,items_count,completed_count"
+        )
+        assert set(response.data["results"][0]) == {"id", "name"}
+
+        response = api_client.get("/api/v1/tasks/")
+        assert set(response.data["results"][0]) == {
+            "id",
+            "name",
+            "description",
+            "items_count",
+            "completed_count",
+        }
+
+    def test_fields_with_ordering(self, user, api_client):
+        TaskFactory.create_batch(4, user=user)
+        api_client.force_authenticate(user)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = api_client.get("/api/v1/tasks/?fields=id&ordering=name&page_size=2")
+        assert response.data["next"]
+        assert len(data_queries(ctx)) == 1
+
+    def test_item_fields_skip_tags(self, user, api_client, task_data):
+        api_client.force_authenticate(user)
+        data_json, _ = task_data
+        task_id = api_client.post("/api/v1/tasks/", data_json, format="json").data["id"]
+        item = TaskItem.objects.get(task_id=task_id)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = api_client.get(f"/api/v1/tasks/{task_id}/items/{item.id}/?fields=id,status")
+        assert response.data == {"id": item.id, "status": "process"}
+        assert not any("tasks_tags" in query["sql"] for query in app_queries(ctx))
+
+    def test_template_list_cached_per_fields(self, user, api_client):
+        TemplateTaskFactory(created_by=user)
+        api_client.force_authenticate(user)
+
+        full = api_client.get("/api/v1/template/")
+        sparse = api_client.get("/api/v1/template/?fields=name")
+        assert "description" in full.data[0]
+        assert set(sparse.data[0]) == {"name"}
+
+    def test_readable_fields_built_once(self, user, api_client):
+        TaskFactory.create_batch(3, user=user)
+        api_client.force_authenticate(user)
+        api_client.get("/api/v1/tasks/?fields=id,name")
+
+        with patch.object(
+            TaskSerializer, "get_fields", autospec=True, side_effect=TaskSerializer.get_fields
+        ) as get_fields:
+            response = api_client.get("/api/v1/tasks/?fields=id,name&page=1")
+        assert response.status_code == 200
+        assert get_fields.call_count == 1
+
+
+@pytest.mark.django_db
+class TestTemplateCache:
+    def test_invalidate_bumps_version(self):
+        versioned = VersionedCache("test")
+        key = versioned.key(1, "page", 1)
+        other = versioned.key(2, "page", 1)
+
+        versioned.invalidate(1)
+
+        assert versioned.key(1, "page", 1) != key
+        assert versioned.key(2, "page", 1) == other
+
+    def test_invalidate_without_version(self):
+        VersionedCache("test").invalidate("нет")
+
+    @pytest.mark.django_db(transaction=True)
+    def test_update_invalidates_list_and_retrieve(self, user, api_client):
+        template = TemplateTaskFactory(created_by=user, name="старое")
+        api_client.force_authenticate(user)
+        list_key = template_cache.key("list")
+        page_key = template_cache.key(template.id, "page", 1)
+
+        api_client.get("/api/v1/template/")
+        api_client.get(f"/api/v1/template/{template.id}/")
+        assert template_cache.get(list_key) is not None
+        assert template_cache.get(page_key) is not None
+
+        response = api_client.patch(
+            f"/api/v1/template/{template.id}/", {"name": "новое"}, format="json"
+        )
+        assert response.status_code == 200
+
+        assert template_cache.key("list") != list_key
+        assert template_cache.key(template.id, "page", 1) != page_key
+        assert api_client.get("/api/v1/template/").data[0]["name"] == "новое"
+
+    def test_cached_retrieve_keeps_shape(self, user, api_client):
+        template = TemplateTaskFactory(created_by=user, items=[{}] * 3)
+        api_client.force_authenticate(user)
+
+        first = api_client.get(f"/api/v1/template/{template.id}/")
+        second = api_client.get(f"/api/v1/template/{template.id}/")
+
+        assert first.data == second.data
+        assert second.data["count"] == 3
+
+
+@pytest.mark.django_db(transaction=True)
+class TestTemplateCacheSignals:
+    @pytest.fixture
+    def template(self, user, tag1):
+        template = TemplateTaskFactory(created_by=user, items=[{}] * 2)
+        tag = Tags.objects.create(name=tag1, user=user)
+        for item in template.items.all():
+            item.tags.add(tag)
+        return template
+
+    @pytest.fixture
+    def versions(self, template):
+        """Насколько выросли поколения шаблона и списка за блок."""
+        template_id = template.id
+
+        class Versions:
+            def __enter__(self):
+                self.before = self.current()
+                return self
+
+            def __exit__(self, *exc_info):
+                self.after = self.current()
+
+            @staticmethod
+            def current():
+                return template_cache.version(template_id), template_cache.version("list")
+
+            def bumped(self):
+                return tuple(after - before for before, after in zip(self.before, self.after))
+
+        return Versions()
+
+    def test_create_invalidates_list(self, user, api_client, versions):
+        api_client.force_authenticate(user)
+        with versions:
+            response = api_client.post("/api/v1/template/", {"name": "новый"}, format="json")
+        assert response.status_code == 201
+        assert versions.bumped() == (0, 1)
+
+    def test_item_update(self, template, user, api_client, versions):
+        api_client.force_authenticate(user)
+        item = template.items.first()
+        with versions:
+            response = api_client.patch(
+                f"/api/v1/template/{template.id}/items/{item.id}/",
+                {"name": "п", "tags_input": ["новый"]},
+                format="json",
+            )
+        assert response.status_code == 200
+        assert versions.bumped() == (1, 1)
+
+    def test_item_delete(self, template, versions):
+        with versions:
+            template.items.first().delete()
+        assert versions.bumped() == (1, 1)
+
+    def test_admin_save(self, template, versions):
+        with versions:
+            template.name = "из админки"
+            template.save()
+        assert versions.bumped() == (1, 1)
+
+    def test_tag_rename_and_delete(self, template, versions):
+        tag = Tags.objects.get()
+        with versions:
+            tag.name = "другое"
+            tag.save()
+        assert versions.bumped() == (1, 0)
+
+        with versions:
+            tag.delete()
+        assert versions.bumped() == (1, 0)
+
+    def test_reverse_m2m(self, template, user, versions):
+        tag = Tags.objects.create(name="ещё", user=user)
+        with versions:
+            tag.templatetasks.add(*template.items.all())
+        assert versions.bumped() == (1, 0)
+
+    def test_template_delete_invalidates_once(self, template, versions):
+        with versions:
+            template.delete()
+        assert versions.bumped() == (1, 1)
+
+    def test_create_templates_from_tasks(self, user, versions):
+        with versions:
+            create_templates_from_tasks([TaskFactory(user=user, items=[{}])])
+        assert versions.bumped() == (0, 1)
+
+    def test_rollback_does_not_block_later_invalidation(self, template, versions):
+        with versions:
+            try:
+                with transaction.atomic():
+                    template.save()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            template.items.first().save()
+        assert versions.bumped() == (1, 1)
+
+
+@pytest.mark.django_db(transaction=True)
+class TestTasksResponseCache:
+    @pytest.fixture
+    def task(self, user):
+        return TaskFactory(user=user, name="старое", items=[{}] * 2)
+
+    def test_repeated_reads_hit_cache(self, task, user, api_client):
+        api_client.force_authenticate(user)
+        for url in (
+            "/api/v1/tasks/",
+            f"/api/v1/tasks/{task.id}/",
+            f"/api/v1/tasks/{task.id}/update_status/",
+        ):
+            first = api_client.get(url)
+            with CaptureQueriesContext(connection) as ctx:
+                second = api_client.get(url)
+            assert second.data == first.data
+            assert data_queries(ctx) == []
+
+    def test_params_are_normalized(self, task, user, api_client):
+        api_client.force_authenticate(user)
+        api_client.get("/api/v1/tasks/?search=ст&ordering=name")
+
+        with CaptureQueriesContext(connection) as ctx:
+            api_client.get("/api/v1/tasks/?ordering=name&search=ст")
+        assert data_queries(ctx) == []
+
+        response = api_client.get("/api/v1/tasks/?search=нет")
+        assert response.data["results"] == []
+
+    def test_cache_is_per_user(self, task, user, user1, api_client):
+        api_client.force_authenticate(user)
+        api_client.get("/api/v1/tasks/")
+
+        api_client.force_authenticate(user1)
+        assert api_client.get("/api/v1/tasks/").data["results"] == []
+        assert api_client.get(f"/api/v1/tasks/{task.id}/").status_code == 404
+
+    @pytest.mark.parametrize(
+        "method, url, data",
+        [
+            ("patch", lambda task: f"/api/v1/tasks/{task.id}/", {"name": "новое"}),
+            (
+                "patch",
+                lambda task: f"/api/v1/tasks/{task.id}/items/{task.items.first().id}/",
+                {"name": "новое"},
+            ),
+            ("delete", lambda task: f"/api/v1/tasks/{task.id}/", None),
+            (
+                "post",
+                lambda task: f"/api/v1/tasks/{task.id}/update_status/",
+                lambda task: {"updates": [{"id": task.items.first().id, "status": "completed"}]},
+            ),
+            ("post", lambda task: "/api/v1/tasks/tags/", {"name": "новый"}),
+        ],
+        ids=["task", "item", "destroy", "update_status", "tag"],
+    )
+    def test_writes_bump_generation(self, task, user, api_client, method, url, data):
+        api_client.force_authenticate(user)
+        api_client.get("/api/v1/tasks/")
+        version = tasks_cache.version(user.pk)
+
+        if callable(data):
+            data = data(task)
+        response = getattr(api_client, method)(url(task), data, format="json")
+        assert response.status_code < 400
+
+        assert tasks_cache.version(user.pk) == version + 1
+
+    def test_other_user_writes_keep_cache(self, task, user, user1):
+        version = tasks_cache.version(user.pk)
+
+        TaskFactory(user=user1, items=[{}])
+
+        assert tasks_cache.version(user.pk) == version
+
+    def test_hit_miss_counters(self, task, user, api_client):
+        api_client.force_authenticate(user)
+        before = tasks_cache.stats()
+
+        api_client.get("/api/v1/tasks/")
+        api_client.get("/api/v1/tasks/")
+
+        after = tasks_cache.stats()
+        assert after["hit"] - before["hit"] == 1
+        assert after["miss"] - before["miss"] == 1
+
+        output = StringIO()
+        call_command("cache_stats", stdout=output)
+        assert f"tasks: hit {after['hit']}, miss {after['miss']}" in output.getvalue()
+        assert "tags: hit" in output.getvalue()
+        assert "template_tasks: hit" in output.getvalue()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestConditionalGet:
+    @pytest.fixture
+    def task(self, user):
+        return TaskFactory(user=user, items=[{}] * 2)
+
+    @pytest.mark.parametrize("url", ["/api/v1/tasks/", "/api/v1/tasks/{id}/"])
+    def test_not_modified(self, task, user, api_client, url):
+        api_client.force_authenticate(user)
+        url = url.format(id=task.id)
+
+        response = api_client.get(url)
+        assert response["ETag"].startswith('W/"')
+        assert response["Last-Modified"]
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = api_client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        assert response.status_code == 304
+        assert data_queries(ctx) == []
+
+        last_modified = api_client.get(url)["Last-Modified"]
+        response = api_client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        assert response.status_code == 304
+
+    def test_list_modified_by_delete(self, task, user, api_client):
+        api_client.force_authenticate(user)
+        TaskFactory(user=user)
+        Tasks.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        last_modified = api_client.get("/api/v1/tasks/")["Last-Modified"]
+
+        api_client.delete(f"/api/v1/tasks/{task.id}/")
+        response = api_client.get("/api/v1/tasks/", HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        assert response.status_code == 200
+        assert task.id not in [data["id"] for data in response.data["results"]]
+
+    def test_etag_depends_on_params(self, task, user, api_client):
+        api_client.force_authenticate(user)
+
+        etag = api_client.get("/api/v1/tasks/")["ETag"]
+        response = api_client.get("/api/v1/tasks/?fields=id", HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == 200
+
+    @pytest.mark.parametrize(
+        "method, url, data",
+        [
+            (
+                "patch",
+                lambda task: f"/api/v1/tasks/{task.id}/items/{task.items.first().id}/",
+                {"name": "новое"},
+            ),
+            (
+                "delete",
+                lambda task: f"/api/v1/tasks/{task.id}/items/{task.items.first().id}/",
+                None,
+            ),
+            (
+                "post",
+                lambda task: f"/api/v1/tasks/{task.id}/update_status/",
+                lambda task: {"updates": [{"id": task.items.first().id, "status": "completed"}]},
+            ),
+        ],
+        ids=["item-update", "item-delete", "update_status"],
+    )
+    def test_item_writes_touch_task(self, task, user, api_client, method, url, data):
+        api_client.force_authenticate(user)
+        updated_at = task.updated_at
+        urls = ("/api/v1/tasks/", f"/api/v1/tasks/{task.id}/")
+        etags = {url: api_client.get(url)["ETag"] for url in urls}
+
+        if callable(data):
+            data = data(task)
+        assert getattr(api_client, method)(url(task), data, format="json").status_code < 400
+
+        task.refresh_from_db()
+        assert task.updated_at > updated_at
+        for url, etag in etags.items():
+            assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    def test_tag_changes_touch_task(self, task, user):
+        tag = Tags.objects.create(name="тег", user=user)
+        updated_at = task.updated_at
+
+        tag.tasks.add(task.items.first())
+        task.refresh_from_db()
+        assert task.updated_at > updated_at
+
+        updated_at = task.updated_at
+        tag.name = "другое"
+        tag.save()
+        task.refresh_from_db()
+        assert task.updated_at > updated_at
+
+    def test_missing_task(self, user, api_client):
+        api_client.force_authenticate(user)
+
+        response = api_client.get("/api/v1/tasks/0/", HTTP_IF_NONE_MATCH="*")
+
+        assert response.status_code == 404
+        assert "ETag" not in response
+
+    @pytest.mark.parametrize("url", ["/api/v1/template/", "/api/v1/template/{id}/"])
+    def test_templates(self, user, api_client, url):
+        template = TemplateTaskFactory(created_by=user, items=[{}])
+        api_client.force_authenticate(user)
+        url = url.format(id=template.id)
+
+        etag = api_client.get(url)["ETag"]
+        with CaptureQueriesContext(connection) as ctx:
+            response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert app_queries(ctx) == []
+
+        api_client.patch(f"/api/v1/template/{template.id}/", {"name": "новое"}, format="json")
+        assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+@pytest.mark.django_db
+class TestChanges:
+    @pytest.fixture
+    def synced(self, user, user1):
+        """Данные, синхронизированные час назад, и курсор на минуту назад."""
+        tasks = [TaskFactory(user=user, items=[{}] * 2) for _ in range(2)]
+        tag = Tags.objects.create(name="тег", user=user)
+        tasks[0].items.first().tags.add(tag)
+        TaskFactory(user=user1, items=[{}])
+
+        hour_ago = timezone.now() - timedelta(hours=1)
+        for model in (Tasks, TaskItem, Tags):
+            model.objects.update(updated_at=hour_ago)
+        DeletionLog.objects.all().delete()
+
+        return {
+            "tasks": tasks,
+            "tag": tag,
+            "since": make_changes_token(timezone.now() - timedelta(minutes=1)),
+        }
+
+    def changes(self, api_client, since=None):
+        url = "/api/v1/tasks/changes/"
+        response = api_client.get(url, {"since": since} if since else None)
+        assert response.status_code == 200, response.data
+        return response.data
+
+    def test_full_sync(self, synced, user, api_client):
+        api_client.force_authenticate(user)
+
+        data = self.changes(api_client)
+
+        assert {task["id"] for task in data["tasks"]} == {task.id for task in synced["tasks"]}
+        assert len(data["items"]) == 4
+        assert [tag["id"] for tag in data["tags"]] == [synced["tag"].id]
+        assert data["deleted"] == {"tasks": [], "items": [], "tags": []}
+        assert data["since"]
+
+    def test_no_changes(self, synced, user, api_client):
+        api_client.force_authenticate(user)
+
+        data = self.changes(api_client, synced["since"])
+
+        assert data["tasks"] == data["items"] == data["tags"] == []
+
+    def test_changes_and_tombstones(self, synced, user, api_client):
+        api_client.force_authenticate(user)
+        first, second = synced["tasks"]
+        changed_item, deleted_item = second.items.order_by("id")
+
+        api_client.patch(
+            f"/api/v1/tasks/{second.id}/items/{changed_item.id}/", {"name": "новое"}, format="json"
+        )
+        api_client.delete(f"/api/v1/tasks/{second.id}/items/{deleted_item.id}/")
+        first_items = list(first.items.values_list("id", flat=True))
+        api_client.delete(f"/api/v1/tasks/{first.id}/")
+
+        data = self.changes(api_client, synced["since"])
+
+        assert [task["id"] for task in data["tasks"]] == [second.id]
+        assert [(item["id"], item["name"]) for item in data["items"]] == [
+            (changed_item.id, "новое")
+        ]
+        assert data["deleted"]["tasks"] == [first.id]
+        assert data["deleted"]["items"] == [deleted_item.id]
+        assert not set(first_items) & set(data["deleted"]["items"])
+
+    def test_queryset_delete_logs_only_tasks(self, user):
+        def delete_task(items_count):
+            task = TaskFactory(user=user, items=[{}] * items_count)
+            with CaptureQueriesContext(connection) as ctx:
+                Tasks.objects.filter(pk=task.pk).delete()
+            return task.pk, len(ctx.captured_queries)
+
+        (small_id, small), (large_id, large) = delete_task(2), delete_task(20)
+
+        assert small == large
+        assert sorted(DeletionLog.objects.values_list("model", "object_id")) == [
+            ("task", small_id),
+            ("task", large_id),
+        ]
+
+    def test_user_queryset_delete_writes_no_tombstones(self, synced, user, user1):
+        get_user_model().objects.filter(pk=user.pk).delete()
+
+        assert not DeletionLog.objects.exists()
+        # отложенные проверки внешних ключей, как при коммите
+        connection.check_constraints()
+
+    def test_put_without_items(self, synced, user, api_client):
+        api_client.force_authenticate(user)
+        task = synced["tasks"][0]
+        item_ids = set(task.items.values_list("id", flat=True))
+
+        response = api_client.put(
+            f"/api/v1/tasks/{task.id}/",
+            {"name": "пусто", "description": "", "items": []},
+            format="json",
+        )
+
+        assert response.status_code == 200
+        task.refresh_from_db()
+        assert (task.items_count, task.completed_count) == (0, 0)
+        assert not TaskItem.objects.filter(pk__in=item_ids).exists()
+        assert reconcile_user_stats([user.pk]) == 0
+        assert Tasks.objects.filter(search_vector=SearchQuery("пусто", config="russian")).exists()
+        data = self.changes(api_client, synced["since"])
+        assert set(data["deleted"]["items"]) == item_ids
+        assert [changed["id"] for changed in data["tasks"]] == [task.id]
+
+    def test_tag_delete_touches_items(self, synced, user, api_client):
+        api_client.force_authenticate(user)
+        item = synced["tasks"][0].items.first()
+        tag_id = synced["tag"].id
+
+        synced["tag"].delete()
+
+        data = self.changes(api_client, synced["since"])
+        assert [(item_data["id"], item_data["tags"]) for item_data in data["items"]] == [
+            (item.id, [])
+        ]
+        assert data["deleted"]["tags"] == [tag_id]
+
+    def test_update_status_and_nested_update(self, synced, user, api_client):
+        api_client.force_authenticate(user)
+        first, second = synced["tasks"]
+        first_item = first.items.first()
+        second_item = second.items.first()
+
+        api_client.post(
+            f"/api/v1/tasks/{first.id}/update_status/",
+            {"updates": [{"id": first_item.id, "status": "completed"}]},
+            format="json",
+        )
+        api_client.patch(
+            f"/api/v1/tasks/{second.id}/",
+            {"items": [{"id": second_item.id, "tags_input": ["новый"]}]},
+            format="json",
+        )
+
+        data = self.changes(api_client, synced["since"])
+        assert {item["id"] for item in data["items"]} == {first_item.id, second_item.id}
+        assert [tag["name"] for tag in data["tags"]] == ["новый"]
+
+    def test_next_cursor(self, synced, user, api_client):
+        api_client.force_authenticate(user)
+        since = self.changes(api_client)["since"]
+
+        Tags.objects.create(name="после", user=user)
+
+        assert [tag["name"] for tag in self.changes(api_client, since)["tags"]] == ["после"]
+
+    def test_invalid_and_expired_token(self, user, api_client):
+        api_client.force_authenticate(user)
+
+        response = api_client.get("/api/v1/tasks/changes/", {"since": "мусор"})
+        assert response.status_code == 400
+
+        expired = make_changes_token(timezone.now() - timedelta(days=31))
+        response = api_client.get("/api/v1/tasks/changes/", {"since": expired})
+        assert response.status_code == 410
+
+    def test_prune_deletion_log(self, user):
+        old, fresh = DeletionLog.objects.bulk_create(
+            [DeletionLog(user=user, model="task", object_id=i) for i in (1, 2)]
+        )
+        DeletionLog.objects.filter(pk=old.pk).update(
+            deleted_at=timezone.now() - timedelta(days=31)
+        )
+
+        prune_deletion_log()
+
+        assert list(DeletionLog.objects.values_list("pk", flat=True)) == [fresh.pk]
+
+
+@pytest.mark.django_db
+class TestBulkStatus:
+    url = "/api/v1/tasks/bulk_status/"
+
+    def test_updates_items_across_tasks(self, user, user1, api_client):
+        api_client.force_authenticate(user)
+        first, second = [TaskFactory(user=user, items=[{}] * 2) for _ in range(2)]
+        foreign = TaskFactory(user=user1, items=[{}]).items.get()
+        first_item = first.items.first()
+        second_item = second.items.first()
+        hour_ago = timezone.now() - timedelta(hours=1)
+        Tasks.objects.update(updated_at=hour_ago)
+
+        response = api_client.post(
+            self.url,
+            {
+                "updates": [
+                    {"id": first_item.id, "status": "completed"},
+                    {"id": second_item.id, "status": "completed"},
+                    {"id": foreign.id, "status": "completed"},
+                    {"id": 0, "status": "completed"},
+                ]
+            },
+            format="json",
+        )
+
+        assert response.status_code == 200
+        assert response.data == {
+            "updated": [first_item.id, second_item.id],
+            "not_found": [foreign.id, 0],
+        }
+        assert set(
+            TaskItem.objects.filter(status="completed").values_list("id", flat=True)
+        ) == {first_item.id, second_item.id}
+        assert not Tasks.objects.filter(user=user, updated_at=hour_ago).exists()
+        assert Tasks.objects.get(user=user1).updated_at == hour_ago
+
+    def test_last_status_wins(self, user, api_client):
+        api_client.force_authenticate(user)
+        item = TaskFactory(user=user, items=[{}]).items.get()
+
+        response = api_client.post(
+            self.url,
+            {
+                "updates": [
+                    {"id": item.id, "status": "completed"},
+                    {"id": item.id, "status": "process"},
+                ]
+            },
+            format="json",
+        )
+
+        assert response.data["updated"] == [item.id]
+        item.refresh_from_db()
+        assert item.status == "process"
+
+    @pytest.mark.parametrize(
+        "updates",
+        [None, [], [{"id": 1, "status": "done"}], ["1"]],
+    )
+    def test_invalid_payload(self, user, api_client, updates):
+        api_client.force_authenticate(user)
+
+        response = api_client.post(self.url, {"updates": updates}, format="json")
+
+        assert response.status_code == 400
+        assert "error" in response.data
+
+    def test_constant_queries(self, user, api_client):
+        api_client.force_authenticate(user)
+        tasks = [TaskFactory(user=user, items=[{}] * 5) for _ in range(4)]
+        updates = [
+            {"id": item.id, "status": "completed"} for task in tasks for item in task.items.all()
+        ]
+
+        with CaptureQueriesContext(connection) as few:
+            api_client.post(self.url, {"updates": updates[:2]}, format="json")
+        with CaptureQueriesContext(connection) as many:
+            api_client.post(self.url, {"updates": updates}, format="json")
+
+        assert len(many) == len(few)
+        assert TaskItem.objects.filter(status="completed").count() == len(updates)
+
+
+@pytest.mark.django_db
+class TestTaskStats:
+    @pytest.fixture
+    def days(self):
+        today = timezone.localdate()
+        return {
+            "past": str(today - timedelta(days=3)),
+            "today": str(today),
+            "future": str(today + timedelta(days=3)),
+        }
+
+    def create_task(self, api_client, items):
+        response = api_client.post(
+            "/api/v1/tasks/", {"name": "задача", "items": items}, format="json"
+        )
+        assert response.status_code == 201, response.data
+        return Tasks.objects.get(id=response.data["id"])
+
+    def test_stats(self, user, user1, api_client, days):
+        api_client.force_authenticate(user)
+        self.create_task(
+            api_client,
+            [
+                {"name": "просрочена", "planned_date": days["past"]},
+                {"name": "сегодня", "planned_date": days["today"]},
+                {"name": "потом", "planned_date": days["future"]},
+                {"name": "без даты"},
+                {"name": "готова", "status": "completed", "planned_date": days["past"]},
+            ],
+        )
+        TaskFactory(user=user1, items=[{"planned_date": days["past"]}])
+
+        response = api_client.get("/api/v1/tasks/stats/")
+
+        assert response.status_code == 200
+        assert response.data == {
+            "total": 5,
+            "by_status": {"process": 4, "completed": 1},
+            "overdue": 1,
+            "due_today": 1,
+            "completion_ratio": 0.2,
+        }
+
+    def test_empty(self, user, api_client):
+        api_client.force_authenticate(user)
+
+        response = api_client.get("/api/v1/tasks/stats/")
+
+        assert response.data["total"] == 0
+        assert response.data["completion_ratio"] == 0.0
+
+    def test_write_paths_keep_stats(self, user, api_client, days):
+        """После каждой записи пересчёт с нуля не находит расхождений."""
+        api_client.force_authenticate(user)
+        task = self.create_task(
+            api_client,
+            [{"name": "а", "planned_date": days["past"]}, {"name": "б"}, {"name": "в"}],
+        )
+        first, second, third = task.items.order_by("id")
+        other = self.create_task(api_client, [{"name": "г", "planned_date": days["today"]}])
+        assert reconcile_user_stats([user.pk]) == 0
+
+        api_client.patch(
+            f"/api/v1/tasks/{task.id}/",
+            {
+                "items": [
+                    {"id": first.id, "status": "completed"},
+                    {"id": second.id, "planned_date": days["today"]},
+                    {"name": "новая", "planned_date": days["past"]},
+                ]
+            },
+            format="json",
+        )
+        assert reconcile_user_stats([user.pk]) == 0
+
+        api_client.patch(
+            f"/api/v1/tasks/{task.id}/items/{third.id}/",
+            {"planned_date": days["future"]},
+            format="json",
+        )
+        assert reconcile_user_stats([user.pk]) == 0
+
+        api_client.post(
+            f"/api/v1/tasks/{task.id}/update_status/",
+            {"updates": [{"id": second.id, "status": "completed"}]},
+            format="json",
+        )
+        api_client.post(
+            "/api/v1/tasks/bulk_status/",
+            {
+                "updates": [
+                    {"id": first.id, "status": "process"},
+                    {"id": other.items.get().id, "status": "completed"},
+                ]
+            },
+            format="json",
+        )
+        assert reconcile_user_stats([user.pk]) == 0
+
+        TaskItemAdmin.set_status(
+            TaskItem.objects.filter(task=task), TaskItem.StatusChoices.COMPLETED
+        )
+        assert reconcile_user_stats([user.pk]) == 0
+
+        api_client.delete(f"/api/v1/tasks/{task.id}/items/{third.id}/")
+        template = TemplateTaskFactory(created_by=user, items=[{}] * 2)
+        api_client.post(f"/api/v1/template/{template.id}/create_from_template/")
+        assert reconcile_user_stats([user.pk]) == 0
+
+        api_client.delete(f"/api/v1/tasks/{task.id}/")
+        assert reconcile_user_stats([user.pk]) == 0
+        assert api_client.get("/api/v1/tasks/stats/").data["total"] == 3
+
+    def test_reconcile_repairs_drift(self, user, user1, days):
+        TaskFactory(user=user, items=[{"planned_date": days["past"]}, {"status": "completed"}])
+        TaskFactory(user=user1, items=[{}])
+        TaskStats.objects.filter(user=user, status="completed").update(count=10)
+        TaskStats.objects.filter(user=user1).delete()
+        TaskStats.objects.create(
+            user=user, status="process", planned_date=days["future"], count=2
+        )
+
+        assert reconcile_task_stats(batch_size=1) == 3
+
+        assert set(TaskStats.objects.values_list("user_id", "status", "count")) == {
+            (user.pk, "process", 1),
+            (user.pk, "completed", 1),
+            (user1.pk, "process", 1),
+        }
+        assert reconcile_task_stats() == 0
+
+    def test_user_delete(self, user):
+        TaskFactory(user=user, items=[{}])
+
+        user.delete()
+
+        assert not TaskStats.objects.exists()
+
+
+def check_counters():
+    call_command("item_counters", "--check", stdout=StringIO())
+
+
+@pytest.mark.django_db
+class TestItemCounters:
+    def test_create_returns_counters(self, user, api_client):
+        api_client.force_authenticate(user)
+
+        response = api_client.post(
+            "/api/v1/tasks/",
+            {"name": "задача", "items": [{"name": "а"}, {"name": "б", "status": "completed"}]},
+            format="json",
+        )
+
+        assert (response.data["items_count"], response.data["completed_count"]) == (2, 1)
+        check_counters()
+
+    def test_task_write_paths(self, user, api_client):
+        api_client.force_authenticate(user)
+        task = TaskFactory(user=user, items=[{}] * 3)
+        first, second, third = task.items.order_by("id")
+        other = TaskFactory(user=user, items=[{}])
+        check_counters()
+
+        response = api_client.patch(
+            f"/api/v1/tasks/{task.id}/",
+            {"items": [{"id": first.id, "status": "completed"}, {"name": "новая"}]},
+            format="json",
+        )
+        assert (response.data["task"]["items_count"], response.data["task"]["completed_count"]) == (
+            4,
+            1,
+        )
+        check_counters()
+
+        api_client.patch(
+            f"/api/v1/tasks/{task.id}/items/{second.id}/", {"status": "completed"}, format="json"
+        )
+        api_client.delete(f"/api/v1/tasks/{task.id}/items/{third.id}/")
+        check_counters()
+
+        api_client.post(
+            f"/api/v1/tasks/{task.id}/update_status/",
+            {"updates": [{"id": first.id, "status": "process"}]},
+            format="json",
+        )
+        api_client.post(
+            "/api/v1/tasks/bulk_status/",
+            {
+                "updates": [
+                    {"id": second.id, "status": "process"},
+                    {"id": other.items.get().id, "status": "completed"},
+                ]
+            },
+            format="json",
+        )
+        check_counters()
+
+        TaskItemAdmin.set_status(TaskItem.objects.all(), TaskItem.StatusChoices.COMPLETED)
+        check_counters()
+        task.refresh_from_db()
+        assert (task.items_count, task.completed_count) == (3, 3)
+
+        response = api_client.put(
+            f"/api/v1/tasks/{task.id}/",
+            {"name": "пусто", "description": "", "items": []},
+            format="json",
+        )
+        assert response.data["task"]["items_count"] == 0
+        check_counters()
+
+    def test_save_keeps_counters(self, user):
+        task = TaskFactory(user=user, items=[{}] * 2)
+        stale = Tasks.objects.get(pk=task.pk)
+        TaskItem.objects.create(task=task, name="ещё")
+
+        stale.name = "переименована"
+        stale.save()
+
+        task.refresh_from_db()
+        assert task.items_count == 3
+
+    def test_template_write_paths(self, user, api_client):
+        api_client.force_authenticate(user)
+        template = TemplateTaskFactory(created_by=user, items=[{}] * 2)
+        item = template.items.first()
+
+        response = api_client.post(
+            f"/api/v1/template/{template.id}/create_from_template/", {"count": 2}, format="json"
+        )
+        assert [task["items_count"] for task in response.data] == [2, 2]
+
+        api_client.patch(
+            f"/api/v1/template/{template.id}/items/{item.id}/",
+            {"status": "completed"},
+            format="json",
+        )
+        api_client.delete(f"/api/v1/template/{template.id}/items/{template.items.last().id}/")
+        (created,) = create_templates_from_tasks(Tasks.objects.filter(user=user)[:1])
+        assert created.items_count == 2
+        check_counters()
+
+        template.refresh_from_db()
+        assert (template.items_count, template.completed_count) == (1, 1)
+
+    def test_order_by_progress(self, user, api_client):
+        api_client.force_authenticate(user)
+        half = TaskFactory(user=user, items=[{"status": "completed"}, {}])
+        done = TaskFactory(user=user, items=[{"status": "completed"}])
+        empty = TaskFactory(user=user, items=[])
+        TaskItem.objects.filter(task=empty).delete()
+
+        response = api_client.get("/api/v1/tasks/?ordering=-progress")
+
+        assert [task["id"] for task in response.data["results"]] == [done.id, half.id, empty.id]
+
+    def test_admin_item_count(self, user):
+        task = TaskFactory(user=user, items=[{}] * 2)
+
+        admin = TaskAdmin(Tasks, None)
+        assert admin.item_count(admin.get_queryset(None).get(pk=task.pk)) == 2
+
+    def test_command_fixes_drift(self, user):
+        TaskFactory(user=user, items=[{}, {"status": "completed"}])
+        TemplateTaskFactory(created_by=user, items=[{}])
+        Tasks.objects.update(items_count=10, completed_count=0)
+        TemplateTasks.objects.update(items_count=0)
+
+        with pytest.raises(CommandError):
+            check_counters()
+
+        output = StringIO()
+        call_command("item_counters", "--batch-size", "1", stdout=output)
+
+        assert "исправлено 1" in output.getvalue()
+        assert Tasks.objects.values_list("items_count", "completed_count").get() == (2, 1)
+        assert TemplateTasks.objects.get().items_count == 1
+        check_counters()
+
+
+def check_search_vectors():
+    """Сохранённый поисковый вектор совпадает с собранным заново."""
+    rows = Tasks.objects.values_list(
+        Cast("search_vector", TextField()), Cast(search_vector(), TextField())
+    )
+    assert [stored for stored, _ in rows] == [actual for _, actual in rows]
+
+
+def search_ids(api_client, query, **params):
+    response = api_client.get("/api/v1/tasks/", {"search": query, **params})
+    assert response.status_code == 200
+    return [task["id"] for task in response.data["results"]]
+
+
+@pytest.mark.django_db
+class TestFullTextSearch:
+    def test_finds_by_word_forms_and_items(self, user, user1, api_client):
+        api_client.force_authenticate(user)
+        report = TaskFactory(user=user, name="Квартальный отчёт", items=[{"name": "собрать"}])
+        trip = TaskFactory(
+            user=user,
+            name="Поездка",
+            items=[{"name": "купить билеты", "description": "на поезд до Казани"}],
+        )
+        TaskFactory(user=user1, name="Отчёт о поездке", items=[{"name": "билеты"}])
+
+        assert search_ids(api_client, "отчёты") == [report.id]
+        assert search_ids(api_client, "билет") == [trip.id]
+        assert search_ids(api_client, "поезд казань") == [trip.id]
+        assert sorted(search_ids(api_client, "отчёт or билеты")) == sorted([report.id, trip.id])
+        assert search_ids(api_client, "поездка -билеты") == []
+
+    def test_rank_and_headline(self, user, api_client):
+        api_client.force_authenticate(user)
+        in_item = TaskFactory(user=user, name="Дом", items=[{"name": "позвонить сантехнику"}])
+        in_name = TaskFactory(user=user, name="Сантехник", description="", items=[])
+
+        response = api_client.get("/api/v1/tasks/", {"search": "сантехник"})
+
+        results = response.data["results"]
+        assert [task["id"] for task in results] == [in_name.id, in_item.id]
+        assert results[0]["search_rank"] > results[1]["search_rank"]
+        assert "<mark>сантехнику</mark>" in results[1]["search_headline"]
+        assert "search_rank" not in api_client.get("/api/v1/tasks/").data["results"][0]
+
+    def test_explicit_ordering(self, user, api_client):
+        api_client.force_authenticate(user)
+        b = TaskFactory(user=user, name="б ремонт", items=[])
+        a = TaskFactory(user=user, name="а", items=[{"name": "ремонт"}])
+
+        assert search_ids(api_client, "ремонт", ordering="name") == [a.id, b.id]
+
+    def test_paginates_by_rank(self, user, api_client):
+        api_client.force_authenticate(user)
+        tasks = [
+            TaskFactory(user=user, name="ремонт " * (i % 3 + 1), description="", items=[])
+            for i in range(7)
+        ]
+
+        response = api_client.get("/api/v1/tasks/", {"search": "ремонт", "page_size": 3})
+        ids = [task["id"] for task in response.data["results"]]
+        while response.data["next"]:
+            response = api_client.get(response.data["next"])
+            ids += [task["id"] for task in response.data["results"]]
+
+        assert sorted(ids) == sorted(task.id for task in tasks)
+        assert len(ids) == len(tasks)
+
+    @pytest.mark.django_db(transaction=True)
+    def test_vector_follows_writes(self, user, api_client):
+        api_client.force_authenticate(user)
+        response = api_client.post(
+            "/api/v1/tasks/",
+            {"name": "Отпуск", "items": [{"name": "забронировать гостиницу"}]},
+            format="json",
+        )
+        task = Tasks.objects.get(pk=response.data["id"])
+        item = task.items.get()
+        other = TaskFactory(user=user, name="Другое", items=[])
+        assert search_ids(api_client, "гостиница") == [task.id]
+
+        api_client.patch(
+            f"/api/v1/tasks/{task.id}/items/{item.id}/", {"name": "купить палатку"}, format="json"
+        )
+        assert search_ids(api_client, "гостиница") == []
+        assert search_ids(api_client, "палатка") == [task.id]
+
+        api_client.patch(f"/api/v1/tasks/{task.id}/", {"name": "Поход"}, format="json")
+        assert search_ids(api_client, "отпуск") == []
+        assert search_ids(api_client, "поход") == [task.id]
+
+        item.refresh_from_db()
+        item.task = other
+        item.save()
+        assert search_ids(api_client, "палатка") == [other.id]
+
+        api_client.delete(f"/api/v1/tasks/{other.id}/items/{item.id}/")
+        assert search_ids(api_client, "палатка") == []
+
+        template = TemplateTaskFactory(created_by=user, name="Сборы", items=[{"name": "рюкзак"}])
+        api_client.post(
+            f"/api/v1/template/{template.id}/create_from_template/", {"count": 2}, format="json"
+        )
+        assert len(search_ids(api_client, "рюкзак")) == 2
+        check_search_vectors()
+
+    def test_save_keeps_vector(self, user):
+        task = TaskFactory(user=user, name="старое", items=[])
+        stale = Tasks.objects.get(pk=task.pk)
+        TaskItem.objects.create(task=task, name="подзадача")
+
+        stale.description = "описание"
+        stale.save()
+
+        check_search_vectors()
+        assert Tasks.objects.filter(search_vector=SearchQuery("подзадача", config="russian"))
+
+
+def autocomplete(api_client, query, **params):
+    response = api_client.get("/api/v1/tasks/tags/", {"q": query, **params})
+    assert response.status_code == 200
+    return [tag["name"] for tag in response.data]
+
+
+@pytest.mark.django_db
+class TestTagAutocomplete:
+    @pytest.fixture
+    def tags(self, user, user1):
+        tags = {
+            name: Tags.objects.create(name=name, user=user)
+            for name in ("планирование", "планы", "список покупок", "работа")
+        }
+        Tags.objects.create(name="планёрка", user=user1)
+        task = TaskFactory(user=user, items=[{}, {}])
+        for item in task.items.all():
+            item.tags.add(tags["планы"])
+        task.items.first().tags.add(tags["планирование"])
+        return tags
+
+    def test_prefix_first_then_by_usage(self, user, api_client, tags):
+        api_client.force_authenticate(user)
+
+        assert autocomplete(api_client, "план") == ["планы", "планирование"]
+        assert autocomplete(api_client, " ПЛАН ", limit=1) == ["планы"]
+
+    def test_fuzzy_matches(self, user, api_client, tags):
+        api_client.force_authenticate(user)
+
+        assert autocomplete(api_client, "планировние") == ["планирование"]
+        assert autocomplete(api_client, "покупки") == ["список покупок"]
+        assert autocomplete(api_client, "планёрка") == []
+
+    def test_limit(self, user, api_client):
+        api_client.force_authenticate(user)
+        Tags.objects.bulk_create([Tags(name=f"тег{i}", user=user) for i in range(60)])
+
+        assert len(autocomplete(api_client, "тег")) == 10
+        assert len(autocomplete(api_client, "тег", limit=100)) == 50
+        assert len(autocomplete(api_client, "тег", limit="x")) == 10
+
+    def test_without_q_lists_all(self, user, api_client, tags):
+        api_client.force_authenticate(user)
+
+        response = api_client.get("/api/v1/tasks/tags/")
+
+        assert len(response.data) == len(tags)
+
+    @pytest.mark.django_db(transaction=True)
+    def test_cache_follows_tag_writes(self, user, api_client):
+        api_client.force_authenticate(user)
+        assert autocomplete(api_client, "раб") == []
+
+        api_client.post("/api/v1/tasks/tags/", {"name": "работа"}, format="json")
+        assert autocomplete(api_client, "раб") == ["работа"]
+
+        Tags.objects.filter(user=user).get().delete()
+        assert autocomplete(api_client, "раб") == []
+
+    @pytest.mark.django_db(transaction=True)
+    def test_cache_follows_nested_tags_input(self, user, api_client):
+        api_client.force_authenticate(user)
+        assert autocomplete(api_client, "раб") == []
+
+        api_client.post(
+            "/api/v1/tasks/",
+            {"name": "задача", "items": [{"name": "п", "tags_input": ["работа"]}]},
+            format="json",
+        )
+
+        assert autocomplete(api_client, "раб") == ["работа"]
+
+
+@pytest.mark.django_db
+class TestAgenda:
+    def test_groups_by_day(self, user, user1, api_client):
+        api_client.force_authenticate(user)
+        monday = timezone.localdate() - timedelta(days=timezone.localdate().weekday())
+        task = TaskFactory(
+            user=user,
+            name="Ремонт",
+            items=[
+                {"name": "обои", "planned_date": monday},
+                {"name": "краска", "planned_date": monday, "status": "completed"},
+                {"name": "плитка", "planned_date": monday + timedelta(days=3)},
+                {"name": "без даты", "planned_date": None},
+                {"name": "потом", "planned_date": monday + timedelta(days=7)},
+            ],
+        )
+        TaskFactory(user=user1, items=[{"planned_date": monday}])
+
+        response = api_client.get("/api/v1/tasks/agenda/")
+
+        assert response.status_code == 200
+        assert (response.data["from"], response.data["to"]) == (
+            monday,
+            monday + timedelta(days=6),
+        )
+        first, second = response.data["days"]
+        assert first["date"] == monday
+        assert first["counts"] == {"process": 1, "completed": 1}
+        assert [item["name"] for item in first["items"]] == ["обои", "краска"]
+        assert first["items"][0]["task_id"] == task.id
+        assert first["items"][0]["task_name"] == "Ремонт"
+        assert second["date"] == monday + timedelta(days=3)
+        assert second["counts"] == {"process": 1, "completed": 0}
+
+    def test_window(self, user, api_client):
+        api_client.force_authenticate(user)
+        TaskFactory(
+            user=user, items=[{"planned_date": "2026-03-01"}, {"planned_date": "2026-03-31"}]
+        )
+
+        response = api_client.get("/api/v1/tasks/agenda/?from=2026-03-01&to=2026-03-31")
+        assert [day["date"].day for day in response.data["days"]] == [1, 31]
+
+        response = api_client.get("/api/v1/tasks/agenda/?from=2026-03-01")
+        assert response.data["to"].isoformat() == "2026-03-07"
+        assert len(response.data["days"]) == 1
+
+    @pytest.mark.parametrize(
+        "params",
+        ["from=2026-13-01", "from=2026-03-02&to=2026-03-01", "from=2026-01-01&to=2026-06-01"],
+    )
+    def test_invalid_window(self, user, api_client, params):
+        api_client.force_authenticate(user)
+
+        response = api_client.get(f"/api/v1/tasks/agenda/?{params}")
+
+        assert response.status_code == 400
+        assert "error" in response.data
+
+    @pytest.mark.django_db(transaction=True)
+    def test_current_week_cache(self, user, api_client):
+        api_client.force_authenticate(user)
+        today = timezone.localdate()
+        task = TaskFactory(user=user, items=[{"planned_date": today}])
+        item = task.items.get()
+        assert len(api_client.get("/api/v1/tasks/agenda/").data["days"]) == 1
+
+        with CaptureQueriesContext(connection) as queries:
+            api_client.get("/api/v1/tasks/agenda/")
+        assert not [q for q in queries.captured_queries if "tasks_taskitem" in q["sql"]]
+
+        api_client.patch(
+            f"/api/v1/tasks/{task.id}/items/{item.id}/", {"status": "completed"}, format="json"
+        )
+        (day,) = api_client.get("/api/v1/tasks/agenda/").data["days"]
+        assert day["counts"]["completed"] == 1
+
+    def test_item_owner_is_copied(self, user):
+        task = TaskFactory(user=user, items=[{}])
+        template = TemplateTaskFactory(created_by=user, items=[{}, {}])
+        create_tasks_from_template(template, user, 2)
+
+        assert set(TaskItem.objects.values_list("user_id", flat=True)) == {user.id}
+        assert task.items.get().user_id == user.id
+
+    def test_date_filter_uses_items(self, user, api_client):
+        api_client.force_authenticate(user)
+        today = timezone.localdate()
+        task = TaskFactory(user=user, items=[{"planned_date": today}, {"planned_date": today}])
+        TaskFactory(user=user, items=[{"planned_date": None}])
+
+        response = api_client.get("/api/v1/tasks/?date=today")
+
+        assert [found["id"] for found in response.data["results"]] == [task.id]
+
+
+def filtered_ids(api_client, query):
+    response = api_client.get(f"/api/v1/tasks/?{query}&ordering=id")
+    assert response.status_code == 200
+    return [task["id"] for task in response.data["results"]]
+
+
+@pytest.mark.django_db
+class TestTaskFilter:
+    @pytest.fixture
+    def tasks(self, user):
+        today = timezone.localdate()
+        work = Tags.objects.create(name="работа", user=user)
+        done = TaskFactory(user=user, items=[{"status": "completed", "planned_date": today}])
+        late = TaskFactory(
+            user=user,
+            items=[
+                {"planned_date": today - timedelta(days=2)},
+                {"planned_date": today - timedelta(days=1)},
+                {"status": "completed", "planned_date": today + timedelta(days=5)},
+            ],
+        )
+        later = TaskFactory(user=user, items=[{"planned_date": today + timedelta(days=5)}])
+        late.items.first().tags.add(work)
+        return {"done": done.id, "late": late.id, "later": later.id}
+
+    def test_item_filters(self, user, api_client, tasks):
+        api_client.force_authenticate(user)
+        today = timezone.localdate()
+
+        assert filtered_ids(api_client, "item_status=completed") == [tasks["done"], tasks["late"]]
+        assert filtered_ids(api_client, "item_tag=работа") == [tasks["late"]]
+        assert filtered_ids(api_client, f"planned_from={today + timedelta(days=1)}") == [
+            tasks["late"],
+            tasks["later"],
+        ]
+        assert filtered_ids(api_client, f"planned_to={today}") == [tasks["done"], tasks["late"]]
+        assert filtered_ids(api_client, "overdue=true") == [tasks["late"]]
+        assert filtered_ids(api_client, "overdue=false") == [tasks["done"], tasks["later"]]
+        assert filtered_ids(api_client, "date=planned") == [tasks["late"], tasks["later"]]
+        assert filtered_ids(api_client, "date=today") == [tasks["done"]]
+        assert filtered_ids(api_client, "date=not sorted") == []
+
+    def test_conditions_match_one_item(self, user, api_client, tasks):
+        api_client.force_authenticate(user)
+        today = timezone.localdate()
+
+        # у late есть завершённая подзадача и подзадача до сегодня, но это разные подзадачи
+        query = f"item_status=completed&planned_to={today}"
+        assert filtered_ids(api_client, query) == [tasks["done"]]
+
+    def test_compiles_to_exists(self, user, api_client, tasks):
+        api_client.force_authenticate(user)
+
+        with CaptureQueriesContext(connection) as queries:
+            api_client.get("/api/v1/tasks/?item_status=process&item_tag=работа&overdue=true")
+
+        # и проверка ETag, и сама страница
+        statements = [q["sql"] for q in queries.captured_queries if 'FROM "tasks_tasks"' in q["sql"]]
+        assert len(statements) == 2
+        for sql in statements:
+            assert sql.count("EXISTS") == 1
+            assert "DISTINCT" not in sql
+
+    def test_invalid_value(self, user, api_client):
+        api_client.force_authenticate(user)
+
+        response = api_client.get("/api/v1/tasks/?item_status=unknown")
+
+        assert response.status_code == 400
+        assert "item_status" in response.data
+
+
+def check_tag_ids():
+    """``tag_ids`` подзадач совпадают с through-таблицей тегов."""
+    for items_model in (TaskItem, TemplateTaskItem):
+        for item in items_model.objects.prefetch_related("tags"):
+            assert item.tag_ids == sorted(tag.pk for tag in item.tags.all()), item
+
+
+def items_by_tags(api_client, url, query):
+    response = api_client.get(f"{url}?{query}")
+    assert response.status_code == 200
+    return [item["id"] for item in response.data["results"]["items"]]
+
+
+@pytest.mark.django_db
+class TestItemTagIds:
+    def test_nested_create_and_update(self, user, api_client):
+        api_client.force_authenticate(user)
+
+        response = api_client.post("/api/v1/tasks/", nested_task_data(2, 3), format="json")
+        assert response.status_code == 201
+        check_tag_ids()
+
+        task = Tasks.objects.get(pk=response.data["id"])
+        task_data = nested_task_data(2, 1)
+        for item_id, item_data in zip(task.items.values_list("id", flat=True), task_data["items"]):
+            item_data["id"] = item_id
+        task_data["items"][0]["tags_input"] = ["новый"]
+        response = api_client.put(f"/api/v1/tasks/{task.id}/", task_data, format="json")
+        assert response.status_code == 200
+        check_tag_ids()
+
+    def test_templates(self, user):
+        template = make_template(user, 2)
+        check_tag_ids()
+
+        tasks = create_tasks_from_template(template, user=user, count=2)
+        create_templates_from_tasks(Tasks.objects.filter(pk__in=[task.pk for task in tasks]))
+        check_tag_ids()
+        assert all(item.tag_ids for item in TaskItem.objects.all())
+
+    def test_m2m_changes(self, user):
+        task = TaskFactory(user=user, items=[{}, {}])
+        first, second = task.items.order_by("id")
+        work, home = (Tags.objects.create(name=name, user=user) for name in ("работа", "дом"))
+
+        first.tags.add(work, home)
+        home.tasks.add(second)
+        check_tag_ids()
+        first.tags.remove(home)
+        check_tag_ids()
+        home.tasks.clear()
+        check_tag_ids()
+        first.tags.clear()
+        check_tag_ids()
+        assert TaskItem.objects.filter(tag_ids=[]).count() == 2
+
+    def test_tag_delete(self, user):
+        task = TaskFactory(user=user, items=[{}])
+        template = make_template(user, 1, tags=("работа", "дом"))
+        work = Tags.objects.get(name="работа")
+        task.items.get().tags.add(work)
+
+        work.delete()
+
+        check_tag_ids()
+        assert template.items.get().tag_ids == [Tags.objects.get(name="дом").pk]
+
+    def test_save_keeps_tag_ids(self, user):
+        task = TaskFactory(user=user, items=[{}])
+        stale = task.items.get()
+        stale.tags.add(Tags.objects.create(name="работа", user=user))
+
+        stale.name = "Переименована"
+        stale.save()
+
+        check_tag_ids()
+
+
+@pytest.mark.django_db
+class TestTagsFilter:
+    @pytest.fixture
+    def tasks(self, user, user1):
+        work, urgent, home = (
+            Tags.objects.create(name=name, user=user) for name in ("работа", "срочно", "дом")
+        )
+        both = TaskFactory(user=user, items=[{}, {}])
+        both.items.first().tags.add(work, urgent)
+        split = TaskFactory(user=user, items=[{}, {}])
+        first, second = split.items.order_by("id")
+        first.tags.add(work)
+        second.tags.add(urgent)
+        home_task = TaskFactory(user=user, items=[{}])
+        home_task.items.get().tags.add(home)
+        # одноимённый тег другого пользователя не участвует
+        foreign = TaskFactory(user=user1, items=[{}])
+        foreign.items.get().tags.add(Tags.objects.create(name="работа", user=user1))
+        return {"both": both, "split": split, "home": home_task}
+
+    def test_task_list(self, user, api_client, tasks):
+        api_client.force_authenticate(user)
+        both, split, home = (tasks[key].id for key in ("both", "split", "home"))
+
+        assert filtered_ids(api_client, "tags_all=работа,срочно") == [both]
+        assert filtered_ids(api_client, "tags_all=работа") == [both, split]
+        assert filtered_ids(api_client, "tags_any=срочно,дом") == [both, split, home]
+        # оба условия относятся к одной подзадаче
+        assert filtered_ids(api_client, "tags_any=работа&tags_all=срочно") == [both]
+        assert filtered_ids(api_client, "tags_all=работа,неизвестный") == []
+        assert filtered_ids(api_client, "tags_any=работа,неизвестный") == [both, split]
+        assert filtered_ids(api_client, "tags_any=неизвестный") == []
+
+    def test_task_items(self, user, api_client, tasks):
+        api_client.force_authenticate(user)
+        split = tasks["split"]
+        first, second = split.items.order_by("id").values_list("id", flat=True)
+        url = f"/api/v1/tasks/{split.id}/"
+
+        assert items_by_tags(api_client, url, "tags_all=работа") == [first]
+        assert items_by_tags(api_client, url, "tags_any=работа,срочно") == [first, second]
+        assert items_by_tags(api_client, url, "tags_all=работа,срочно") == []
+
+    def test_template_items(self, user, api_client):
+        api_client.force_authenticate(user)
+        template = make_template(user, 1, tags=("работа",))
+        TemplateTaskItem.objects.create(task=template, name="без тегов")
+        item_id = template.items.get(tag_ids__len=1).id
+        url = f"/api/v1/template/{template.id}/"
+
+        assert items_by_tags(api_client, url, "tags_any=работа") == [item_id]
+        assert len(items_by_tags(api_client, url, "")) == 2
+        assert items_by_tags(api_client, url, "tags_all=дом") == []
+
+
+def asgi_get(user, url, **headers):
+    """GET через ASGI-обработчик Django, как под uvicorn."""
+    headers["Authorization"] = f"Bearer {AccessToken.for_user(user)}"
+    return async_to_sync(AsyncClient().get)(url, headers=headers)
+
+
+@pytest.mark.django_db
+class TestAsyncReads:
+    @pytest.fixture
+    def urls(self, user):
+        task = TaskFactory(user=user, items=[{}, {}, {}])
+        task.items.first().tags.add(Tags.objects.create(name="работа", user=user))
+        template = make_template(user, 3)
+        # AsyncClient не кодирует кириллицу в строке запроса
+        return [
+            quote(url, safe="/?=&,")
+            for url in [
+                "/api/v1/tasks/",
+                "/api/v1/tasks/?ordering=name&tags_any=работа",
+                f"/api/v1/tasks/{task.id}/",
+                f"/api/v1/tasks/{task.id}/?items_page=2",
+                "/api/v1/template/",
+                f"/api/v1/template/{template.id}/?tags_all=тег1,тег2",
+                "/api/v1/tasks/tags/",
+                "/api/v1/tasks/tags/?q=раб",
+            ]
+        ]
+
+    def test_read_routes_are_coroutines(self, urls):
+        for url in urls:
+            assert iscoroutinefunction(resolve(url.split("?")[0]).func), url
+        assert not iscoroutinefunction(resolve("/api/v1/tasks/stats/").func)
+
+    def test_asgi_matches_wsgi(self, user, api_client, urls):
+        api_client.force_authenticate(user)
+
+        for url in urls:
+            cache.clear()
+            expected = api_client.get(url)
+            cache.clear()
+            response = asgi_get(user, url)
+            assert response.status_code == expected.status_code == 200, url
+            assert response.json() == expected.json(), url
+
+    def test_not_modified_and_not_found(self, user, user1, urls):
+        task_url = urls[2]
+        etag = asgi_get(user, task_url)["ETag"]
+
+        assert asgi_get(user, task_url, **{"If-None-Match": etag}).status_code == 304
+        assert asgi_get(user1, task_url).status_code == 404
+        assert asgi_get(user, "/api/v1/tasks/abc/").status_code == 404
+        assert async_to_sync(AsyncClient().get)("/api/v1/tasks/").status_code == 401
+
+    def test_writes_stay_sync(self, user, task_data):
+        data_json, _ = task_data
+
+        response = async_to_sync(AsyncClient().post)(
+            "/api/v1/tasks/",
+            data_json,
+            content_type="application/json",
+            headers={"Authorization": f"Bearer {AccessToken.for_user(user)}"},
+        )
+
+        assert response.status_code == 201
+        assert Tasks.objects.filter(user=user).count() == 1
+
+
+def test_concurrency_limit():
+    running, peak = 0, 0
+
+    async def app(scope, receive, send):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    async def serve():
+        limited = ConcurrencyLimit(app, 3)
+        await asyncio.gather(*(limited({"type": "http"}, None, None) for _ in range(10)))
+
+    asyncio.run(serve())
+
+    assert peak == 3
+
+
+@pytest.mark.django_db
+class TestServe:
+    @pytest.fixture
+    def started(self, monkeypatch):
+        """Конфиг gunicorn, с которым ``serve`` запустил бы сервер."""
+        configs = []
+        monkeypatch.setattr(Server, "run", lambda self: configs.append((self.target, self.cfg)))
+        # serve --interface wsgi меняет переменную, setenv вернёт её после теста
+        monkeypatch.setenv("GUNICORN_WORKER_CLASS", server.ASYNC_WORKER_CLASS)
+        monkeypatch.delenv("GUNICORN_WORKERS", raising=False)
+        return configs
+
+    def test_asgi_defaults(self, started, monkeypatch):
+        monkeypatch.setattr(server.multiprocessing, "cpu_count", lambda: 4)
+
+        call_command("serve")
+
+        [(target, cfg)] = started
+        assert target == "trackit.asgi.application"
+        assert cfg.worker_class_str == server.ASYNC_WORKER_CLASS
+        assert cfg.workers == 4
+        assert cfg.preload_app
+        assert cfg.max_requests == 1000
+        assert cfg.max_requests_jitter == 100
+        assert cfg.graceful_timeout == 30
+
+    def test_wsgi_options(self, started, monkeypatch):
+        monkeypatch.setattr(server.multiprocessing, "cpu_count", lambda: 4)
+
+        call_command("serve", "--interface", "wsgi", "--bind", "127.0.0.1:9000")
+        call_command("serve", "--interface", "wsgi", "--workers", "2", "--max-requests", "50")
+
+        (target, cfg), (_, explicit) = started
+        assert target == "trackit.wsgi.application"
+        assert cfg.worker_class_str == "sync"
+        assert cfg.workers == 9
+        assert cfg.bind == ["127.0.0.1:9000"]
+        assert explicit.workers == 2
+        assert (explicit.max_requests, explicit.max_requests_jitter) == (50, 5)
+
+    def test_warm_up(self, monkeypatch):
+        def unavailable():
+            raise ConnectionError("redis down")
+
+        assert set(server.warm_up()) == {"urls", "db", "cache"}
+
+        monkeypatch.setitem(server.WARMUPS, "cache", unavailable)
+        timings = server.warm_up(("db", "cache"))
+        assert isinstance(timings["db"], float)
+        assert timings["cache"] == "ConnectionError: redis down"
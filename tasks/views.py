@@ -1,155 +1,560 @@
+import hashlib
+import inspect
 import os
-
-from django.contrib.auth import get_user_model
-from django.core.cache import cache
-from django.db import transaction
-from django.db.models import Count
-from django.http import HttpResponse
+from datetime import date, timedelta
+from functools import update_wrapper, wraps
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Count, Max, Subquery
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import classonlymethod
+from django.utils.http import http_date
 from django_filters.rest_framework import DjangoFilterBackend
-from django_redis import get_redis_connection
-from rest_framework import filters, generics, status, viewsets
+from rest_framework import filters, generics, serializers, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import NotFound, PermissionDenied
 from rest_framework.pagination import PageNumberPagination
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 from rest_framework.response import Response
 
-from tasks.filters import DateFilterBackend
-from tasks.models import Tags, TaskItem, Tasks, TemplateTasks, AbstractTaskItem, TemplateTaskItem
+from tasks.filters import TaskFilter, TaskSearchFilter, filter_items_by_tags
+from tasks.pagination import TaskPagination
+from tasks.models import (AbstractTaskItem, DeletionLog, Tags, TaskItem, Tasks, TemplateTaskItem,
+                          TemplateTasks)
 from tasks.permissions import IsOwner, TemplateIsOwnerOrReadOnly
-from tasks.serializer import (TagSerializer, TaskItemSerializer,
-                              TaskSerializer, TemplateTaskSerializer, TemplateTaskItemSerializer)
+from tasks.serializer import (TagChangeSerializer, TagSerializer, TaskChangeSerializer,
+                              TaskItemChangeSerializer, TaskItemSerializer, TaskSerializer,
+                              TemplateTaskItemSerializer, TemplateTaskSerializer)
+from tasks.services import (AGENDA_MAX_DAYS, STATUS_UPDATES_MAX_COUNT, TAG_AUTOCOMPLETE_LIMIT,
+                            TAG_AUTOCOMPLETE_MAX_LIMIT, TEMPLATE_MAX_COUNT, ExpiredChangesToken,
+                            autocomplete_tags, collect_agenda, collect_changes,
+                            collect_task_stats, create_tasks_from_template, current_week,
+                            read_changes_token, tags_cache, tasks_cache, template_cache,
+                            update_items_status)
+
+
+def params_digest(request) -> str:
+    """Хэш отсортированных параметров запроса."""
+    params = urlencode(sorted(request.query_params.lists()), doseq=True)
+    return hashlib.md5(params.encode()).hexdigest()
+
+
+def weak_etag(*parts) -> str:
+    return 'W/"%s"' % hashlib.md5(":".join(map(str, parts)).encode()).hexdigest()
+
+
+def conditional_get(validators):
+    """Отвечает 304 на ``If-None-Match``/``If-Modified-Since`` до вызова view.
+
+    Оборачивает корутину view. ``await validators(view, request)`` возвращает
+    ``(etag, last_modified)``, любое из значений может быть ``None``.
+    Успешный ответ получает заголовки ``ETag`` и ``Last-Modified``.
+    """
+
+    def decorator(view_method):
+        @wraps(view_method)
+        async def wrapper(self, request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return await view_method(self, request, *args, **kwargs)
+
+            etag, last_modified = await validators(self, request)
+            headers = {}
+            if etag:
+                headers["ETag"] = etag
+            if last_modified:
+                headers["Last-Modified"] = http_date(last_modified.timestamp())
+
+            not_modified = get_conditional_response(
+                request,
+                etag=etag,
+                last_modified=int(last_modified.timestamp()) if last_modified else None,
+            )
+            if not_modified is not None:
+                return Response(status=not_modified.status_code, headers=headers)
+
+            response = await view_method(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                for header, value in headers.items():
+                    response[header] = value
+            return response
 
+        return wrapper
 
-# Create your views here.
-def create_task_from_template(template: TemplateTasks, user: get_user_model()) -> Tasks:
-    task = Tasks.objects.create(
-        user=user,
-        name=template.name,
-        description=template.description,
-        template=template,
+    return decorator
+
+
+async def task_list_validators(view, request):
+    queryset = await view.afilter_queryset()
+    # удаление задачи не двигает Max(updated_at) оставшихся, поэтому
+    # учитывается и последнее надгробие пользователя
+    last_deleted = (
+        DeletionLog.objects.filter(user=request.user)
+        .order_by("-deleted_at")
+        .values("deleted_at")[:1]
+    )
+    aggregate = await queryset.aaggregate(
+        last_modified=Max("updated_at"), last_deleted=Max(Subquery(last_deleted)), count=Count("id")
     )
+    last_modified = max(
+        filter(None, (aggregate["last_modified"], aggregate["last_deleted"])), default=None
+    )
+    etag = weak_etag(request.user.pk, aggregate["count"], last_modified, params_digest(request))
+    return etag, last_modified
+
+
+async def task_validators(view, request):
+    pk = view.kwargs["pk"]
+    try:
+        last_modified = await (
+            Tasks.objects.filter(user=request.user, pk=pk)
+            .values_list("updated_at", flat=True)
+            .afirst()
+        )
+    except (TypeError, ValueError):
+        # нечисловой pk: 404 ответит сам view
+        return None, None
+    if last_modified is None:
+        return None, None
+    return weak_etag(view.action, pk, last_modified, params_digest(request)), last_modified
+
+
+async def template_validators(view, request):
+    """У шаблонов нет ``updated_at``, валидатором служит поколение их кэша."""
+    scope = view.kwargs.get("pk", "list")
+    version = await template_cache.aversion(scope)
+    return weak_etag(view.action, scope, version, params_digest(request)), None
+
+
+def parse_status_updates(updates):
+    """``[{id, status}]`` из тела запроса в ``{id: status}`` или ответ с ошибкой."""
+    if not isinstance(updates, list) or not updates:
+        return None, Response(
+            {"error": "subtask_ids must be a list"}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    parsed = {}
+    for on_update in updates:
+        if not isinstance(on_update, dict):
+            return None, Response(
+                {"error": "subtask_ids must be a list"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if on_update.get("status") not in AbstractTaskItem.StatusChoices:
+            return None, Response(
+                {"error": "Invalid status"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        item_id = on_update.get("id")
+        if isinstance(item_id, (list, dict)):
+            return None, Response({"error": "Invalid id"}, status=status.HTTP_400_BAD_REQUEST)
+        # при повторе id побеждает последний статус
+        parsed[item_id] = on_update["status"]
+    return parsed, None
+
+
+def parse_agenda_window(params):
+    """Окно ``?from=``/``?to=`` — ``((start, end), None)`` или ``(None, Response 400)``.
+
+    Без параметров — текущая неделя, без одной из границ — неделя от другой.
+    """
+    try:
+        start = params.get("from") and date.fromisoformat(params["from"])
+        end = params.get("to") and date.fromisoformat(params["to"])
+    except ValueError:
+        return None, Response({"error": "Invalid date"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not start and not end:
+        return current_week(), None
+    start = start or end - timedelta(days=6)
+    end = end or start + timedelta(days=6)
+    if start > end:
+        return None, Response(
+            {"error": "from must not be after to"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    if (end - start).days >= AGENDA_MAX_DAYS:
+        return None, Response(
+            {"error": f"Window is limited to {AGENDA_MAX_DAYS} days"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return (start, end), None
+
+
+def user_response_cache(view_method):
+    """Кэширует успешные GET-ответы в ``tasks_cache``.
+
+    Ключ — пользователь (область кэша), action, pk и отсортированные
+    параметры запроса, так что фильтры, сортировка, поиск и страница
+    различаются, а любая запись пользователя сбрасывает всё его поколение.
+    Подходит и для обычных методов view, и для корутин.
+    """
+
+    def cache_parts(self, request, kwargs):
+        return request.user.pk, self.action, kwargs.get("pk", ""), params_digest(request)
+
+    if inspect.iscoroutinefunction(view_method):
+
+        @wraps(view_method)
+        async def async_wrapper(self, request, *args, **kwargs):
+            if request.method != "GET":
+                return await view_method(self, request, *args, **kwargs)
+
+            cache_key = await tasks_cache.akey(*cache_parts(self, request, kwargs))
+            cached_data = await tasks_cache.aget(cache_key)
+            if cached_data is not None:
+                return Response(cached_data)
 
-    for item in template.items.all():
-        TaskItem.objects.create(
-            name=item.name,
-            description=item.description,
-            planned_date=item.planned_date,
-            task=task,
+            response = await view_method(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                await tasks_cache.aset(cache_key, response.data)
+            return response
+
+        return async_wrapper
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        if request.method != "GET":
+            return view_method(self, request, *args, **kwargs)
+
+        cache_key = tasks_cache.key(*cache_parts(self, request, kwargs))
+        cached_data = tasks_cache.get(cache_key)
+        if cached_data is not None:
+            return Response(cached_data)
+
+        response = view_method(self, request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            tasks_cache.set(cache_key, response.data)
+        return response
+
+    return wrapper
+
+
+class AsyncReadMixin:
+    """Чтения корутинами: под ASGI медленный запрос к базе не держит воркер.
+
+    GET и HEAD к action, у которого есть корутина ``a<action>`` (``alist``,
+    ``aretrieve``, у обычных view — ``aget``), обрабатываются в event loop:
+    данные читаются async ORM и async-методами кэша. Аутентификация, права
+    и троттлинг DRF синхронные и выполняются в потоке через ``sync_to_async``,
+    как и остальные методы view. Под WSGI Django сам вызывает такой view
+    через ``async_to_sync``.
+    """
+
+    @classonlymethod
+    def as_view(cls, *args, **initkwargs):
+        sync_view = super().as_view(*args, **initkwargs)
+        actions = getattr(sync_view, "actions", None)
+        async_methods = {
+            method
+            for method in ("get", "head")
+            if inspect.iscoroutinefunction(getattr(cls, cls.async_handler_name(method, actions), None))
+        }
+        if not async_methods:
+            return sync_view
+
+        async def view(request, *args, **kwargs):
+            if request.method.lower() in async_methods:
+                # dispatch вернёт корутину adispatch, сам view ничего не читает
+                return await sync_view(request, *args, **kwargs)
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+
+        # cls, actions и csrf_exempt читают роутер, middleware и CSRF
+        return update_wrapper(view, sync_view)
+
+    @staticmethod
+    def async_handler_name(method, actions=None) -> str:
+        method = "get" if method == "head" else method
+        return f"a{actions.get(method, method) if actions else method}"
+
+    def dispatch(self, request, *args, **kwargs):
+        handler_name = self.async_handler_name(
+            request.method.lower(), getattr(self, "action_map", None)
+        )
+        if not inspect.iscoroutinefunction(getattr(self, handler_name, None)):
+            return super().dispatch(request, *args, **kwargs)
+        return self.adispatch(handler_name, request, *args, **kwargs)
+
+    async def adispatch(self, handler_name, request, *args, **kwargs):
+        """``APIView.dispatch`` для корутины-обработчика."""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            response = await getattr(self, handler_name)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def aget_object(self):
+        """``get_object`` на async ORM."""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            obj = await queryset.filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            ).afirst()
+        except (TypeError, ValueError, ValidationError):
+            obj = None
+        if obj is None:
+            raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+
+class FieldsProjectionMixin:
+    """Проецирует queryset на поля, запрошенные через ``?fields=``/``?exclude=``.
+
+    Колонки, которые сериализатор не отдаст, откладываются через ``defer()``,
+    кроме полей сортировки — их читает пагинация.
+    """
+
+    def rendered_fields(self) -> set:
+        return self.get_serializer_class().rendered_fields(self.request)
+
+    def fields_cache_key(self) -> str:
+        params = self.request.query_params
+        serializer_class = self.get_serializer_class()
+        return ":".join(
+            f"{param}={','.join(sorted(serializer_class._parse(params[param])))}"
+            for param in (serializer_class.fields_query_param, serializer_class.exclude_query_param)
+            if params.get(param)
         )
 
-    return task
+    def project(self, queryset):
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+
+        serializer_class = self.get_serializer_class()
+        ordering = {name.lstrip("-") for name in queryset.query.order_by if isinstance(name, str)}
+        model_fields = {field.name for field in queryset.model._meta.concrete_fields}
+        deferred = (
+            (serializer_class.readable_fields() - self.rendered_fields() - ordering - {"id"})
+            & model_fields
+        )
+        return queryset.defer(*deferred) if deferred else queryset
 
 
 class TaskItemPagination(PageNumberPagination):
     page_size = 2
     page_query_param = "items_page"
 
-
-class TaskPagination(PageNumberPagination):
-    page_size = 5
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """То же, что ``paginate_queryset``, но ``COUNT`` и страница читаются async ORM."""
+        self.request = request
+        paginator = self.django_paginator_class(queryset, self.get_page_size(request))
+        # count — cached_property, Paginator больше не пойдёт за ним в базу
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(
+                self.invalid_page_message.format(page_number=page_number, message=str(exc))
+            )
+        self.page.object_list = [obj async for obj in self.page.object_list]
+        return self.page.object_list
 
 
-class TemplateTaskViewSet(viewsets.ModelViewSet):
+class TemplateTaskViewSet(AsyncReadMixin, FieldsProjectionMixin, viewsets.ModelViewSet):
     serializer_class = TemplateTaskSerializer
     permission_classes = [IsAuthenticated, TemplateIsOwnerOrReadOnly]
-
+    query_budget = {
+        "list": 2,
+        "retrieve": 5,
+        "create": 6,
+        "update": 11,
+        "partial_update": 11,
+        "destroy": 7,
+        "create_from_template": 11,
+    }
 
     def get_queryset(self):
-
-        return TemplateTasks.objects.select_related(
-            'created_by',
-        ).prefetch_related('items').all()
+        queryset = TemplateTasks.objects.all()
+        if self.action == "create_from_template":
+            return queryset.prefetch_related('items')
+        if self.action == "retrieve":
+            return self.project(queryset)
+        return queryset
 
     @action(methods=["post", "get"], detail=True)
     def create_from_template(self, request, pk=None):
+        """POST создаёт задачи по шаблону.
 
+        Без ``count`` в ответе одна задача, с ``count`` (JSON или форма,
+        от 1 до ``TEMPLATE_MAX_COUNT``) — список задач, даже при ``count=1``.
+        """
         if request.method == 'GET':
 
-            return self.retrieve(request)
+            return async_to_sync(self.aretrieve)(request, pk=pk)
 
         elif request.method == 'POST':
+            count_field = serializers.IntegerField(min_value=1, max_value=TEMPLATE_MAX_COUNT)
+            try:
+                count = count_field.run_validation(request.data.get("count", 1))
+            except serializers.ValidationError:
+                return Response(
+                    {"error": f"count must be an integer from 1 to {TEMPLATE_MAX_COUNT}"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
             template = self.get_object()
-            task = create_task_from_template(template, user=request.user)
-            serializer = TaskSerializer(task)
+            tasks = create_tasks_from_template(template, user=request.user, count=count)
+            if "count" in request.data:
+                serializer = TaskSerializer(tasks, many=True)
+            else:
+                serializer = TaskSerializer(tasks[0])
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    def retrieve(self, request, *args, **kwargs):
+    @conditional_get(template_validators)
+    async def aretrieve(self, request, *args, **kwargs):
         template_id = kwargs.get("pk")
         page_number = request.query_params.get("items_page", 1)
-        cache_key = f"template_tasks:{template_id}:page:{page_number}"
-
-        cached_response = cache.get(cache_key)
+        cache_key = await template_cache.akey(template_id, "page", page_number)
+        if self.fields_cache_key():
+            cache_key = f"{cache_key}:{self.fields_cache_key()}"
+        tag_params = [
+            f"{param}={request.query_params[param]}"
+            for param in TaskFilter.TAG_LOOKUPS
+            if request.query_params.get(param)
+        ]
+        if tag_params:
+            digest = hashlib.md5("&".join(tag_params).encode()).hexdigest()
+            cache_key = f"{cache_key}:tags={digest}"
+
+        cached_response = await template_cache.aget(cache_key)
         if cached_response:
             return Response(cached_response)
 
-        template = self.get_object()
-        items_qs = template.items.all().order_by("id")
+        template = await self.aget_object()
+        # имена тегов переводятся в id синхронным запросом
+        items_qs = await sync_to_async(filter_items_by_tags)(
+            template.items.prefetch_related('tags').order_by("id"),
+            request.query_params,
+            template.created_by_id,
+        )
 
         paginator = TaskItemPagination()
-        paginated_items = paginator.paginate_queryset(items_qs, request)
+        paginated_items = await paginator.apaginate_queryset(items_qs, request)
 
         task_data = self.get_serializer(template).data
         task_data["items"] = TemplateTaskItemSerializer(paginated_items, many=True).data
-        cache.set(cache_key, task_data, timeout=300)
-
-
-        return paginator.get_paginated_response(task_data)
-
-    def list(self, request, *args, **kwargs):
-        cache_key = f"template_tasks_list"
-        cached_data = cache.get(cache_key)
+        response = paginator.get_paginated_response(task_data)
+        await template_cache.aset(cache_key, response.data)
+        return response
+
+    @conditional_get(template_validators)
+    async def alist(self, request, *args, **kwargs):
+        cache_key = await template_cache.akey("list")
+        if self.fields_cache_key():
+            cache_key = f"{cache_key}:{self.fields_cache_key()}"
+        cached_data = await template_cache.aget(cache_key)
         if cached_data:
             return Response(cached_data)
 
-        qs = self.filter_queryset(
-            self.get_queryset().annotate(items_count=Count("items"))
-        )
-        serialized = self.get_serializer(qs, many=True).data
-        cache.set(cache_key, serialized)
+        qs = self.project(self.filter_queryset(self.get_queryset()).order_by("id"))
+        serialized = self.get_serializer([template async for template in qs], many=True).data
+        await template_cache.aset(cache_key, serialized)
         return Response(serialized)
 
-    @staticmethod
-    def delete_pattern(redis, pattern):
-        """Удаляет все ключи по шаблону."""
-        for key in redis.scan_iter(pattern):
-            redis.delete(key)
-
-    def perform_update(self, serializer):
-        instance = serializer.save()
-        redis = get_redis_connection("default")
-
-        self.delete_pattern(redis, f"template_tasks:{instance.pk}:page:*")
-        redis.delete("template_tasks:list")
 
-        return instance
-
-    def perform_destroy(self, instance):
-        redis = get_redis_connection("default")
-
-        self.delete_pattern(redis, f"template_tasks:{instance.pk}:page:*")
-        redis.delete("template_tasks:list")
-
-        return instance.delete()
-
-class ViewSetTasks(viewsets.ModelViewSet):
+class ViewSetTasks(AsyncReadMixin, FieldsProjectionMixin, viewsets.ModelViewSet):
     serializer_class = TaskSerializer
     permission_classes = [IsAuthenticated, IsOwner]
+    pagination_class = TaskPagination
+    query_budget = {
+        "list": 3,
+        "retrieve": 6,
+        "create": 11,
+        "update": 15,
+        "partial_update": 15,
+        "destroy": 9,
+        "update_status": 7,
+        "changes": 6,
+        "bulk_status": 6,
+        "stats": 2,
+        "agenda": 2,
+    }
     filter_backends = [
         DjangoFilterBackend,
         filters.OrderingFilter,
-        DateFilterBackend,
-        filters.SearchFilter,
+        TaskSearchFilter,
     ]
-    ordering_fields = ["name", "id"]
-    search_fields = ["name"]
+    filterset_class = TaskFilter
+    ordering_fields = ["name", "id", "items_count", "completed_count", "progress"]
 
     def get_queryset(self):
-        return Tasks.objects.select_related(
-            'user', 'template'
-        ).prefetch_related('items').filter(user=self.request.user)
+        # вектор нужен только самому Postgres
+        queryset = Tasks.objects.filter(user=self.request.user).defer("search_vector")
+        if self.action in ("update", "partial_update"):
+            return queryset.select_related('user').prefetch_related('items')
+        if self.action == "retrieve":
+            return self.project(queryset)
+        return queryset
+
+    @action(methods=["get"], detail=False)
+    def changes(self, request):
+        """Изменения с курсора ``?since=`` и новый курсор для следующего вызова."""
+        since = request.query_params.get("since")
+        if since:
+            try:
+                since = read_changes_token(since)
+            except ExpiredChangesToken:
+                return Response(
+                    {"error": "since token expired, full resync required"},
+                    status=status.HTTP_410_GONE,
+                )
+            except ValueError:
+                return Response(
+                    {"error": "Invalid since token"}, status=status.HTTP_400_BAD_REQUEST
+                )
+
+        changes = collect_changes(request.user, since or None)
+        return Response(
+            {
+                "tasks": TaskChangeSerializer(changes["tasks"], many=True).data,
+                "items": TaskItemChangeSerializer(changes["items"], many=True).data,
+                "tags": TagChangeSerializer(changes["tags"], many=True).data,
+                "deleted": changes["deleted"],
+                "since": changes["since"],
+            }
+        )
+
+    @action(methods=["get"], detail=False)
+    def agenda(self, request):
+        """Подзадачи по дням в окне ``?from=``..``?to=`` со счётчиками статусов.
+
+        Текущая неделя кэшируется в ``tasks_cache`` до записи пользователя.
+        """
+        window, error = parse_agenda_window(request.query_params)
+        if error:
+            return error
+
+        cache_key = None
+        if window == current_week():
+            cache_key = tasks_cache.key(request.user.pk, "agenda", window[0])
+            cached_data = tasks_cache.get(cache_key)
+            if cached_data is not None:
+                return Response(cached_data)
+
+        data = collect_agenda(request.user, *window)
+        if cache_key:
+            tasks_cache.set(cache_key, data)
+        return Response(data)
+
+    @action(methods=["get"], detail=False)
+    def stats(self, request):
+        """Сводка подзадач: по статусам, просроченные, на сегодня и доля завершённых."""
+        return Response(collect_task_stats(request.user))
 
     @action(methods=["post", "get"], detail=True)
+    @user_response_cache
     def update_status(self, request, pk=None):
         if request.method == 'GET':
             task = self.get_object()
@@ -160,42 +565,28 @@ class ViewSetTasks(viewsets.ModelViewSet):
             return Response({'id_task_and_current_status': current_statuses})
 
         elif request.method == 'POST':
-
-            updates = request.data.get("updates")
-
-            if not isinstance(updates, list) or not updates:
-                return Response(
-                    {"error": "subtask_ids must be a list"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
+            updates, error = parse_status_updates(request.data.get("updates"))
+            if error:
+                return error
 
             task = self.get_object()
-            valid_id = frozenset(task.items.values_list('id', flat=True))
-            updated_data = {status_item: [] for status_item in AbstractTaskItem.StatusChoices.values}
-            not_found = []
-
-            for on_update in updates:
-                id = on_update.get("id")
-                new_status = on_update.get("status")
-
-                if new_status not in AbstractTaskItem.StatusChoices:
-                    return Response(
-                        {"error": "Invalid status"}, status=status.HTTP_400_BAD_REQUEST
-                    )
-
-                if id not in valid_id:
-                    not_found.append(id)
-                    continue
-
-                updated_data[new_status].append(id)
-
-            with transaction.atomic():
-                update_successfully = []
-                for status_item, ids in updated_data.items():
-                    task.items.filter(id__in=ids).update(status=status_item)
-                    update_successfully.extend(ids)
+            updated, not_found = update_items_status(request.user, updates, task=task)
+            return Response({"updated": updated, "not_found": not_found})
+
+    @action(methods=["post"], detail=False)
+    def bulk_status(self, request):
+        """Статусы подзадач из разных задач пользователя за один UPDATE."""
+        updates, error = parse_status_updates(request.data.get("updates"))
+        if error:
+            return error
+        if len(updates) > STATUS_UPDATES_MAX_COUNT:
+            return Response(
+                {"error": f"updates must contain at most {STATUS_UPDATES_MAX_COUNT} items"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-            return Response({"updated": update_successfully, "not_found": not_found})
+        updated, not_found = update_items_status(request.user, updates)
+        return Response({"updated": updated, "not_found": not_found})
 
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop("partial", False)
@@ -216,62 +607,113 @@ class ViewSetTasks(viewsets.ModelViewSet):
             status=status.HTTP_200_OK,
         )
 
-    def retrieve(self, request, *args, **kwargs):
-        task = self.get_object()
-        items_qs = task.items.all().order_by("id")
+    def filter_queryset(self, queryset):
+        # параметры карточки задачи фильтруют её подзадачи, а не саму задачу
+        if self.action == "retrieve":
+            return queryset
+        return super().filter_queryset(queryset)
+
+    async def afilter_queryset(self):
+        """Отфильтрованный queryset запроса, общий для валидаторов и ``alist``.
+
+        Фильтры по тегам переводят имена в id синхронным запросом, так что
+        он выполняется в потоке и один раз за запрос.
+        """
+        if getattr(self, "_filtered_queryset", None) is None:
+            self._filtered_queryset = await sync_to_async(self.filter_queryset)(
+                self.get_queryset()
+            )
+        return self._filtered_queryset
+
+    @conditional_get(task_validators)
+    @user_response_cache
+    async def aretrieve(self, request, *args, **kwargs):
+        task = await self.aget_object()
+        # имена тегов переводятся в id синхронным запросом
+        items_qs = await sync_to_async(filter_items_by_tags)(
+            task.items.prefetch_related('tags').order_by("id"), request.query_params, task.user_id
+        )
 
         paginator = TaskItemPagination()
-        paginated_items = paginator.paginate_queryset(items_qs, request)
+        paginated_items = await paginator.apaginate_queryset(items_qs, request)
 
         task_data = self.get_serializer(task).data
         task_data["items"] = TaskItemSerializer(paginated_items, many=True).data
 
         return paginator.get_paginated_response(task_data)
 
-    def list(self, request, *args, **kwargs):
-        qs = self.filter_queryset(
-            self.get_queryset().prefetch_related('items').annotate(items_count=Count("items"))
-        )
-        serialized = self.get_serializer(qs, many=True).data
-
-        return Response(serialized)
+    @conditional_get(task_list_validators)
+    @user_response_cache
+    async def alist(self, request, *args, **kwargs):
+        qs = await self.afilter_queryset()
+        page = await self.paginator.apaginate_queryset(self.project(qs), request, view=self)
+        serialized = self.get_serializer(page, many=True).data
 
+        return self.get_paginated_response(serialized)
 
-class TaskItemRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
-    serializer_class = TaskItemSerializer
-    permission_classes = [IsAuthenticated]
-    pagination_class = TaskItemPagination
 
-    def get_queryset(self):
-        return TaskItem.objects.select_related('task', 'task__user').prefetch_related('tags').filter(
-            task__user=self.request.user, task_id=self.kwargs["task_id"]
-        )
-
-
-class TaskItemRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class TaskItemRetrieveUpdateDestroyAPIView(
+    FieldsProjectionMixin, generics.RetrieveUpdateDestroyAPIView
+):
     serializer_class = TaskItemSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = TaskItemPagination
+    query_budget = {"get": 3, "put": 14, "patch": 14, "delete": 8}
 
     def get_queryset(self):
-        return TaskItem.objects.select_related('task', 'task__user').prefetch_related('tags').filter(
+        queryset = TaskItem.objects.filter(
             task__user=self.request.user, task_id=self.kwargs["task_id"]
         )
+        if self.request.method not in SAFE_METHODS:
+            return queryset.select_related('task', 'task__user').prefetch_related('tags')
+        if "tags" in self.rendered_fields():
+            queryset = queryset.prefetch_related('tags')
+        return self.project(queryset)
 
 
-class TemplateTaskItemRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class TemplateTaskItemRetrieveUpdateDestroyAPIView(
+    FieldsProjectionMixin, generics.RetrieveUpdateDestroyAPIView
+):
     serializer_class = TemplateTaskItemSerializer
     permission_classes = [IsAuthenticated, TemplateIsOwnerOrReadOnly]
     pagination_class = TaskItemPagination
+    query_budget = {"get": 3, "put": 12, "patch": 12, "delete": 6}
 
     def get_queryset(self):
-        return TemplateTaskItem.objects.select_related('task', 'task__created_by').prefetch_related('tags').filter(
-            task_id=self.kwargs["task_id"]
-            )
+        queryset = TemplateTaskItem.objects.filter(task_id=self.kwargs["task_id"])
+        if self.request.method not in SAFE_METHODS:
+            return queryset.select_related('task', 'task__created_by').prefetch_related('tags')
+        if "tags" in self.rendered_fields():
+            queryset = queryset.prefetch_related('tags')
+        return self.project(queryset)
 
 
-class TagsListCreateAPIView(generics.ListCreateAPIView):
+class TagsListCreateAPIView(AsyncReadMixin, generics.ListCreateAPIView):
     serializer_class = TagSerializer
+    query_budget = {"get": 2, "post": 3}
 
     def get_queryset(self):
-        return Tags.objects.select_related('user').filter(user=self.request.user)
+        return Tags.objects.filter(user=self.request.user)
+
+    async def aget(self, request, *args, **kwargs):
+        """С ``?q=`` — автодополнение: до ``?limit=`` подходящих тегов."""
+        query = request.query_params.get("q")
+        if query is None:
+            tags = [tag async for tag in self.filter_queryset(self.get_queryset())]
+            return Response(self.get_serializer(tags, many=True).data)
+
+        query = query.strip()[: Tags._meta.get_field("name").max_length]
+        try:
+            limit = int(request.query_params.get("limit", TAG_AUTOCOMPLETE_LIMIT))
+        except ValueError:
+            limit = TAG_AUTOCOMPLETE_LIMIT
+        limit = max(1, min(limit, TAG_AUTOCOMPLETE_MAX_LIMIT))
+
+        cache_key = await tags_cache.akey(
+            request.user.pk, "autocomplete", limit, hashlib.md5(query.encode()).hexdigest()
+        )
+        names = await tags_cache.aget(cache_key)
+        if names is None:
+            names = [name async for name in autocomplete_tags(request.user, query, limit)]
+            await tags_cache.aset(cache_key, names)
+        return Response([{"name": name} for name in names])
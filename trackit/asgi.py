@@ -7,10 +7,35 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "trackit.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402  настройки загружены выше
+
+
+class ConcurrencyLimit:
+    """Пропускает в Django не больше ``limit`` HTTP-запросов одновременно.
+
+    Под ASGI у каждого запроса своё подключение к Postgres и свой поток для
+    синхронного кода, так что без предела 200 соединений клиентов открыли бы
+    200 подключений к базе. Остальные запросы ждут своей очереди в event loop.
+    """
+
+    def __init__(self, app, limit):
+        self.app = app
+        self.semaphore = asyncio.Semaphore(limit)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        async with self.semaphore:
+            return await self.app(scope, receive, send)
+
+
+application = ConcurrencyLimit(django_application, settings.ASGI_MAX_CONCURRENCY)
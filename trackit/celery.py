@@ -13,6 +13,14 @@ app.conf.beat_schedule = {
         'task': 'user.tasks.clear_blacklist',
         'schedule': crontab(hour=0, minute=0),
     },
+    'prune-deletion-log-every-day': {
+        'task': 'tasks.tasks.prune_deletion_log',
+        'schedule': crontab(hour=0, minute=30),
+    },
+    'reconcile-task-stats-every-day': {
+        'task': 'tasks.tasks.reconcile_task_stats',
+        'schedule': crontab(hour=1, minute=0),
+    },
 }
 
 app.conf.timezone = 'UTC'
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""Запуск под gunicorn: размер пула воркеров и прогрев перед приёмом запросов.
+
+Используется хуками ``gunicorn.conf.py`` и командой ``manage.py serve``.
+Django здесь импортируется внутри функций: конфиг gunicorn читается
+раньше, чем загружено приложение.
+"""
+
+import logging
+import multiprocessing
+import time
+
+logger = logging.getLogger("trackit.server")
+
+ASYNC_WORKER_CLASS = "uvicorn_worker.UvicornWorker"
+WARMUP_CACHE_KEY = "server:warmup"
+
+
+def default_workers(worker_class) -> int:
+    """Воркер uvicorn — по одному на ядро, синхронные — ``2 * ядра + 1``."""
+    cpu_count = multiprocessing.cpu_count()
+    return cpu_count if worker_class == ASYNC_WORKER_CLASS else 2 * cpu_count + 1
+
+
+def warm_up_urls():
+    from django.urls import get_resolver
+
+    # reverse_dict собирает все шаблоны и импортирует модули view
+    get_resolver().reverse_dict
+
+
+def warm_up_db():
+    from django.db import connections
+
+    for connection in connections.all():
+        connection.ensure_connection()
+
+
+def warm_up_cache():
+    from django.core.cache import cache
+
+    # первое обращение создаёт пул соединений с Redis и открывает соединение
+    cache.get(WARMUP_CACHE_KEY)
+
+
+WARMUPS = {"urls": warm_up_urls, "db": warm_up_db, "cache": warm_up_cache}
+
+
+def warm_up(steps=tuple(WARMUPS)) -> dict:
+    """Выполняет шаги прогрева и возвращает их время в миллисекундах.
+
+    Упавший шаг не останавливает сервер (база или Redis могут подняться
+    позже): в словаре вместо времени будет текст ошибки.
+    """
+    timings = {}
+    for step in steps:
+        started = time.perf_counter()
+        try:
+            WARMUPS[step]()
+        except Exception as exc:
+            logger.warning("Warmup step %s failed: %s", step, exc)
+            timings[step] = f"{type(exc).__name__}: {exc}"
+        else:
+            timings[step] = round((time.perf_counter() - started) * 1000, 1)
+    return timings
+
+
+def close_connections():
+    """Закрывает соединения процесса, чтобы они не достались воркерам после fork."""
+    from django.db import connections
+
+    connections.close_all()
@@ -37,6 +37,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "tasks",
     "user",
     "rest_framework",
@@ -55,10 +56,30 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    'silk.middleware.SilkyMiddleware'
-
+    "tasks.middleware.SampledProfilingMiddleware",
+    "tasks.middleware.ProfileCaptureMiddleware",
+    "tasks.middleware.QueryBudgetMiddleware",
 ]
 
+# Выборочное профилирование запросов в таблицы silk (см. SampledProfilingMiddleware).
+# При PROFILING_ENABLED=False middleware не подключается вовсе.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "False") == "True"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0.01"))
+PROFILING_SLOW_REQUEST_MS = int(os.getenv("PROFILING_SLOW_REQUEST_MS", "500"))
+PROFILING_BUFFER_SIZE = 1000
+PROFILING_BATCH_SIZE = 50
+PROFILING_FLUSH_INTERVAL = 10
+
+# cProfile отдельного запроса по подписанному токену (см. ProfileCaptureMiddleware)
+PROFILING_CAPTURE_ENABLED = os.getenv("PROFILING_CAPTURE_ENABLED", "True") == "True"
+PROFILING_CAPTURE_DIR = os.getenv("PROFILING_CAPTURE_DIR", BASE_DIR / "profiles")
+PROFILING_CAPTURE_MAX_AGE = 60 * 60
+# Сколько последних профилей хранить, старые удаляются при сохранении нового
+PROFILING_CAPTURE_KEEP = int(os.getenv("PROFILING_CAPTURE_KEEP", "100"))
+
+# Логировать view, которые делают больше SQL-запросов, чем их query_budget
+QUERY_BUDGET_ENABLED = os.getenv("QUERY_BUDGET_ENABLED", "True") == "True"
+
 ROOT_URLCONF = "trackit.urls"
 
 TEMPLATES = [
@@ -78,6 +99,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "trackit.wsgi.application"
 
+# Сколько запросов ASGI-воркер одновременно пускает в Django: у каждого своё
+# подключение к базе, воркеры * предел должны помещаться в max_connections
+ASGI_MAX_CONCURRENCY = int(os.getenv("ASGI_MAX_CONCURRENCY", "20"))
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
@@ -132,7 +157,15 @@ CACHES = {
     }
 }
 
-CELERY_TASK_ALWAYS_EAGER = True
+# Сколько хранить надгробия удалённых объектов для /tasks/changes
+DELETION_LOG_RETENTION_DAYS = 30
+
+# Конфигурация Postgres для полнотекстового поиска по задачам
+SEARCH_CONFIG = os.getenv("SEARCH_CONFIG", "russian")
+
+# задачи выполняются сразу в процессе, который их ставит, без брокера;
+# тесты включают это в conftest.py
+CELERY_TASK_ALWAYS_EAGER = os.getenv("CELERY_TASK_ALWAYS_EAGER", "False") == "True"
 CELERY_TASK_EAGER_PROPAGATES = True
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_BACKEND", "redis://redis:6379/1")